@@ -5,6 +5,8 @@ import os
 import sys
 from pathlib import Path
 
+import pytest
+
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
@@ -15,6 +17,13 @@ load_env()
 from whats_eat.tools.RAG import process_places_data, query_similar_places_tool, RAGTools
 
 
+@pytest.fixture(autouse=True)
+def _isolated_ingest_queue(monkeypatch, tmp_path):
+    """Keep every test off the shared ~/.whats_eat ingest queue"""
+    monkeypatch.setenv("RAG_INGEST_QUEUE_PATH", str(tmp_path / "ingest_queue.sqlite3"))
+    monkeypatch.delenv("RAG_INGEST_RESUME", raising=False)
+
+
 def test_basic_normalization():
     """Test basic JSON loading and normalization without external services"""
     print("=" * 80)
@@ -162,6 +171,1021 @@ def test_query_similar_places():
         return None
 
 
+class _FakeDriver:
+    def __init__(self) -> None:
+        self.verified = 0
+        self.closed = False
+
+    def verify_connectivity(self) -> None:
+        self.verified += 1
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def _offline_rag_tools(monkeypatch) -> RAGTools:
+    """Build a RAGTools instance that never talks to external services."""
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("NEO4J_PASSWORD", "test-password")
+    return RAGTools()
+
+
+def test_connect_neo4j_reuses_pooled_driver(monkeypatch):
+    """Repeated connect_neo4j() calls share one driver until a reconnect is forced"""
+    import whats_eat.tools.RAG as rag_module
+
+    created = []
+
+    def fake_driver(uri, **kwargs):
+        created.append(kwargs)
+        return _FakeDriver()
+
+    monkeypatch.setattr(rag_module.GraphDatabase, "driver", fake_driver)
+    monkeypatch.setenv("NEO4J_MAX_POOL_SIZE", "7")
+    rag_tools = _offline_rag_tools(monkeypatch)
+
+    rag_tools.connect_neo4j()
+    first = rag_tools.neo4j_driver
+    rag_tools.connect_neo4j()
+    assert rag_tools.neo4j_driver is first
+    assert len(created) == 1
+    assert created[0]["max_connection_pool_size"] == 7
+
+    rag_tools.connect_neo4j(force=True)
+    assert first.closed
+    assert rag_tools.neo4j_driver is not first
+    assert len(created) == 2
+
+
+def test_with_neo4j_reconnects_once_on_connection_loss(monkeypatch):
+    """A dropped connection rebuilds the driver and retries the unit of work"""
+    import whats_eat.tools.RAG as rag_module
+    from neo4j.exceptions import ServiceUnavailable
+
+    monkeypatch.setattr(rag_module.GraphDatabase, "driver", lambda uri, **kwargs: _FakeDriver())
+    rag_tools = _offline_rag_tools(monkeypatch)
+    rag_tools.connect_neo4j()
+    stale = rag_tools.neo4j_driver
+    calls = []
+
+    def work(driver):
+        calls.append(driver)
+        if driver is stale:
+            raise ServiceUnavailable("connection reset")
+        return "ok"
+
+    assert rag_tools._with_neo4j(work) == "ok"
+    assert len(calls) == 2
+    assert calls[1] is not stale
+
+
+class _FakeIndex:
+    def __init__(self) -> None:
+        self.queries = []
+        self.upserts = []
+
+    def query(self, **kwargs):
+        self.queries.append(kwargs)
+        return {"matches": [{"id": "p1", "score": 0.9, "metadata": {"name": "Laksa House"}}]}
+
+    def upsert(self, vectors):
+        self.upserts.append(vectors)
+
+    def fetch(self, ids):
+        return {"vectors": {}}
+
+    def delete(self, ids):
+        self.deletes = getattr(self, "deletes", []) + [ids]
+
+
+def _rag_tools_with_fake_index(monkeypatch):
+    rag_tools = _offline_rag_tools(monkeypatch)
+    rag_tools._pinecone_index = _FakeIndex()
+    rag_tools._pinecone_new_sdk = True
+    rag_tools._index_dim = 3
+    embed_calls = []
+
+    def fake_embed_many(texts):
+        embed_calls.extend(texts)
+        return [[float(len(text)), 1.0, 0.5] for text in texts]
+
+    monkeypatch.setattr(rag_tools, "_embed_many", fake_embed_many)
+    return rag_tools, embed_calls
+
+
+def test_with_pinecone_retries_only_transient_errors(monkeypatch):
+    """Connection errors and 5xx reconnect once; client errors are raised without a retry"""
+    from pinecone.exceptions import PineconeApiException, ServiceException
+
+    rag_tools, _ = _rag_tools_with_fake_index(monkeypatch)
+    reconnects = []
+    monkeypatch.setattr(rag_tools, "connect_pinecone", lambda force=False: reconnects.append(force))
+
+    for error in (ConnectionError("reset"), ServiceException("unavailable", status_code=503)):
+        calls = []
+
+        def flaky(index, error=error, calls=calls):
+            calls.append(index)
+            if len(calls) == 1:
+                raise error
+            return "ok"
+
+        assert rag_tools._with_pinecone(flaky) == "ok"
+        assert len(calls) == 2
+
+    calls = []
+
+    def bad_request(index):
+        calls.append(index)
+        raise PineconeApiException("dimension mismatch", status_code=400)
+
+    with pytest.raises(PineconeApiException):
+        rag_tools._with_pinecone(bad_request)
+    assert len(calls) == 1
+    assert reconnects == [True, True]
+
+
+def test_repeat_queries_are_served_from_cache(monkeypatch):
+    """Same query text skips both the embedding call and the Pinecone query"""
+    rag_tools, embed_calls = _rag_tools_with_fake_index(monkeypatch)
+
+    first = rag_tools.query_similar_places("spicy laksa", top_k=3)
+    second = rag_tools.query_similar_places("spicy laksa", top_k=3)
+
+    assert first == second
+    assert first["matches"][0]["id"] == "p1"
+    assert embed_calls == ["spicy laksa"]
+    assert len(rag_tools._pinecone_index.queries) == 1
+
+    # A different top_k is a different result entry but reuses the embedding
+    rag_tools.query_similar_places("spicy laksa", top_k=5)
+    assert embed_calls == ["spicy laksa"]
+    assert len(rag_tools._pinecone_index.queries) == 2
+
+    # Callers mutating a result do not corrupt later cache hits
+    first["matches"][0]["score"] = -1.0
+    first["matches"].clear()
+    third = rag_tools.query_similar_places("  spicy laksa\n", top_k=3)
+    assert third == second and third["matches"][0]["score"] == 0.9
+    assert embed_calls == ["spicy laksa"]
+
+
+def test_upsert_invalidates_result_cache(monkeypatch):
+    """Writing new vectors forces the next query back to Pinecone"""
+    rag_tools, _ = _rag_tools_with_fake_index(monkeypatch)
+
+    rag_tools.query_similar_places("omakase", top_k=3)
+    rag_tools.create_embeddings({"place_id": "p2", "name": "Sushi Bar", "types": []})
+    rag_tools.query_similar_places("omakase", top_k=3)
+
+    assert len(rag_tools._pinecone_index.upserts) == 1
+    assert len(rag_tools._pinecone_index.queries) == 2
+
+
+def test_query_by_vector_skips_embedding_and_checks_dimension(monkeypatch):
+    """Precomputed vectors go straight to Pinecone; wrong dimensions are rejected"""
+    import whats_eat.tools.RAG as rag_module
+    from whats_eat.tools.RAG import query_similar_places_by_vector_tool
+
+    rag_tools, embed_calls = _rag_tools_with_fake_index(monkeypatch)
+    monkeypatch.setattr(rag_module, "_rag_tools_instance", rag_tools)
+
+    result = json.loads(query_similar_places_by_vector_tool.invoke({
+        "profile_embedding": [1.0, 0.0, 0.0],
+        "intent_embedding": [0.0, 1.0, 0.0],
+        "top_k": 2,
+    }))
+    assert result["matches"][0]["id"] == "p1"
+    assert embed_calls == []
+    sent = rag_tools._pinecone_index.queries[0]["vector"]
+    assert sent == pytest.approx([2 ** -0.5, 2 ** -0.5, 0.0])
+
+    bad = json.loads(query_similar_places_by_vector_tool.invoke({"embedding": [1.0, 2.0]}))
+    assert "dimension 2" in bad["error"]
+    assert len(rag_tools._pinecone_index.queries) == 1
+
+
+def test_place_metadata_carries_geo_and_attribute_fields():
+    """Upserted metadata includes coordinates, geohash prefixes, price rank, types and city"""
+    from whats_eat.tools.geo import geohash_encode
+    from whats_eat.tools.RAG import _place_metadata
+
+    rag_tools = RAGTools.__new__(RAGTools)
+    place = rag_tools._normalize_place({
+        "id": "abc",
+        "displayName": {"text": "Eem"},
+        "formattedAddress": "3808 N Williams Ave, Portland, OR 97227, USA",
+        "location": {"latitude": 45.5506551, "longitude": -122.6665212},
+        "priceLevel": "PRICE_LEVEL_MODERATE",
+        "types": ["thai_restaurant", "bar"],
+        "addressComponents": [{"longText": "Portland", "types": ["locality", "political"]}],
+    })
+    metadata = _place_metadata(place)
+
+    assert geohash_encode(57.64911, 10.40744, precision=11) == "u4pruydqqvj"
+    assert metadata["place_id"] == "abc"
+    assert metadata["price_level"] == 2
+    assert metadata["city"] == "portland"
+    assert metadata["types"] == ["thai_restaurant", "bar"]
+    assert metadata["geohash"].startswith("c20g0")
+    assert metadata["geohash_prefixes"] == ["c20", "c20g", "c20g0", "c20g0s"]
+    assert None not in metadata.values()
+
+
+def test_build_place_filter_scopes_candidates():
+    """Filter options compile into a single Pinecone metadata filter"""
+    from whats_eat.tools.RAG import build_place_filter
+
+    assert build_place_filter() is None
+    assert build_place_filter(place_ids=["a", "b"]) == {"place_id": {"$in": ["a", "b"]}}
+    assert build_place_filter(geohash_prefix="C20F") == {"geohash_prefixes": {"$in": ["c20f"]}}
+
+    combined = build_place_filter(geohash_prefix="c2", max_price="PRICE_LEVEL_MODERATE", city="Portland")
+    clauses = combined["$and"]
+    assert {"price_level": {"$lte": 2}} in clauses
+    assert {"city": {"$eq": "portland"}} in clauses
+    lat_clause = next(c["lat"] for c in clauses if "lat" in c)
+    assert lat_clause["$gte"] < 45.55 < lat_clause["$lte"]
+
+    with pytest.raises(ValueError):
+        build_place_filter(max_price="PRICE_LEVEL_CHEAP")
+
+
+def test_filtered_query_is_sent_to_pinecone(monkeypatch):
+    """The tool forwards the candidate allow-list as a metadata filter"""
+    import whats_eat.tools.RAG as rag_module
+
+    rag_tools, _ = _rag_tools_with_fake_index(monkeypatch)
+    monkeypatch.setattr(rag_module, "_rag_tools_instance", rag_tools)
+
+    query_similar_places_tool.invoke({"query_text": "thai", "place_ids": ["p1", "p2"]})
+    sent = rag_tools._pinecone_index.queries[-1]
+    assert sent["filter"] == {"place_id": {"$in": ["p1", "p2"]}}
+
+
+def test_bm25_and_reciprocal_rank_fusion(tmp_path):
+    """BM25 finds exact dish names; RRF rewards ids ranked well by both lists"""
+    from whats_eat.tools.lexical import BM25Index, reciprocal_rank_fusion
+
+    index = BM25Index()
+    index.add("a", "Sungei Road Laksa. Reviews: the best laksa, rich coconut broth", {"city": "singapore"})
+    index.add("b", "Tonkotsu Ramen Bar. Reviews: creamy broth")
+    index.add("c", "Omakase Hibiki. Types: japanese_restaurant")
+
+    assert [doc for doc, _ in index.search("laksa")] == ["a"]
+    assert index.search("broth", predicate=lambda _id, md: md.get("city") == "singapore")[0][0] == "a"
+
+    index.add("a", "Renamed Noodle House")
+    assert index.search("laksa") == []
+
+    path = tmp_path / "bm25.json"
+    index.save(str(path))
+    assert BM25Index.load(str(path)).search("omakase")[0][0] == "c"
+
+    fused = reciprocal_rank_fusion([["x", "y", "z"], ["y", "w"]])
+    assert fused[0][0] == "y"
+
+
+def test_hybrid_query_surfaces_lexical_only_matches(monkeypatch):
+    """A place missed by the vector side still comes back through BM25"""
+    rag_tools, _ = _rag_tools_with_fake_index(monkeypatch)
+    rag_tools.create_embeddings({"place_id": "p9", "name": "Katong Laksa", "types": ["malaysian_restaurant"]})
+
+    results = rag_tools.hybrid_query("laksa", top_k=5)
+    ids = [m["id"] for m in results["matches"]]
+
+    assert set(ids) == {"p1", "p9"}
+    lexical_only = next(m for m in results["matches"] if m["id"] == "p9")
+    assert lexical_only["bm25_score"] > 0
+    assert "score" not in lexical_only
+    assert all("fused_score" in m for m in results["matches"])
+
+
+def test_iter_json_items_streams_results_and_lists(tmp_path):
+    """Items are decoded incrementally even when they straddle read chunks"""
+    from whats_eat.tools.json_stream import iter_json_items
+
+    places = [{"id": f"id{i}", "displayName": {"text": f"Place {i}"}, "rating": 4.5} for i in range(50)]
+    wrapped = tmp_path / "wrapped.json"
+    wrapped.write_text(json.dumps({"status": "OK", "meta": {"n": [1, 2]}, "results": places, "tail": 1}))
+    plain = tmp_path / "plain.json"
+    plain.write_text(json.dumps([1234567, "x", {"a": [1, {"b": None}]}]))
+
+    assert list(iter_json_items(str(wrapped), chunk_size=7)) == places
+    assert list(iter_json_items(str(plain), chunk_size=3)) == [1234567, "x", {"a": [1, {"b": None}]}]
+
+
+def test_iter_json_items_numbers_split_across_chunks(tmp_path):
+    """A bare number cut at a chunk boundary is read to its end before it is accepted"""
+    from whats_eat.tools.json_stream import iter_json_items
+
+    items = [1.5, 2.25, {"a": 1}, -0.125, 3e-7, 12345, True, None]
+    numbers = tmp_path / "numbers.json"
+    numbers.write_text(json.dumps(items))
+    for chunk_size in range(1, 12):
+        assert list(iter_json_items(str(numbers), chunk_size=chunk_size)) == items
+    spaced = tmp_path / "spaced.json"
+    spaced.write_text("[1.5, 2.25, {\"a\":1}]")
+    assert list(iter_json_items(str(spaced), chunk_size=2)) == [1.5, 2.25, {"a": 1}]
+
+
+def test_iter_json_items_malformed_value_stops_reading_early(monkeypatch, tmp_path):
+    """A bad byte early in a dump fails once the buffer passes max_item_size, not at end of file"""
+    import io
+
+    import whats_eat.tools.json_stream as json_stream
+
+    text = "[{\"a\": 1}, {\"a\": x}, " + ", ".join(["{\"a\": 1}"] * 5000) + "]"
+    broken = tmp_path / "broken.json"
+    broken.write_text(text)
+    read = []
+
+    class CountingFile(io.StringIO):
+        def read(self, size=-1):
+            chunk = super().read(size)
+            read.append(len(chunk))
+            return chunk
+
+    monkeypatch.setattr(json_stream, "open", lambda *a, **kw: CountingFile(text), raising=False)
+    items = json_stream.iter_json_items(str(broken), chunk_size=16, max_item_size=256)
+    assert next(items) == {"a": 1}
+    with pytest.raises(ValueError, match="Malformed JSON"):
+        next(items)
+    assert sum(read) < 512 < len(text)
+
+
+def test_streamed_ingestion_writes_in_batches(monkeypatch, tmp_path):
+    """Streaming mode flushes bounded batches to the KG and vector writers"""
+    import whats_eat.tools.RAG as rag_module
+
+    rag_tools = RAGTools.__new__(RAGTools)
+    kg_batches, vec_batches = [], []
+    monkeypatch.setattr(rag_tools, "connect_neo4j", lambda: None, raising=False)
+    monkeypatch.setattr(rag_tools, "connect_pinecone", lambda: None, raising=False)
+    monkeypatch.setattr(rag_tools, "save_local_indexes", lambda: None, raising=False)
+    monkeypatch.setattr(rag_tools, "create_knowledge_graph_batch", kg_batches.append, raising=False)
+    monkeypatch.setattr(rag_tools, "create_embeddings_batch", vec_batches.append, raising=False)
+    monkeypatch.setattr(rag_module, "_rag_tools_instance", rag_tools)
+    monkeypatch.setenv("RAG_INGEST_BATCH_SIZE", "4")
+
+    path = tmp_path / "dump.json"
+    path.write_text(json.dumps({"results": [
+        {"id": f"id{i}", "displayName": {"text": f"Place {i}"}} for i in range(10)
+    ] + [{"bogus": True}]}))
+
+    summary = json.loads(process_places_data.invoke({"json_file_path": str(path), "stream": True}))
+
+    assert summary["streamed"] is True
+    assert summary["seen"] == 11
+    assert summary["normalized"] == 10
+    assert [len(b) for b in kg_batches] == [4, 4, 2]
+    assert kg_batches == vec_batches
+    assert len(summary["sample"]) == 5
+
+
+def test_backfill_resumes_from_checkpoint(monkeypatch, tmp_path):
+    """A partially checkpointed dump only re-ingests the items after the last batch"""
+    import whats_eat.tools.RAG as rag_module
+    from whats_eat.tools.backfill import _checkpoint_path, _save_checkpoint, backfill_file, load_checkpoint
+    from whats_eat.tools.lexical import BM25Index
+
+    dump = tmp_path / "dump.json"
+    items = [{"id": f"id{i}", "displayName": {"text": f"P{i}"}} for i in range(12)]
+    # A slice of the gap with nothing to normalize must not end the rebuild
+    items[5] = "not a place"
+    dump.write_text(json.dumps(items))
+    ckpt_dir = tmp_path / "ckpt"
+    ckpt_dir.mkdir()
+
+    # Written up to item 8, but the partial indexes were last saved at item 5
+    checkpoint = load_checkpoint(ckpt_dir, dump)
+    checkpoint.update(items_done=8, indexed_items=5, places=8)
+    _save_checkpoint(ckpt_dir, dump, checkpoint)
+
+    # A dry run needs no RAG tools (no API keys) and does not move the checkpoint
+    monkeypatch.setattr(rag_module, "_get_rag_tools", lambda **kwargs: pytest.fail("dry run built RAGTools"))
+    result = backfill_file(str(dump), str(ckpt_dir), batch_size=3, dry_run=True)
+    assert result["places"] == 4
+    assert load_checkpoint(ckpt_dir, dump)["items_done"] == 8
+
+    rag_tools = _offline_rag_tools(monkeypatch)
+    built = []
+    monkeypatch.setattr(rag_module, "_get_rag_tools", lambda **kwargs: (built.append(kwargs), rag_tools)[1])
+    monkeypatch.setattr(rag_tools, "connect_neo4j", lambda force=False: None)
+    monkeypatch.setattr(rag_tools, "connect_pinecone", lambda force=False: None)
+    monkeypatch.setattr(rag_tools, "create_knowledge_graph_batch", lambda places: None)
+    written = []
+
+    def write_vectors(places):
+        written.extend(p["place_id"] for p in places)
+        rag_tools.index_places_locally(places)
+
+    monkeypatch.setattr(rag_tools, "create_embeddings_batch", write_vectors)
+    saves = []
+    save = rag_tools.save_local_indexes
+    monkeypatch.setattr(rag_tools, "save_local_indexes", lambda: (saves.append(1), save()))
+
+    result = backfill_file(str(dump), str(ckpt_dir), batch_size=1, save_every=2)
+    assert result["places"] == 4
+    assert written == ["id8", "id9", "id10", "id11"]
+    # Gap rebuild, every second batch, and the end of the file
+    assert len(saves) == 4
+    assert built == [{"resume_ingestion": False}]
+    final = load_checkpoint(ckpt_dir, dump)
+    assert final["complete"] and final["items_done"] == 12 and final["indexed_items"] == 12
+    assert final["places"] == 12
+    partial = BM25Index.load(str(_checkpoint_path(ckpt_dir, dump).with_suffix(".bm25.json")))
+    assert {f"id{i}" for i in range(6, 12)} == {doc for doc in (f"id{i}" for i in range(12)) if doc in partial}
+
+    again = backfill_file(str(dump), str(ckpt_dir), batch_size=3)
+    assert again["skipped"] is True
+
+
+def test_background_ingestion_returns_before_writes(monkeypatch, tmp_path):
+    """Background mode returns normalized places at once; the worker drains the durable queue"""
+    import threading
+    import whats_eat.tools.RAG as rag_module
+    from whats_eat.tools.ingest_queue import IngestQueue
+
+    monkeypatch.setenv("RAG_INGEST_QUEUE_PATH", str(tmp_path / "queue.sqlite3"))
+    rag_tools = _offline_rag_tools(monkeypatch)
+    monkeypatch.setattr(rag_module, "_rag_tools_instance", rag_tools)
+    release = threading.Event()
+    written = []
+
+    def slow_write(places):
+        release.wait(5)
+        written.extend(p["place_id"] for p in places)
+
+    monkeypatch.setattr(rag_tools, "write_batch", slow_write)
+    payload = json.dumps([{"id": f"id{i}", "displayName": {"text": f"P{i}"}} for i in range(3)])
+
+    result = json.loads(process_places_data.invoke({"json_file_path": payload, "background": True}))
+
+    assert [p["place_id"] for p in result] == ["id0", "id1", "id2"]
+    assert written == []
+    assert rag_tools.ingestion_status()["pending"] == 1
+
+    release.set()
+    assert rag_tools._ingest_worker.wait_idle(timeout=5)
+    assert written == ["id0", "id1", "id2"]
+    assert rag_tools.ingestion_status()["pending"] == 0
+    rag_tools.close()
+
+    # Failed batches are retried later and eventually parked as dead
+    queue = IngestQueue(str(tmp_path / "retry.sqlite3"), max_attempts=2)
+    batch_id = queue.put([{"place_id": "x"}])
+    queue.nack(batch_id, "boom", backoff_base=0.0)
+    assert queue.next_ready()[2] == 1
+    queue.nack(batch_id, "boom", backoff_base=0.0)
+    assert queue.depth() == {"pending": 0, "inflight": 0, "dead": 1}
+    queue.close()
+
+
+def test_pending_batches_resume_after_restart(monkeypatch, tmp_path):
+    """Batches left by a previous process are reported, and drained once resume is asked for"""
+    import whats_eat.tools.RAG as rag_module
+    from whats_eat.tools.ingest_queue import IngestQueue
+
+    path = str(tmp_path / "queue.sqlite3")
+    queue = IngestQueue(path)
+    queue.put([{"place_id": "left-behind"}])
+    queue.close()
+
+    written = []
+
+    def fake_write(self, places):
+        written.extend(place["place_id"] for place in places)
+
+    monkeypatch.setattr(RAGTools, "write_batch", fake_write)
+    monkeypatch.setenv("RAG_INGEST_QUEUE_PATH", path)
+    rag_tools = _offline_rag_tools(monkeypatch)
+    assert rag_tools._ingest_worker is None  # constructing the tools never starts a writer
+    assert rag_tools.ingestion_status() == {"pending": 1, "inflight": 0, "dead": 0}
+    assert rag_tools.resume_ingestion() == 1
+    assert rag_tools._ingest_worker.wait_idle(timeout=5)
+    assert written == ["left-behind"]
+    assert rag_tools.ingestion_status() == {"pending": 0, "inflight": 0, "dead": 0}
+    rag_tools.close()
+
+    # The shared tools resume only when RAG_INGEST_RESUME opts in, and never for backfill workers
+    queue = IngestQueue(path)
+    queue.put([{"place_id": "second-run"}])
+    queue.close()
+    monkeypatch.setattr(rag_module.atexit, "register", lambda fn: fn)
+    for env, resume, starts in (("0", True, False), ("1", False, False), ("1", True, True)):
+        monkeypatch.setenv("RAG_INGEST_RESUME", env)
+        monkeypatch.setattr(rag_module, "_rag_tools_instance", None)
+        shared = rag_module._get_rag_tools(resume_ingestion=resume)
+        assert (shared._ingest_worker is not None) == starts
+        if starts:
+            assert shared._ingest_worker.wait_idle(timeout=5)
+        shared.close()
+    assert written == ["left-behind", "second-run"]
+
+    # No queue file: nothing is created or started until the first enqueue
+    monkeypatch.setenv("RAG_INGEST_QUEUE_PATH", str(tmp_path / "fresh.sqlite3"))
+    fresh = _offline_rag_tools(monkeypatch)
+    assert fresh.resume_ingestion() == 0 and fresh._ingest_worker is None
+    assert fresh.ingestion_status() == {"pending": 0, "inflight": 0, "dead": 0}
+    assert not (tmp_path / "fresh.sqlite3").exists()
+
+
+def test_background_writes_save_local_indexes_when_due_or_drained(monkeypatch, tmp_path):
+    """The BM25 index is not rewritten per batch, only after its interval or once the queue drains"""
+    from whats_eat.tools.lexical import BM25Index
+
+    monkeypatch.setenv("RAG_LEXICAL_INDEX_PATH", str(tmp_path / "bm25.json"))
+    monkeypatch.setenv("RAG_LEXICAL_INDEX_SAVE_INTERVAL", "3600")
+    rag_tools = _offline_rag_tools(monkeypatch)
+    saves = []
+    original_save = rag_tools._lexical_index.save
+
+    def counting_save(path):
+        saves.append(path)
+        original_save(path)
+
+    monkeypatch.setattr(rag_tools._lexical_index, "save", counting_save)
+
+    def write_batch(places):
+        rag_tools.index_places_locally(places)
+        rag_tools.save_local_indexes(force=False)
+
+    monkeypatch.setattr(rag_tools, "write_batch", write_batch)
+    rag_tools.index_places_locally([{"place_id": "p0", "name": "Laksa House"}])
+    rag_tools.save_local_indexes(force=False)
+    assert saves == []
+
+    queue = rag_tools._open_ingest_queue(create=True)
+    for i in range(1, 6):
+        queue.put([{"place_id": f"p{i}", "name": f"Place {i}"}])
+    assert rag_tools.resume_ingestion() == 5
+    assert rag_tools._ingest_worker.wait_idle(timeout=5)
+    assert len(saves) == 1  # once, when the five batches were drained
+    assert len(BM25Index.load(str(tmp_path / "bm25.json"))) == 6
+    rag_tools.close()
+
+
+def test_queue_leases_each_batch_to_one_worker(tmp_path):
+    """Workers sharing a queue file never take the same batch; expired leases are retried"""
+    import threading
+    import time
+    from whats_eat.tools.ingest_queue import IngestQueue, IngestWorker
+
+    path = str(tmp_path / "queue.sqlite3")
+    first, second = IngestQueue(path, lease_seconds=0.2), IngestQueue(path, lease_seconds=0.2)
+    batch_id = first.put([{"place_id": "p0"}])
+    assert first.claim()[0] == batch_id
+    assert second.claim() is None and second.next_ready() is None
+    assert second.depth() == {"pending": 0, "inflight": 1, "dead": 0}
+    time.sleep(0.25)  # the first writer died without acking
+    assert second.claim()[0] == batch_id
+    second.ack(batch_id)
+
+    # Two workers on separate connections, as in two processes, drain a shared queue
+    for i in range(1, 41):
+        first.put([{"place_id": f"p{i}"}])
+    written, lock = [], threading.Lock()
+
+    def write(places):
+        with lock:
+            written.extend(p["place_id"] for p in places)
+
+    workers = [IngestWorker(q, write, poll_interval=0.01) for q in (first, second)]
+    for worker in workers:
+        worker.start()
+    assert all(worker.wait_idle(timeout=10) for worker in workers)
+    assert sorted(written) == sorted(f"p{i}" for i in range(1, 41))
+    first.close()
+    second.close()
+
+
+def test_queue_close_waits_for_worker_before_closing_connection(tmp_path):
+    """A worker still writing when the queue closes acks its batch, then closes the queue"""
+    import threading
+    from whats_eat.tools.ingest_queue import IngestQueue, IngestWorker
+
+    path = str(tmp_path / "queue.sqlite3")
+    queue = IngestQueue(path)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_write(places):
+        started.set()
+        release.wait(5)
+
+    worker = IngestWorker(queue, slow_write, poll_interval=0.01)
+    worker.start()
+    queue.put([{"place_id": "p1"}])
+    worker.notify()
+    assert started.wait(5)
+
+    queue.close(timeout=0.05)  # the worker is mid-write and keeps the connection
+    assert not queue._closed
+    release.set()
+    worker._thread.join(5)
+    assert queue._closed
+    reopened = IngestQueue(path)
+    assert reopened.depth() == {"pending": 0, "inflight": 0, "dead": 0}
+    reopened.close()
+
+
+class _FakeRecord:
+    def __init__(self, row) -> None:
+        self._row = row
+
+    def data(self):
+        return dict(self._row)
+
+
+class _FakeSession:
+    def __init__(self, driver, access_mode=None) -> None:
+        self.driver = driver
+        self.access_mode = access_mode
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query, params=None):
+        self.driver.queries.append((query, params))
+        return [_FakeRecord(row) for row in self.driver.rows]
+
+    def execute_read(self, work):
+        self.driver.transactions.append(("read", self.access_mode))
+        return work(self)
+
+    def execute_write(self, work):
+        self.driver.transactions.append(("write", self.access_mode))
+        return work(self)
+
+
+class _FakeGraphDriver(_FakeDriver):
+    def __init__(self, rows) -> None:
+        super().__init__()
+        self.rows = rows
+        self.queries = []
+        self.transactions = []
+
+    def session(self, **kwargs):
+        return _FakeSession(self, kwargs.get("default_access_mode"))
+
+
+def test_graph_expansion_scores_relations_in_one_round_trip(monkeypatch):
+    """Rows from the expansion query are merged per place, weighted and cached"""
+    rows = [
+        {"place_id": "n1", "name": "Noodle One", "address": "", "rating": 4.1, "reason": "shared_type", "strength": 2},
+        {"place_id": "n1", "name": "Noodle One", "address": "", "rating": 4.1, "reason": "nearby", "strength": 1},
+        {"place_id": "n2", "name": "Fan Favourite", "address": "", "rating": 4.6, "reason": "shared_reviewer", "strength": 3},
+    ]
+    rag_tools = _offline_rag_tools(monkeypatch)
+    driver = _FakeGraphDriver(rows)
+    rag_tools.neo4j_driver = driver
+    rag_tools._neo4j_checked_at = float("inf")
+
+    related = rag_tools.expand_from_graph(["seed2", "seed1", "seed1"], limit=5)
+
+    assert [r["place_id"] for r in related] == ["n2", "n1"]
+    assert related[0]["graph_score"] == 6.0
+    assert related[1]["reasons"] == {"shared_type": 2, "nearby": 1}
+    assert len(driver.queries) == 1
+    assert driver.queries[0][1]["seed_ids"] == ["seed1", "seed2"]
+
+    rag_tools.expand_from_graph(["seed1", "seed2"], limit=5)
+    assert len(driver.queries) == 1
+
+    rag_tools.create_knowledge_graph_batch([{"place_id": "p", "name": "P", "types": ["cafe"]}])
+    rag_tools.expand_from_graph(["seed1", "seed2"], limit=5)
+    assert sum("UNWIND $seed_ids" in q for q, _ in driver.queries) == 2
+
+
+def test_chunked_mode_embeds_reviews_and_pools_per_place(monkeypatch):
+    """Reviews become child vectors; one query returns one pooled match per place"""
+    rag_tools, embed_calls = _rag_tools_with_fake_index(monkeypatch)
+    rag_tools.embedding_mode = "chunked"
+    rag_tools.review_chunk_chars = 20
+    place = {
+        "place_id": "p1", "name": "Laksa House", "types": ["restaurant"],
+        "reviews": [{"text": "rich coconut broth and great prawns"}, {"text": "slow service"}],
+    }
+    rag_tools.create_embeddings_batch([place])
+
+    ids = [r["id"] for r in rag_tools._pinecone_index.upserts[0]]
+    assert ids == ["p1", "p1#r0", "p1#r1", "p1#r2"]
+    assert "Reviews" not in embed_calls[0]
+    assert embed_calls[1].startswith("Laksa House: ")
+    child = rag_tools._pinecone_index.upserts[0][1]["metadata"]
+    assert child["place_id"] == "p1" and child["kind"] == "review" and child["chunk"] == 0
+    assert rag_tools._pinecone_index.upserts[0][0]["metadata"]["review_chunks"] == 3
+
+    hits = [
+        {"id": "p1#r0", "score": 0.9, "metadata": {"place_id": "p1", "kind": "review", "chunk": 0}},
+        {"id": "p2", "score": 0.8, "metadata": {"place_id": "p2", "name": "Curry Bar"}},
+        {"id": "p1", "score": 0.5, "metadata": {"place_id": "p1", "name": "Laksa House"}},
+    ]
+    monkeypatch.setattr(rag_tools._pinecone_index, "query", lambda **kw: {"matches": hits})
+    result = rag_tools.query_by_vector([1.0, 0.0, 0.0], top_k=2)
+    assert [m["id"] for m in result["matches"]] == ["p1", "p2"]
+    assert result["matches"][0]["score"] == 0.9
+    assert result["matches"][0]["chunk_hits"] == 2
+    assert result["matches"][0]["metadata"] == {"place_id": "p1", "name": "Laksa House"}
+
+    mean = rag_tools.query_by_vector([1.0, 0.0, 0.0], top_k=2, pooling="mean")
+    assert [m["id"] for m in mean["matches"]] == ["p2", "p1"]
+
+
+class _MemoryIndex(_FakeIndex):
+    """In-memory Pinecone stand-in with namespaces and cosine-ranked queries"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.stored = {}
+
+    def upsert(self, vectors, namespace=""):
+        self.upserts.append((namespace, vectors))
+        for v in vectors:
+            self.stored.setdefault(namespace, {})[v["id"]] = v
+
+    def query(self, vector, top_k, namespace="", **kwargs):
+        import numpy as np
+
+        self.queries.append(namespace)
+        q = np.asarray(vector) / np.linalg.norm(vector)
+        scored = [
+            {"id": v["id"], "score": float(np.dot(q, v["values"]) / np.linalg.norm(v["values"])),
+             "metadata": v["metadata"]}
+            for v in self.stored.get(namespace, {}).values()
+        ]
+        return {"matches": sorted(scored, key=lambda m: m["score"], reverse=True)[:top_k]}
+
+    def list(self, namespace="", limit=100):
+        yield list(self.stored.get(namespace, {}))
+
+    def fetch(self, ids, namespace=""):
+        stored = self.stored.get(namespace, {})
+        return {"vectors": {i: stored[i] for i in ids if i in stored}}
+
+    def delete(self, ids, namespace=""):
+        for i in ids:
+            self.stored.get(namespace, {}).pop(i, None)
+
+    def describe_index_stats(self):
+        return {"namespaces": {ns: {} for ns in self.stored}}
+
+
+def test_chunked_rewrite_deletes_only_chunks_past_new_count(monkeypatch):
+    """Re-writing a place removes exactly the chunks its previous, longer review set left"""
+    from whats_eat.tools.RAG import MAX_REVIEW_CHUNKS
+
+    rag_tools, _ = _rag_tools_with_fake_index(monkeypatch)
+    rag_tools._pinecone_index = index = _MemoryIndex()
+    rag_tools.embedding_mode = "chunked"
+    rag_tools.review_chunk_chars = 20
+    deletes = []
+    original_delete = index.delete
+
+    def recording_delete(ids, **kwargs):
+        deletes.append(list(ids))
+        original_delete(ids, **kwargs)
+
+    monkeypatch.setattr(index, "delete", recording_delete)
+    reviews = [{"text": "rich coconut broth"}, {"text": "great prawns"}, {"text": "slow service"}]
+    place = {"place_id": "p1", "name": "Laksa House", "reviews": reviews}
+
+    rag_tools.create_embeddings_batch([place])
+    assert deletes == [] and sorted(index.stored[""]) == ["p1", "p1#r0", "p1#r1", "p1#r2"]
+
+    rag_tools.create_embeddings_batch([{**place, "reviews": reviews[:1]}])
+    assert deletes == [["p1#r1", "p1#r2"]]
+    assert sorted(index.stored[""]) == ["p1", "p1#r0"]
+    assert index.stored[""]["p1"]["metadata"]["review_chunks"] == 1
+
+    # Parents written before chunk counts were recorded fall back to the full id range
+    del index.stored[""]["p1"]["metadata"]["review_chunks"]
+    deletes.clear()
+    rag_tools.create_embeddings_batch([place])
+    assert deletes == [[f"p1#r{n}" for n in range(3, MAX_REVIEW_CHUNKS)]]
+
+
+def test_writes_are_split_into_request_sized_batches(monkeypatch):
+    """Large batches go out as upserts of at most 100 records and deletes of at most 1000 ids"""
+    from whats_eat.tools.RAG import DELETE_BATCH_SIZE, MAX_REVIEW_CHUNKS, UPSERT_BATCH_SIZE
+
+    rag_tools, _ = _rag_tools_with_fake_index(monkeypatch)
+    rag_tools._pinecone_index = index = _MemoryIndex()
+    places = [{"place_id": f"p{i}", "name": f"Place {i}"} for i in range(250)]
+    rag_tools.create_embeddings_batch(places)
+    assert [len(vectors) for _, vectors in index.upserts] == [100, 100, 50]
+    assert max(len(vectors) for _, vectors in index.upserts) <= UPSERT_BATCH_SIZE
+
+    # Legacy parents without a chunk count: every place's chunk ids are cleared, in slices
+    rag_tools.embedding_mode = "chunked"
+    deletes = []
+    monkeypatch.setattr(index, "delete", lambda ids, **kw: deletes.append(len(ids)))
+    rag_tools.create_embeddings_batch(places)
+    assert sum(deletes) == 250 * MAX_REVIEW_CHUNKS
+    assert max(deletes) <= DELETE_BATCH_SIZE
+
+
+def test_namespace_router_and_routed_queries(monkeypatch):
+    """Vectors land in their geohash namespace; located queries only search nearby ones"""
+    from whats_eat.tools.namespaces import NamespaceRouter, migrate_to_namespaces
+
+    router = NamespaceRouter(mode="geohash", geohash_precision=3, prefix="test")
+    assert router.namespace_for_metadata({"geohash": "w21z7abcd"}) == "test-gh-w21"
+    assert router.namespace_for_metadata({}) == "test"
+    assert router.route(geohash_prefix="w21z") == ["test", "test-gh-w21"]
+    assert router.route(bbox=(1.29, 103.84, 1.31, 103.86)) == ["test", "test-gh-w21"]
+    assert router.route() is None
+    assert NamespaceRouter(mode="region").route(region="SG") == ["", "cc-sg"]
+
+    rag_tools, _ = _rag_tools_with_fake_index(monkeypatch)
+    rag_tools._pinecone_index = index = _MemoryIndex()
+    sg = {"place_id": "sg1", "name": "Laksa House", "location": {"lat": 1.3, "lng": 103.85}}
+    tokyo = {"place_id": "tk1", "name": "Ramen Bar", "location": {"lat": 35.68, "lng": 139.76}}
+    rag_tools.create_embeddings_batch([sg, tokyo])
+    assert sorted(index.stored) == [""]
+
+    # Turn routing on and move the existing vectors
+    rag_tools.namespace_router = NamespaceRouter(mode="geohash", geohash_precision=3)
+    stats = migrate_to_namespaces(rag_tools)
+    assert stats["moved"] == 2
+    assert sorted(ns for ns, vectors in index.stored.items() if vectors) == ["gh-w21", "gh-xn7"]
+
+    index.queries.clear()
+    result = rag_tools.query_by_vector(
+        [1.0, 0.0, 0.0], top_k=5, namespaces=rag_tools.namespace_router.route(geohash_prefix="w21")
+    )
+    assert [m["id"] for m in result["matches"]] == ["sg1"]
+    assert sorted(index.queries) == ["", "gh-w21"]
+
+    # An unscoped search queries every namespace at once rather than one after another
+    import threading
+
+    all_waiting = threading.Barrier(len(rag_tools.list_namespaces()), timeout=5)
+    original_query = index.query
+
+    def concurrent_query(**kwargs):
+        all_waiting.wait()
+        return original_query(**kwargs)
+
+    monkeypatch.setattr(index, "query", concurrent_query)
+    everywhere = rag_tools.query_by_vector([0.0, 1.0, 0.0], top_k=5)
+    assert sorted(m["id"] for m in everywhere["matches"]) == ["sg1", "tk1"]
+    rag_tools.close()
+
+
+def test_encoded_vector_formats_round_trip():
+    """float16/int8 codes are smaller than float32 and decode back to the original values"""
+    import numpy as np
+    from whats_eat.tools.vector_store import decode_vector, encode_vector
+
+    vec = [0.5, -0.25, 0.125, 0.0]
+    assert decode_vector(encode_vector(vec, "float32")) == vec
+    assert decode_vector(encode_vector(vec, "float16")) == vec
+    assert np.allclose(decode_vector(encode_vector(vec, "int8")), vec, atol=0.005)
+
+    rng = np.random.default_rng(1)
+    embedding = rng.standard_normal(1536).tolist()
+    sizes = {fmt: encode_vector(embedding, fmt).nbytes for fmt in ("float32", "float16", "int8")}
+    assert sizes == {"float32": 1536 * 4, "float16": 1536 * 2, "int8": 1536 + 4}
+    with pytest.raises(ValueError):
+        encode_vector(vec, "float64")
+
+
+def test_two_stage_search_rescores_shortlist_at_full_dimension(monkeypatch):
+    """Truncated vectors go to the first-stage index; results carry full-dimension scores"""
+    import numpy as np
+    from whats_eat.tools.vector_store import recall_at_k, truncate_embedding
+
+    rng = np.random.default_rng(3)
+    vectors = {f"p{i}": rng.standard_normal(8).tolist() for i in range(40)}
+
+    rag_tools = _offline_rag_tools(monkeypatch)
+    rag_tools._pinecone_index = full_index = _MemoryIndex()
+    rag_tools._first_stage_index = short_index = _MemoryIndex()
+    rag_tools._pinecone_new_sdk = True
+    rag_tools._index_dim = 8
+    rag_tools.first_stage_dim = 4
+    monkeypatch.setattr(rag_tools, "_embed_many", lambda texts: [vectors[t] for t in texts])
+    monkeypatch.setattr(rag_tools, "_text_representation", lambda place, include_reviews=True: place["place_id"])
+    rag_tools.create_embeddings_batch([{"place_id": pid, "name": pid} for pid in vectors])
+
+    assert len(short_index.stored[""]["p0"]["values"]) == 4
+    assert np.isclose(np.linalg.norm(short_index.stored[""]["p0"]["values"]), 1.0)
+    assert np.allclose(truncate_embedding([3.0, 4.0, 12.0], 2), [0.6, 0.8])
+
+    query = vectors["p5"]
+    full = rag_tools.query_by_vector(query, top_k=5)
+    assert short_index.queries == []  # writing the first-stage index does not switch queries to it
+    staged = rag_tools.query_by_vector(query, top_k=5, two_stage=True, shortlist_factor=8)
+    assert staged["matches"][0]["id"] == "p5"
+    assert np.isclose(staged["matches"][0]["score"], 1.0)
+    assert recall_at_k([m["id"] for m in full["matches"]], [m["id"] for m in staged["matches"]], 5) == 1.0
+
+    report = rag_tools.evaluate_two_stage([vectors["p1"], vectors["p2"]], top_k=3, shortlist_factor=8)
+    assert report["recall_at_k"] == 1.0
+    assert report["first_stage_dim"] == 4
+    assert (report["full_round_trips"], report["two_stage_round_trips"]) == (1.0, 2.0)
+
+
+def test_place_embeddings_served_from_cache_then_index(monkeypatch):
+    """Vectors written by this process are cached; others are fetched from the index once"""
+    rag_tools = _offline_rag_tools(monkeypatch)
+    rag_tools._pinecone_index = index = _MemoryIndex()
+    rag_tools._pinecone_new_sdk = True
+    monkeypatch.setattr(rag_tools, "_embed_many", lambda texts: [[1.0, 0.0, 0.0] for _ in texts])
+    rag_tools.create_embeddings_batch([{"place_id": "cached", "name": "Cached"}])
+    index.stored[""]["remote"] = {"id": "remote", "values": [0.0, 1.0, 0.0], "metadata": {}}
+
+    fetches = []
+    original_fetch = index.fetch
+    monkeypatch.setattr(index, "fetch", lambda ids, **kw: fetches.append(list(ids)) or original_fetch(ids, **kw))
+
+    found = rag_tools.place_embeddings(["cached", "remote", "unknown", "remote"])
+    assert found == {"cached": [1.0, 0.0, 0.0], "remote": [0.0, 1.0, 0.0]}
+    assert fetches == [["remote", "unknown"]]
+    assert rag_tools.place_embeddings(["remote"]) == {"remote": [0.0, 1.0, 0.0]}
+    assert len(fetches) == 1
+    assert rag_tools.cache_stats()["place_vectors"]["size"] == 2
+
+
+def test_embedding_cache_format_only_packs_place_vectors(monkeypatch):
+    """A lossy cache format shrinks place vectors but never the query vectors sent to Pinecone"""
+    import numpy as np
+
+    monkeypatch.setenv("RAG_EMBEDDING_CACHE_FORMAT", "int8")
+    rag_tools = _offline_rag_tools(monkeypatch)
+    query = [0.1, -0.37, 0.9]
+    monkeypatch.setattr(rag_tools, "_embed", lambda text: query)
+
+    assert rag_tools.embed_query("laksa") == pytest.approx(query, rel=1e-6)
+    assert rag_tools.embed_query("laksa") == pytest.approx(query, rel=1e-6)
+    assert rag_tools._query_embedding_cache.get((rag_tools.embedding_model, "laksa")).codes.dtype == np.float32
+
+    rag_tools._pinecone_index = _MemoryIndex()
+    rag_tools._pinecone_new_sdk = True
+    monkeypatch.setattr(rag_tools, "_embed_many", lambda texts: [query for _ in texts])
+    rag_tools.create_embeddings_batch([{"place_id": "p1", "name": "P1"}])
+    assert rag_tools._place_vector_cache.get("p1").codes.dtype == np.int8
+
+    monkeypatch.setenv("RAG_EMBEDDING_CACHE_FORMAT", "int4")
+    with pytest.raises(ValueError):
+        RAGTools()
+
+
+def test_cypher_runner_routes_named_statements_and_records_latency(monkeypatch):
+    """Reads use READ sessions, KG writes commit in one write transaction, latency is tracked"""
+    from whats_eat.tools.cypher import CypherRegistry, CypherRunner, LatencyHistogram, READ, WRITE
+
+    rag_tools = _offline_rag_tools(monkeypatch)
+    driver = _FakeGraphDriver([])
+    rag_tools.neo4j_driver = driver
+    rag_tools._neo4j_checked_at = float("inf")
+
+    rag_tools.create_knowledge_graph_batch([
+        {"place_id": "p", "name": "P", "types": ["cafe"], "reviews": [{"author_name": "a", "text": "ok"}]}
+    ])
+    assert driver.transactions == [("write", "WRITE")]
+    assert len(driver.queries) == 3
+    rag_tools.expand_from_graph(["p"])
+    assert driver.transactions[-1] == ("read", "READ")
+
+    stats = rag_tools.neo4j_stats()
+    assert set(stats) == {"graph.expand", "kg.upsert_places", "kg.delete_reviews", "kg.create_reviews"}
+    assert stats["graph.expand"]["count"] == 1 and stats["graph.expand"]["errors"] == 0
+
+    registry = CypherRegistry()
+    registry.register("q", "RETURN $x AS x", READ)
+    registry.register("w", "CREATE (:N {x: $x})", WRITE)
+    runner = CypherRunner(registry)
+    with pytest.raises(ValueError):
+        runner.write(driver, "q", {"x": 1})
+    with pytest.raises(ValueError):
+        registry.register("q", "RETURN 2", READ)
+
+    class _FlakySession(_FakeSession):
+        def execute_write(self, work):
+            # The driver re-invokes the work function after a transient failure
+            work(self)
+            return work(self)
+
+    class _FlakyDriver(_FakeGraphDriver):
+        def session(self, **kwargs):
+            return _FlakySession(self, kwargs.get("default_access_mode"))
+
+    runner.write(_FlakyDriver([]), "w", {"x": 1})
+    assert runner.stats()["w"]["retries"] == 1
+
+    histogram = LatencyHistogram((1, 10, 100))
+    for ms in (0.5, 3, 4, 50, 500):
+        histogram.observe(ms)
+    snapshot = histogram.snapshot()
+    assert snapshot["p50_ms"] == 10 and snapshot["max_ms"] == 500
+    assert snapshot["buckets"] == {"<=1": 1, "<=10": 2, "<=100": 1, ">100": 1}
+
+
 if __name__ == "__main__":
     print("\n🚀 Starting RAG Agent Tests\n")
     
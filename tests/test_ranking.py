@@ -0,0 +1,540 @@
+"""Tests for the restaurant ranking and filtering tools"""
+
+import json
+import random
+
+import numpy as np
+import pytest
+
+from whats_eat.tools import ranking, rating_priors
+from whats_eat.tools.geo import haversine_km
+from whats_eat.tools.ranking import (
+    CandidateFilter,
+    _calculate_distance_score,
+    _calculate_rating_score,
+    _calculate_similarity_score,
+    _match_attributes,
+    candidate_distances,
+    candidate_similarities,
+    compile_attribute_matcher,
+    filter_by_attributes,
+    lookup_place_cards,
+    mmr_order,
+    rank_profiles_batch,
+    rank_restaurants_by_profile,
+    top_n_indices,
+)
+from whats_eat.tools.rating_priors import RatingPriorStore
+
+TYPES = [
+    "restaurant", "food", "thai_restaurant", "japanese_restaurant", "malaysian_restaurant",
+    "vegetarian_restaurant", "vegan_restaurant", "fine_dining", "casual_dining", "food_truck",
+    "street_food", "cafe", "upscale",
+]
+PRICES = ranking.PRICE_LEVEL_ORDER + ["PRICE_LEVEL_UNSPECIFIED"]
+
+PROFILE = {
+    "attributes": {
+        "price_band": "mid",
+        "diet": ["Vegetarian"],
+        "region": ["Thai", "Japanese"],
+        "style": ["casual", "street food"],
+    }
+}
+
+
+@pytest.fixture(autouse=True)
+def _empty_prior_store(monkeypatch):
+    """Rank with the fixed rating prior unless a test installs a calibrated store"""
+    store = RatingPriorStore()
+    monkeypatch.setattr(rating_priors, "_store", store)
+    return store
+
+
+def _candidates(n, seed=0):
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        c = {
+            "place_id": f"p{i}",
+            "name": rng.choice(["Thai Garden", "Vegan Bowl", "Sushi Bar", "Noodle House"]) + f" {i}",
+            "types": rng.sample(TYPES, rng.randint(1, 4)),
+            "rating": rng.choice([0.0, 3.5, 4.0, 4.2, 4.5, 4.8]),
+            "userRatingCount": rng.randint(0, 500),
+            "priceLevel": rng.choice(PRICES),
+        }
+        if rng.random() < 0.8:
+            c["score"] = rng.uniform(-0.2, 0.9)
+        if rng.random() < 0.5:
+            c["distance_km"] = rng.choice([0.0, 0.4, 1.5, 3.0, 8.0])
+        out.append(c)
+    return out
+
+
+def _reference_rank(candidates, user_profile, top_n, weights=None):
+    """The original per-candidate loop, built from the scalar helpers"""
+    w = {**ranking.DEFAULT_WEIGHTS, **(weights or {})}
+    attrs = user_profile.get("attributes", {})
+    scored = []
+    for c in candidates:
+        parts = {
+            "similarity": _calculate_similarity_score(c.get("score", 0.0)),
+            "rating": _calculate_rating_score(c.get("rating", 0.0), c.get("userRatingCount", 0)),
+            "attributes": _match_attributes(c, attrs),
+            "distance": _calculate_distance_score(c.get("distance_km")),
+        }
+        final = sum(w[k] * v for k, v in parts.items())
+        r = c.copy()
+        r["final_score"] = float(np.round(final, 4))
+        r["score_breakdown"] = {k: round(v, 3) for k, v in parts.items()}
+        scored.append(r)
+    return sorted(scored, key=lambda x: x["final_score"], reverse=True)[:top_n]
+
+
+def test_vectorized_ranking_matches_reference_loop():
+    candidates = _candidates(300)
+    for top_n in (1, 5, 50, 400):
+        result = rank_restaurants_by_profile.invoke(
+            {"candidates": candidates, "user_profile": PROFILE, "top_n": top_n}
+        )
+        assert result["ranked_results"] == _reference_rank(candidates, PROFILE, top_n)
+        assert result["total_candidates"] == 300
+        assert result["weights_used"] == ranking.DEFAULT_WEIGHTS
+
+    weights = {"similarity": 0.7, "distance": 0.0}
+    result = rank_restaurants_by_profile.invoke(
+        {"candidates": candidates, "user_profile": {}, "top_n": 10, "weights": weights}
+    )
+    assert result["ranked_results"] == _reference_rank(candidates, {}, 10, weights)
+
+
+def test_top_n_indices_is_stable_on_ties():
+    scores = np.array([0.5, 0.9, 0.5, 0.9, 0.1, 0.5])
+    assert top_n_indices(scores, 3).tolist() == [1, 3, 0]
+    assert top_n_indices(scores, 4).tolist() == [1, 3, 0, 2]
+    assert top_n_indices(scores, 10).tolist() == [1, 3, 0, 2, 5, 4]
+    assert top_n_indices(scores, 0).tolist() == []
+
+
+def test_ranking_orders_on_the_emitted_score_at_half_way_values():
+    # 0.12345 rounds up with round() (its binary value is just above) but down with np.round
+    candidates = [
+        {"place_id": "a", "score": 2 * 0.12345 - 1},
+        {"place_id": "b", "score": 2 * 0.12342 - 1},
+        {"place_id": "c", "score": 2 * 0.12345 - 1},
+    ]
+    weights = {"similarity": 1.0, "rating": 0.0, "attributes": 0.0, "distance": 0.0}
+    result = rank_restaurants_by_profile.invoke(
+        {"candidates": candidates, "user_profile": {}, "top_n": 3, "weights": weights}
+    )
+    scores = [(r["place_id"], r["final_score"]) for r in result["ranked_results"]]
+    assert scores == [("a", 0.1234), ("b", 0.1234), ("c", 0.1234)]
+
+
+def test_ranking_empty_and_filter_passthrough():
+    result = rank_restaurants_by_profile.invoke({"candidates": [], "user_profile": PROFILE})
+    assert result["ranked_results"] == [] and result["total_candidates"] == 0
+
+    candidates = _candidates(20)
+    filtered = filter_by_attributes.invoke({"candidates": candidates})
+    assert filtered["filtered_count"] == 20
+
+
+def test_compiled_matcher_matches_match_attributes():
+    profiles = [
+        PROFILE["attributes"],
+        {},
+        {"price_band": "budget"},
+        {"price_band": "cheap", "diet": ["halal"]},
+        {"diet": ["Vegan"], "region": ["thai", "Thai", "sushi"]},
+        {"region": ["garden", "noodle"], "style": ["Fine Dining", "casual", "casual"]},
+    ]
+    candidates = _candidates(200, seed=3)
+    candidates.append({"name": "Plain", "types": ["Vegetarian_Restaurant", "CASUAL_dining"]})
+    for attrs in profiles:
+        matcher = compile_attribute_matcher(attrs)
+        assert compile_attribute_matcher(dict(attrs)) is matcher
+        expected = [_match_attributes(c, attrs) for c in candidates]
+        assert matcher.scores(candidates).tolist() == expected
+
+
+def test_similarity_from_user_and_candidate_embeddings():
+    rng = np.random.default_rng(1)
+    candidates = _candidates(50, seed=4)
+    user = rng.standard_normal(16)
+    matrix = rng.standard_normal((50, 16))
+    rows = [row.tolist() for row in matrix]
+    rows[3] = None  # no embedding: keeps its search score
+    expected = matrix @ user / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(user))
+    expected[3] = candidates[3].get("score", 0.0)
+
+    assert np.allclose(candidate_similarities(candidates, user.tolist(), rows), expected, atol=1e-6)
+    by_id = {c["place_id"]: row for c, row in zip(candidates, rows) if row is not None}
+    assert np.allclose(candidate_similarities(candidates, user.tolist(), by_id), expected, atol=1e-6)
+    assert candidate_similarities(candidates, None, rows).tolist() == [c.get("score", 0.0) for c in candidates]
+
+    embedded = [{**c, "embedding": row} for c, row in zip(candidates, rows)]
+    profile = {**PROFILE, "embedding": user.tolist()}
+    result = rank_restaurants_by_profile.invoke({"candidates": embedded, "user_profile": profile, "top_n": 50})
+    by_place = {r["place_id"]: r["score_breakdown"]["similarity"] for r in result["ranked_results"]}
+    for c, sim in zip(candidates, expected):
+        assert abs(by_place[c["place_id"]] - (sim + 1) / 2) <= 0.0006
+
+
+def test_distances_from_user_origin_feed_distance_component():
+    rng = random.Random(7)
+    origin = (1.3000, 103.8500)
+    candidates = []
+    for i in range(40):
+        lat, lng = origin[0] + rng.uniform(-0.1, 0.1), origin[1] + rng.uniform(-0.1, 0.1)
+        candidates.append({"place_id": f"p{i}", "location": {"latitude": lat, "longitude": lng}, "rating": 4.0})
+    candidates.append({"place_id": "given", "distance_km": 2.5})
+    candidates.append({"place_id": "unknown"})
+
+    distances = candidate_distances(candidates, origin)
+    expected = [haversine_km(*origin, c["location"]["latitude"], c["location"]["longitude"]) for c in candidates[:40]]
+    assert np.allclose(distances[:40], expected)
+    assert distances[40] == 2.5 and np.isnan(distances[41])
+
+    result = rank_restaurants_by_profile.invoke({
+        "candidates": candidates, "user_profile": {}, "top_n": 42,
+        "user_location": {"lat": origin[0], "lng": origin[1]},
+    })
+    by_id = {r["place_id"]: r for r in result["ranked_results"]}
+    assert by_id["p0"]["distance_km"] == round(expected[0], 3)
+    assert by_id["p0"]["score_breakdown"]["distance"] == round(np.exp(-expected[0] / ranking.DISTANCE_DECAY_KM), 3)
+    assert "distance_km" not in by_id["unknown"] and by_id["unknown"]["score_breakdown"]["distance"] == 1.0
+
+    walk = rank_restaurants_by_profile.invoke({
+        "candidates": candidates, "user_profile": {"location": {"lat": origin[0], "lng": origin[1]}},
+        "top_n": 42, "travel_mode": "walk",
+    })
+    p0 = {r["place_id"]: r for r in walk["ranked_results"]}["p0"]
+    minutes = expected[0] * ranking.ROUTE_DETOUR_FACTOR / ranking.TRAVEL_SPEEDS_KMH["walk"] * 60
+    assert p0["travel_minutes"] == round(minutes, 1)
+    assert p0["score_breakdown"]["distance"] == round(np.exp(-minutes / ranking.TRAVEL_TIME_DECAY_MIN), 3)
+    with pytest.raises(ValueError):
+        ranking.travel_minutes(distances, "teleport")
+    teleport = rank_restaurants_by_profile.invoke(
+        {"candidates": candidates, "user_profile": {}, "travel_mode": "teleport"}
+    )
+    assert teleport["ranked_results"] == [] and "Unknown travel mode" in teleport["error"]
+
+    # A caller-supplied distance is echoed unrounded and the input candidates are left untouched
+    precise = [{"place_id": "q", "distance_km": 1.23456}]
+    ranked = rank_restaurants_by_profile.invoke({"candidates": precise, "user_profile": {}})
+    assert ranked["ranked_results"][0]["distance_km"] == 1.23456
+    assert precise == [{"place_id": "q", "distance_km": 1.23456}]
+
+
+def _reference_filter(candidates, required):
+    """The original per-candidate filter loop"""
+    kept = []
+    for c in candidates:
+        if "min_rating" in required and c.get("rating", 0.0) < required["min_rating"]:
+            continue
+        if "max_price" in required:
+            order = ranking.PRICE_LEVEL_ORDER
+            price = c.get("priceLevel", "PRICE_LEVEL_UNSPECIFIED")
+            if price in order and required["max_price"] in order:
+                if order.index(price) > order.index(required["max_price"]):
+                    continue
+        if "required_types" in required and not any(t in c.get("types", []) for t in required["required_types"]):
+            continue
+        if "exclude_types" in required and any(t in c.get("types", []) for t in required["exclude_types"]):
+            continue
+        if "open_now" in required and required["open_now"] != c.get("isOpen", True):
+            continue
+        kept.append(c)
+    return kept
+
+
+def test_compiled_filter_matches_reference_and_orders_by_selectivity():
+    candidates = _candidates(400, seed=5)
+    for i, c in enumerate(candidates):
+        if i % 3:
+            c["isOpen"] = bool(i % 2)
+    requirements = [
+        {"min_rating": 4.2},
+        {"max_price": "PRICE_LEVEL_MODERATE", "exclude_types": ["cafe"]},
+        {"max_price": "cheap", "required_types": ["thai_restaurant", "street_food"]},
+        {"required_types": []},
+        {"open_now": True, "min_rating": 3.0, "max_price": "PRICE_LEVEL_EXPENSIVE", "required_types": ["food"]},
+    ]
+    for required in requirements:
+        result = filter_by_attributes.invoke({"candidates": candidates, "required_attributes": required})
+        assert result["filtered_results"] == _reference_filter(candidates, required)
+        assert result["filtered_count"] == len(result["filtered_results"])
+
+    compiled = CandidateFilter({"min_rating": 0.0, "required_types": ["vegan_restaurant"]})
+    compiled.indices(candidates)
+    assert [p.name for p in compiled.predicates] == ["required_types", "min_rating"]
+
+
+def test_fused_filter_then_rank_matches_two_step():
+    candidates = _candidates(300, seed=6)
+    rows = [[float(i % 7), 1.0, float(i % 3)] for i in range(300)]
+    required = {"min_rating": 4.0, "exclude_types": ["cafe"]}
+    filtered = filter_by_attributes.invoke({"candidates": candidates, "required_attributes": required})
+    kept_rows = [rows[int(c["place_id"][1:])] for c in filtered["filtered_results"]]
+    profile = {**PROFILE, "embedding": [1.0, 0.5, 0.0]}
+
+    two_step = rank_restaurants_by_profile.invoke({
+        "candidates": filtered["filtered_results"], "user_profile": profile, "top_n": 20,
+        "candidate_embeddings": kept_rows,
+    })
+    fused = rank_restaurants_by_profile.invoke({
+        "candidates": candidates, "user_profile": profile, "top_n": 20,
+        "candidate_embeddings": rows, "required_attributes": required,
+    })
+    assert fused["ranked_results"] == two_step["ranked_results"]
+    assert fused["total_candidates"] == 300
+    assert fused["filtered_count"] == filtered["filtered_count"]
+
+
+def test_rating_priors_calibrate_incrementally_and_feed_ranking(_empty_prior_store, tmp_path):
+    store = _empty_prior_store
+    store.min_places = 3
+    sg_thai = [
+        {"place_id": f"t{i}", "rating": r, "userRatingCount": n, "types": ["restaurant", "thai_restaurant"],
+         "region": "SG"}
+        for i, (r, n) in enumerate([(4.0, 10), (4.5, 12), (3.5, 14), (4.2, 100)])
+    ]
+    assert store.add_places(sg_thai + [{"place_id": "unrated", "rating": 0.0}]) == 4
+    mean, count = store.prior("sg", "thai_restaurant")
+    assert mean == pytest.approx(4.05) and 8 <= count < 16  # median of 10, 12, 14, 100 in its log bucket
+    assert store.prior("my", "cafe") == store.prior()  # falls back to the corpus prior
+
+    # Re-ingesting a place replaces its contribution instead of counting it twice
+    store.add_places([{**sg_thai[3], "rating": 5.0}])
+    assert len(store) == 4
+    assert store.prior("SG", "thai_restaurant")[0] == pytest.approx(4.25)
+
+    store.add_places([{"place_id": "c", "rating": 4.8, "userRatingCount": 3, "types": ["cafe"], "region": "MY"}])
+    assert store.prior("my", "cafe") == store.prior()  # "my" and "cafe" still below min_places
+    assert RatingPriorStore(min_places=3).prior() == (ranking.RATING_PRIOR_MEAN, ranking.RATING_PRIOR_COUNT)
+
+    path = str(tmp_path / "priors.json")
+    store.save(path)
+    loaded = RatingPriorStore.load(path)
+    assert loaded.priors() == store.priors()
+
+    candidates = _candidates(60, seed=8)
+    for c in candidates[::2]:
+        c["region"] = "SG"
+    result = rank_restaurants_by_profile.invoke({"candidates": candidates, "user_profile": {}, "top_n": 60})
+    for r in result["ranked_results"]:
+        expected = _calculate_rating_score(r["rating"], r["userRatingCount"], store.prior_for(r))
+        assert r["score_breakdown"]["rating"] == round(expected, 3)
+
+
+def test_rating_priors_saved_when_due_and_reloaded_by_serving_process(monkeypatch, tmp_path):
+    """Writers save at intervals; the shared store picks up priors another process merged"""
+    path = str(tmp_path / "priors.json")
+    thai = [
+        {"place_id": f"t{i}", "rating": 4.0 + i / 10, "userRatingCount": 10, "types": ["thai_restaurant"]}
+        for i in range(3)
+    ]
+    writer = RatingPriorStore(min_places=3)
+    assert not writer.save_if_due(path)  # nothing to save yet
+    writer.add_places(thai[:1])
+    assert writer.save_if_due(path)
+    writer.add_places(thai[1:])
+    assert not writer.save_if_due(path, interval=3600)
+    assert len(RatingPriorStore.load(path)) == 1
+
+    monkeypatch.setenv("RAG_RATING_PRIORS_PATH", path)
+    monkeypatch.setenv("RAG_RATING_PRIORS_RELOAD_INTERVAL", "0")
+    monkeypatch.setattr(rating_priors, "_store", None)
+    serving = rating_priors.get_prior_store()
+    serving.min_places = 3
+    serving.add_places([{"place_id": "local", "rating": 3.0, "userRatingCount": 5, "types": ["cafe"]}])
+    assert not serving.calibrated
+
+    # A backfill merges its partials into the file; the serving store merges it in place
+    assert writer.save_if_due(path)
+    assert rating_priors.get_prior_store() is serving
+    assert len(serving) == 4 and serving.calibrated
+    assert serving.prior(None, "thai_restaurant")[0] == pytest.approx(4.1)
+    assert not serving.reload(path)  # unchanged since the last reload
+    assert serving.save_if_due(path)  # the local place is still unsaved
+    assert len(RatingPriorStore.load(path)) == 4
+
+
+def _naive_mmr(relevance, n, diversity, embeddings):
+    """MMR recomputing every similarity to the selected set at each step"""
+    unit = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    picked = []
+    while len(picked) < n:
+        best, best_score = None, -np.inf
+        for i in range(len(relevance)):
+            if i in picked:
+                continue
+            penalty = max([max(0.0, float(unit[i] @ unit[j])) for j in picked], default=0.0)
+            score = (1 - diversity) * relevance[i] - diversity * penalty
+            if score > best_score:
+                best, best_score = i, score
+        picked.append(best)
+    return picked
+
+
+def test_mmr_matches_naive_selection_and_diversifies_ranking():
+    rng = np.random.default_rng(2)
+    relevance = rng.uniform(0, 1, 80)
+    embeddings = rng.standard_normal((80, 12))
+    for diversity in (0.0, 0.3, 0.7):
+        assert mmr_order(relevance, 10, diversity, embeddings).tolist() == _naive_mmr(relevance, 10, diversity, embeddings)
+
+    # Five near-identical ramen shops on one street outscore everything else
+    ramen = [
+        {"place_id": f"ramen{i}", "name": f"Ramen {i}", "rating": 4.8, "userRatingCount": 400, "score": 0.9,
+         "types": ["ramen_restaurant"], "location": {"lat": 1.3000 + i * 1e-4, "lng": 103.8500},
+         "embedding": [1.0, 0.0, 0.01 * i]}
+        for i in range(5)
+    ]
+    others = [
+        {"place_id": f"other{i}", "name": f"Other {i}", "rating": 4.3, "userRatingCount": 200, "score": 0.6,
+         "types": ["cafe"], "location": {"lat": 1.30 + 0.05 * (i + 1), "lng": 103.80},
+         "embedding": [0.0, 1.0, float(i)]}
+        for i in range(5)
+    ]
+    args = {"candidates": ramen + others, "user_profile": {}, "top_n": 3}
+    plain = rank_restaurants_by_profile.invoke(args)
+    assert [r["place_id"] for r in plain["ranked_results"]] == ["ramen0", "ramen1", "ramen2"]
+    diverse = rank_restaurants_by_profile.invoke({**args, "diversity": 0.5})
+    ids = [r["place_id"] for r in diverse["ranked_results"]]
+    assert ids[0] == "ramen0" and sum(pid.startswith("ramen") for pid in ids) == 1
+    assert diverse["diversity"] == 0.5
+
+
+def test_weight_tuning_recovers_rating_driven_choices(tmp_path, monkeypatch):
+    from whats_eat.tools import weight_tuning
+
+    # Users always pick the best-rated place; similarity is noise
+    sessions = []
+    for s in range(30):
+        candidates = _candidates(20, seed=100 + s)
+        best = max(candidates, key=lambda c: _calculate_rating_score(c["rating"], c["userRatingCount"]))
+        sessions.append({"user_profile": PROFILE, "candidates": candidates, "chosen": [best["place_id"]]})
+    sessions.append({"user_profile": PROFILE, "candidates": _candidates(5), "chosen": []})  # skipped
+    path = tmp_path / "sessions.jsonl"
+    path.write_text("\n".join(json.dumps(s) for s in sessions) + "\n", encoding="utf-8")
+    batch = weight_tuning.SessionBatch.load(str(path))
+    assert len(batch) == 30
+
+    # Batched NDCG/recall equal the per-session computation for each weight vector
+    grid = weight_tuning.simplex_grid(0.25)
+    metrics = weight_tuning.evaluate(batch, grid, k=5)
+    for row, weights in enumerate(grid[:6]):
+        w = dict(zip(weight_tuning.FACTORS, map(float, weights)))
+        ndcg, recall = [], []
+        for session in sessions[:30]:
+            top = _reference_rank(session["candidates"], PROFILE, 5, w)
+            hits = [float(r["place_id"] in session["chosen"]) for r in top]
+            ndcg.append(sum(h * 3.0 / np.log2(i + 2) for i, h in enumerate(hits)) / 3.0)
+            recall.append(sum(hits))
+        assert metrics["ndcg"][row] == pytest.approx(np.mean(ndcg), abs=0.05)
+        assert metrics["recall"][row] == pytest.approx(np.mean(recall), abs=0.05)
+
+    report = weight_tuning.tune(batch, metric="ndcg", k=5, search="grid", step=0.1)
+    assert report["tuned"]["ndcg"] > report["baseline"]["ndcg"]
+    assert report["weights"]["rating"] == max(report["weights"].values())
+    refined = weight_tuning.coordinate_search(batch, "ndcg", 5)
+    assert refined["score"] >= report["baseline"]["ndcg"]
+
+    # A saved weight set is loaded by name by the ranking tool
+    monkeypatch.setenv("RANKING_WEIGHTS_DIR", str(tmp_path / "weights"))
+    weight_tuning.save_weight_set("tuned", report["weights"], metric="ndcg")
+    ranking._weight_set_cache.clear()
+    args = {"candidates": sessions[0]["candidates"], "user_profile": PROFILE, "weight_set": "tuned"}
+    out = rank_restaurants_by_profile.invoke(args)
+    assert out["weights_used"] == report["weights"]
+    override = rank_restaurants_by_profile.invoke({**args, "weights": {"distance": 0.5}})
+    assert override["weights_used"] == {**report["weights"], "distance": 0.5}
+    with pytest.raises(FileNotFoundError):
+        rank_restaurants_by_profile.func(**{**args, "weight_set": "missing"})
+
+
+def test_batch_ranking_matches_per_user_tool_calls():
+    rng = np.random.default_rng(5)
+    candidates = _candidates(80, seed=9)
+    for i, c in enumerate(candidates):
+        if i % 4:
+            c["embedding"] = rng.standard_normal(8).tolist()
+        if i % 3:
+            c["location"] = {"latitude": 1.30 + rng.uniform(-0.05, 0.05), "longitude": 103.85 + rng.uniform(-0.05, 0.05)}
+    profiles = [
+        PROFILE,
+        {**PROFILE, "embedding": rng.standard_normal(8).tolist(), "location": {"lat": 1.31, "lng": 103.84}},
+        {"attributes": {"price_band": "budget", "style": ["fine dining"]}, "embedding_profile": rng.standard_normal(8).tolist()},
+        {"attributes": PROFILE["attributes"], "location": {"lat": 1.28, "lng": 103.86}},
+        {"embedding": [0.0] * 8},  # zero vector: search scores
+    ]
+    for options in ({}, {"travel_mode": "walk"}, {"required_attributes": {"min_rating": 4.0}}, {"diversity": 0.4}):
+        batch = rank_profiles_batch(candidates, profiles, top_n=10, **options)
+        assert len(batch) == len(profiles)
+        for profile, result in zip(profiles, batch):
+            single = rank_restaurants_by_profile.invoke(
+                {"candidates": candidates, "user_profile": profile, "top_n": 10, **options}
+            )
+            assert [r["place_id"] for r in result["ranked_results"]] == [r["place_id"] for r in single["ranked_results"]]
+            for got, want in zip(result["ranked_results"], single["ranked_results"]):
+                assert got["final_score"] == pytest.approx(want["final_score"], abs=1e-4)
+                assert got.get("distance_km") == want.get("distance_km")
+                assert got.get("travel_minutes") == want.get("travel_minutes")
+            assert {k: v for k, v in result.items() if k != "ranked_results"} == \
+                {k: v for k, v in single.items() if k != "ranked_results"}
+    assert rank_profiles_batch([], profiles[:2]) == [
+        {"ranked_results": [], "total_candidates": 0, "top_n": 5, "error": None}
+    ] * 2
+
+
+def test_compact_results_and_card_lookup():
+    candidates = _candidates(30, seed=12)
+    for c in candidates:
+        c.update({"formatted_address": f"{c['place_id']} Road", "photos": [{"name": "https://x/1.jpg"}], "reviews": ["long"] * 5})
+    args = {"candidates": candidates, "user_profile": PROFILE, "top_n": 5}
+    full = rank_restaurants_by_profile.invoke(args)
+    compact = rank_restaurants_by_profile.invoke({**args, "compact": True})
+    assert [r["place_id"] for r in compact["ranked_results"]] == [r["place_id"] for r in full["ranked_results"]]
+    for slim, whole in zip(compact["ranked_results"], full["ranked_results"]):
+        assert slim == {k: whole[k] for k in ("place_id", "final_score", "score_breakdown", "distance_km") if k in whole}
+
+    ids = [r["place_id"] for r in compact["ranked_results"]]
+    cards = lookup_place_cards.invoke({"place_ids": ids + ["unknown"]})
+    assert [c["place_id"] for c in cards["cards"]] == ids and cards["missing"] == ["unknown"]
+    first = next(c for c in candidates if c["place_id"] == ids[0])
+    assert cards["cards"][0]["formatted_address"] == first["formatted_address"]
+    assert cards["cards"][0]["photos"] == first["photos"] and "reviews" not in cards["cards"][0]
+    assert lookup_place_cards.invoke({"place_ids": ids[:1], "fields": ["name"]})["cards"] == [
+        {"place_id": ids[0], "name": first["name"]}
+    ]
+    batch = rank_profiles_batch(candidates, [PROFILE], top_n=5, compact=True)[0]
+    assert batch["ranked_results"] == compact["ranked_results"]
+
+
+def test_benchmark_suite_generates_pools_and_flags_regressions(tmp_path):
+    from whats_eat.tools import ranking_bench
+
+    candidates, embeddings = ranking_bench.synthetic_candidates(200, seed=3, dim=16)
+    assert len(candidates) == 200 and embeddings.shape == (200, 16)
+    assert np.allclose(np.linalg.norm(embeddings, axis=1), 1.0, atol=1e-5)
+    assert {c["priceLevel"] for c in candidates} <= set(PRICES)
+    assert all(c["rating"] == 0.0 or 1.0 <= c["rating"] <= 5.0 for c in candidates)
+    assert 0 < filter_by_attributes.invoke(
+        {"candidates": candidates, "required_attributes": ranking_bench.BENCH_FILTERS}
+    )["filtered_count"] < 200
+
+    report = ranking_bench.run_benchmarks(sizes=(50,), repeat=1, dim=16)
+    assert set(report["results"]) == {f"{case}@50" for case in ranking_bench.CASES}
+    assert all(r["seconds"] > 0 and r["peak_bytes"] > 0 for r in report["results"].values())
+
+    path = str(tmp_path / "baseline.json")
+    ranking_bench.save_baseline(report, path)
+    baseline = ranking_bench.load_baseline(path)
+    assert ranking_bench.compare(report, baseline) == []
+    slower = {"results": {"rank@50": {**report["results"]["rank@50"], "seconds": 1.0, "peak_bytes": 10 ** 9}}}
+    regressions = ranking_bench.compare(slower, baseline)
+    assert len(regressions) == 2 and all(m.startswith("rank@50") for m in regressions)
+    with pytest.raises(ValueError):
+        ranking_bench.run_benchmarks(sizes=(10,), cases=["sort"])
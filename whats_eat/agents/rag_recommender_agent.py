@@ -1,8 +1,13 @@
 # agents/rag_recommender_agent.py
 from langgraph.prebuilt import create_react_agent
 from langchain.chat_models import init_chat_model
-from whats_eat.tools.RAG import process_places_data, query_similar_places_tool
-from whats_eat.tools.ranking import rank_restaurants_by_profile, filter_by_attributes
+from whats_eat.tools.RAG import (
+    process_places_data,
+    query_similar_places_tool,
+    query_similar_places_by_vector_tool,
+    expand_related_places_tool,
+)
+from whats_eat.tools.ranking import rank_restaurants_by_profile, filter_by_attributes, lookup_place_cards
 
 
 def build_rag_recommender_agent():
@@ -18,8 +23,11 @@ def build_rag_recommender_agent():
         tools=[
             process_places_data,
             query_similar_places_tool,
+            query_similar_places_by_vector_tool,
+            expand_related_places_tool,
             rank_restaurants_by_profile,
-            filter_by_attributes
+            filter_by_attributes,
+            lookup_place_cards
         ],
         prompt=(
             "You are the RAG Recommender Agent in the \"What's Eat\" system.\n"
@@ -58,25 +66,52 @@ def build_rag_recommender_agent():
             "\n"
             "STEP 1: PROCESS PLACE DATA (Build Knowledge Base)\n"
             "- Extract place data JSON string from conversation history\n"
-            "- Call process_places_data(places_data=<json_string>, dry_run=False)\n"
-            "- This will:\n"
-            "  * Store structured data in Neo4j knowledge graph\n"
-            "  * Generate embeddings using OpenAI (text-embedding-3-small)\n"
-            "  * Index vectors in Pinecone for similarity search\n"
+            "- Call process_places_data(places_data=<json_string>, dry_run=False, background=True)\n"
+            "- It returns the normalized places immediately; a background worker then:\n"
+            "  * Stores structured data in Neo4j knowledge graph\n"
+            "  * Generates embeddings using OpenAI (text-embedding-3-small)\n"
+            "  * Indexes vectors in Pinecone for similarity search\n"
+            "- Keep the returned places: they are your ranking candidates even if the\n"
+            "  vector search below does not return them yet\n"
             "\n"
             "STEP 2: SEMANTIC SEARCH (Find Similar Restaurants)\n"
             "- Extract user profile from conversation\n"
-            "- Build query from user keywords and attributes (e.g., 'Malaysian street food restaurants')\n"
-            "- Call query_similar_places_tool(query=<search_text>, top_k=20)\n"
-            "- This returns candidates with similarity scores from vector search\n"
+            "- If the profile carries an embedding, call\n"
+            "  query_similar_places_by_vector(embedding=<profile_embedding>, top_k=20)\n"
+            "  (no extra embedding call; pass profile_embedding + intent_embedding to fuse both)\n"
+            "- Otherwise build query from user keywords and attributes (e.g., 'Malaysian street food restaurants')\n"
+            "  and call query_similar_places_tool(query=<search_text>, top_k=20)\n"
+            "- When the user names a dish or cuisine (e.g. 'laksa', 'omakase'), add mode='hybrid'\n"
+            "  to combine keyword and vector matching\n"
+            "- Scope the search to the current candidates: pass place_ids=<ids from PLACE DATA>\n"
+            "  (or bbox / geohash_prefix / city) so places from other cities are not scored\n"
+            "- This returns candidates with similarity scores from vector search; copy each match's\n"
+            "  score onto the STEP 1 place with the same place_id\n"
+            "\n"
+            "OPTIONAL STEP 2b: GRAPH EXPANSION (Richer Candidates)\n"
+            "- If vector search returned few candidates, call\n"
+            "  expand_related_places(place_ids=<top match ids>, limit=20)\n"
+            "- It returns places sharing cuisine types or reviewers with the seeds, or nearby;\n"
+            "  add them to the candidates (they carry no similarity score)\n"
             "\n"
             "STEP 3: INTELLIGENT RANKING (Score & Sort)\n"
             "- Extract user_profile attributes for matching\n"
             "- Call rank_restaurants_by_profile(\n"
             "    candidates=<results_from_step2>,\n"
             "    user_profile=<extracted_profile>,\n"
-            "    top_n=5\n"
+            "    top_n=5,\n"
+            "    compact=True\n"
             "  )\n"
+            "- compact=True returns only place_id, final_score and score_breakdown per result;\n"
+            "  then call lookup_place_cards(place_ids=<ranked place_ids>) for the name, address,\n"
+            "  rating, price, types and photos of just those places\n"
+            "- If the profile carries an embedding, also pass fetch_embeddings=True so places\n"
+            "  without a similarity score (e.g. from graph expansion) are scored against it\n"
+            "- If the user's location is known, pass user_location={\"lat\": ..., \"lng\": ...}\n"
+            "  (and travel_mode='walk'|'transit'|'drive' if they said how they travel);\n"
+            "  results then carry distance_km (and travel_minutes)\n"
+            "- Pass diversity=0.3 when the top results would otherwise be near-identical\n"
+            "  places (same cuisine on the same street)\n"
             "- Scoring factors (weights):\n"
             "  * Similarity: 35% (vector embedding match)\n"
             "  * Rating: 25% (Bayesian average of rating + review count)\n"
@@ -90,6 +125,8 @@ def build_rag_recommender_agent():
             "  * required_types: e.g., ['thai_restaurant']\n"
             "  * open_now: boolean\n"
             "- Apply before ranking to reduce candidate pool\n"
+            "- Or pass the same dict as required_attributes to rank_restaurants_by_profile\n"
+            "  to filter and rank in one call\n"
             "\n"
             "═══ OUTPUT FORMAT ═══\n"
             "Return results as STRUCTURED TEXT (not JSON) to supervisor for display:\n"
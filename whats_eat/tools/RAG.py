@@ -1,14 +1,40 @@
 from __future__ import annotations
 
+import atexit
+import copy
+import hashlib
+import importlib
 import json
 import logging
 import os
-from typing import Dict, List, Optional, Any
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Any, TypeVar
 
 from langchain_core.tools import tool
 from whats_eat.configuration.env_loader import load_env
+from whats_eat.tools.cache import LRUTTLCache
+from whats_eat.tools.cypher import READ, WRITE, CypherRegistry, CypherRunner
+from whats_eat.tools.ingest_queue import DEFAULT_QUEUE_PATH, IngestQueue, IngestWorker
+from whats_eat.tools.json_stream import iter_json_items
+from whats_eat.tools.lexical import BM25Index, reciprocal_rank_fusion
+from whats_eat.tools.namespaces import NamespaceRouter
+from whats_eat.tools.rating_priors import GENERIC_PLACE_TYPES, get_prior_store, place_region
+from whats_eat.tools.vector_store import (
+    VECTOR_FORMATS,
+    EncodedVector,
+    decode_vector,
+    encode_vector,
+    recall_at_k,
+    truncate_embedding,
+)
+from whats_eat.tools.geo import BBox, geohash_bbox, geohash_encode, place_lat_lng
+from whats_eat.tools.ranking import PRICE_LEVEL_RANK
 from neo4j import GraphDatabase
 from openai import OpenAI
+import numpy as np
 
 # Load environment variables including .env.json
 load_env()
@@ -16,6 +42,101 @@ load_env()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Geohash prefix lengths written to vector metadata for prefix filtering (~156km .. ~1.2km cells)
+GEOHASH_PREFIX_LENGTHS = (3, 4, 5, 6)
+
+# Review chunks are stored as "<place_id>#r<n>" with n below this bound; the parent vector's
+# "review_chunks" metadata records how many exist so a shorter re-write can delete the rest by id
+MAX_REVIEW_CHUNKS = 32
+
+# Pinecone request limits: records per upsert request and ids per delete request
+UPSERT_BATCH_SIZE = 100
+DELETE_BATCH_SIZE = 1000
+
+# Inputs per embeddings request when batching
+EMBEDDING_REQUEST_SIZE = 256
+
+# Ids per Pinecone fetch when looking up place vectors
+PLACE_FETCH_BATCH_SIZE = 100
+
+# Relative weight of each graph relation when scoring expanded places
+GRAPH_RELATION_WEIGHTS = {"shared_reviewer": 2.0, "shared_type": 1.0, "nearby": 1.0}
+
+# Indexes backing the MERGE on place_id and the expansion traversals
+GRAPH_SCHEMA_STATEMENTS = {
+    "place_id_unique": "CREATE CONSTRAINT place_id_unique IF NOT EXISTS FOR (p:Place) REQUIRE p.place_id IS UNIQUE",
+    "type_name_unique": "CREATE CONSTRAINT type_name_unique IF NOT EXISTS FOR (t:Type) REQUIRE t.name IS UNIQUE",
+    "review_author": "CREATE INDEX review_author IF NOT EXISTS FOR (r:Review) ON (r.author_name)",
+    "place_location": "CREATE POINT INDEX place_location IF NOT EXISTS FOR (p:Place) ON (p.location)",
+}
+
+# Neo4j errors after which the pooled driver is discarded and rebuilt once
+try:
+    from neo4j.exceptions import ServiceUnavailable, SessionExpired
+
+    _NEO4J_RECONNECT_ERRORS: tuple = (ServiceUnavailable, SessionExpired)
+except ImportError:  # pragma: no cover - very old drivers
+    _NEO4J_RECONNECT_ERRORS = (ConnectionError,)
+
+# Transport failures after which the Pinecone handle is rebuilt and the call retried once;
+# other errors (400 bad filter / dimension, 401, 404, ...) would fail again and are raised.
+# Which exception types exist depends on the SDK generation (urllib3 / httpx transports).
+def _optional_errors(module: str, *names: str) -> tuple:
+    try:
+        imported = importlib.import_module(module)
+    except ImportError:
+        return ()
+    return tuple(getattr(imported, name) for name in names if hasattr(imported, name))
+
+
+_PINECONE_RECONNECT_ERRORS: tuple = (
+    (ConnectionError, TimeoutError)
+    + _optional_errors("urllib3.exceptions", "HTTPError")
+    + _optional_errors("httpx", "TransportError")
+    + _optional_errors("pinecone.errors.exceptions", "PineconeConnectionError", "PineconeTimeoutError")
+)
+
+
+def _pinecone_retryable(error: Exception) -> bool:
+    """Whether a Pinecone call failed on the connection or a 5xx and is worth one retry."""
+    if isinstance(error, _PINECONE_RECONNECT_ERRORS):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    return isinstance(status, int) and status >= 500
+
+
+def normalize_place(raw: Any) -> Optional[Dict[str, Any]]:
+    """Normalize incoming place record to expected schema."""
+    if not isinstance(raw, dict):
+        return None
+
+    if "place_id" in raw and "name" in raw:
+        return raw
+
+    # Try test format mapping
+    pid = raw.get("id")
+    dname = raw.get("displayName") or {}
+    name = (dname.get("text") if isinstance(dname, dict) else None) or raw.get("name")
+    addr = raw.get("formattedAddress") or raw.get("formatted_address")
+    if pid and name:
+        doc: Dict[str, Any] = {
+            "place_id": pid,
+            "name": name,
+            "formatted_address": addr or "",
+            "types": raw.get("types") or [],
+            "rating": raw.get("rating") or 0.0,
+            "reviews": [],
+        }
+        # Keep the fields used for metadata filtering and ranking when the API returned them
+        for key in ("location", "priceLevel", "userRatingCount", "addressComponents"):
+            if raw.get(key) is not None:
+                doc[key] = raw[key]
+        return doc
+    return None
+
+
 class RAGTools:
     def __init__(self) -> None:
         # Neo4j connection
@@ -24,43 +145,202 @@ class RAGTools:
         self.neo4j_password: Optional[str] = os.getenv("NEO4J_PASSWORD")
         self.neo4j_driver = None
 
+        # Driver pool tuning; the driver is built once and shared by every tool call
+        self.neo4j_max_pool_size: int = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+        self.neo4j_acquisition_timeout: float = float(
+            os.getenv("NEO4J_CONNECTION_ACQUISITION_TIMEOUT", "60")
+        )
+        # Re-verify an idle driver at most this often (seconds); 0 disables the check
+        self.health_check_interval: float = float(os.getenv("RAG_HEALTH_CHECK_INTERVAL", "300"))
+        self._neo4j_checked_at: float = 0.0
+        self._connect_lock = threading.RLock()
+        # Managed transactions are retried by the driver on transient errors for this long (seconds)
+        self.neo4j_max_retry_time: float = float(os.getenv("NEO4J_MAX_TRANSACTION_RETRY_TIME", "30"))
+        # Every Cypher statement goes through the runner: named, parameterized, timed
+        self.cypher = CypherRunner(CYPHER_STATEMENTS, database=os.getenv("NEO4J_DATABASE") or None)
+        self._graph_schema_ready: bool = False
+        self._graph_cache: LRUTTLCache[List[Dict[str, Any]]] = LRUTTLCache(
+            int(os.getenv("RAG_QUERY_CACHE_SIZE", "512")), float(os.getenv("RAG_QUERY_CACHE_TTL", "900"))
+        )
+
         # Pinecone connection
         self.pinecone_api_key: Optional[str] = os.getenv("PINECONE_API_KEY")
         self.pinecone_environment: Optional[str] = os.getenv("PINECONE_ENVIRONMENT")
         self.index_name: str = "places-index"
+        # Connection pool size of the Pinecone data-plane client
+        self.pinecone_pool_threads: int = int(os.getenv("PINECONE_POOL_THREADS", "4"))
 
         # Pinecone runtime handles (lazy init) — supports new and legacy SDKs
         self._pinecone_client: Optional[object] = None
         self._pinecone_index: Optional[object] = None
         self._pinecone_new_sdk: bool = False
+        # Runs one query per namespace concurrently when a search spans several (lazy init)
+        self._query_executor: Optional[ThreadPoolExecutor] = None
+        # Namespace per geohash cell / country when RAG_NAMESPACE_MODE is set (default: one namespace)
+        self.namespace_router = NamespaceRouter.from_env()
+        self._known_namespaces: Optional[List[str]] = None
 
         # OpenAI client for embeddings
         self.openai_client = OpenAI()
+        self.embedding_model: str = "text-embedding-3-small"
+        self.embedding_dim: int = 1536
+        self._index_dim: Optional[int] = None
+
+        # Two-stage retrieval: text-embedding-3 vectors truncated to first_stage_dim (Matryoshka
+        # prefix, renormalized) live in a second, smaller index; its shortlist of
+        # top_k * shortlist_factor hits is rescored with the full vectors. 0 disables it.
+        self.first_stage_dim: int = int(os.getenv("RAG_FIRST_STAGE_DIM", "0"))
+        self.first_stage_index_name: str = os.getenv(
+            "RAG_FIRST_STAGE_INDEX", f"{self.index_name}-{self.first_stage_dim}d"
+        )
+        self.shortlist_factor: int = int(os.getenv("RAG_SHORTLIST_FACTOR", "4"))
+        # Writing the first-stage index and searching it are separate opt-ins, so recall and
+        # latency can be checked with eval-two-stage before queries switch over
+        self.two_stage_search: bool = os.getenv("RAG_TWO_STAGE_SEARCH", "0").lower() in ("1", "true")
+        self._first_stage_index: Optional[object] = None
+
+        # "place": one vector per place (reviews concatenated). "chunked": a place vector without
+        # reviews plus one child vector per review chunk, pooled per place at query time.
+        self.embedding_mode: str = os.getenv("RAG_EMBEDDING_MODE", "place")
+        self.review_chunk_chars: int = int(os.getenv("RAG_REVIEW_CHUNK_CHARS", "1000"))
+        self.chunk_pooling: str = os.getenv("RAG_CHUNK_POOLING", "max")
+        # Chunked queries fetch top_k * fanout hits so several chunks per place can be pooled
+        self.chunk_fanout: int = int(os.getenv("RAG_CHUNK_FANOUT", "5"))
+
+        # Query-side caches: text -> embedding, and (vector hash, top_k, filter) -> matches.
+        # The match cache is dropped whenever this process upserts new vectors.
+        cache_size = int(os.getenv("RAG_QUERY_CACHE_SIZE", "512"))
+        cache_ttl = float(os.getenv("RAG_QUERY_CACHE_TTL", "900"))
+        # Query vectors go to Pinecone unrescored, so they are cached at its float32 precision only
+        self._query_embedding_cache: LRUTTLCache[EncodedVector] = LRUTTLCache(cache_size, cache_ttl)
+        self._query_result_cache: LRUTTLCache[Dict[str, Any]] = LRUTTLCache(cache_size, cache_ttl)
+        # place_id -> place vector for in-ranker similarity; filled on upsert and on fetch.
+        # Entries do not expire: a place's vector only changes when this process re-embeds it.
+        self._place_vector_cache: LRUTTLCache[EncodedVector] = LRUTTLCache(
+            int(os.getenv("RAG_PLACE_VECTOR_CACHE_SIZE", "4096")), None
+        )
+        # Cached place vectors are packed ("float32", "float16" or "int8") instead of float lists
+        self.embedding_cache_format: str = os.getenv("RAG_EMBEDDING_CACHE_FORMAT", "float32")
+        if self.embedding_cache_format not in VECTOR_FORMATS:
+            raise ValueError(f"RAG_EMBEDDING_CACHE_FORMAT must be one of {VECTOR_FORMATS}")
+
+        # Write-behind ingestion: durable queue drained by a background thread, started on the
+        # first enqueue or by resume_ingestion() (the shared tools do so when RAG_INGEST_RESUME=1)
+        self.ingest_queue_path: str = os.getenv("RAG_INGEST_QUEUE_PATH", DEFAULT_QUEUE_PATH)
+        self._ingest_queue: Optional[IngestQueue] = None
+        self._ingest_worker: Optional[IngestWorker] = None
+
+        # Local BM25 index over the same text that is embedded; optionally persisted to disk, at
+        # most every RAG_LEXICAL_INDEX_SAVE_INTERVAL seconds from the ingest path, when the
+        # ingest queue drains and on close
+        self.lexical_index_path: Optional[str] = os.getenv("RAG_LEXICAL_INDEX_PATH")
+        self.lexical_index_save_interval: float = float(os.getenv("RAG_LEXICAL_INDEX_SAVE_INTERVAL", "60"))
+        self._lexical_index = BM25Index()
+        if self.lexical_index_path and os.path.exists(self.lexical_index_path):
+            try:
+                self._lexical_index = BM25Index.load(self.lexical_index_path)
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable lexical index {self.lexical_index_path}: {e}")
+
+        # Rating priors per region/category, shared with the ranking tools and updated on
+        # every write; persisted next to the lexical index when RAG_RATING_PRIORS_PATH is set,
+        # at most every RAG_RATING_PRIORS_SAVE_INTERVAL seconds from the ingest path and on close
+        self.rating_priors_path: Optional[str] = os.getenv("RAG_RATING_PRIORS_PATH")
+        self.rating_priors_save_interval: float = float(os.getenv("RAG_RATING_PRIORS_SAVE_INTERVAL", "60"))
+        self.rating_priors = get_prior_store()
+
+    def connect_neo4j(self, force: bool = False) -> None:
+        """Connect to Neo4j once and reuse the pooled driver on later calls.
 
-    def connect_neo4j(self) -> None:
-        """Connect to Neo4j using environment variables."""
+        An existing driver is only re-verified when it has been idle longer than
+        ``health_check_interval``; it is rebuilt if that check fails or ``force`` is set.
+        """
         if not self.neo4j_password:
             raise ValueError("NEO4J_PASSWORD is required but missing in environment")
+        with self._connect_lock:
+            if self.neo4j_driver is not None and not force:
+                if not self._neo4j_check_due():
+                    return
+                try:
+                    self.neo4j_driver.verify_connectivity()
+                    self._neo4j_checked_at = time.monotonic()
+                    return
+                except Exception as e:
+                    logger.warning(f"Neo4j health check failed, reconnecting: {e}")
+            self._close_neo4j()
+            try:
+                # For Neo4j Aura with neo4j+s:// URI, encryption is automatic
+                # No need to specify encrypted or trust parameters
+                self.neo4j_driver = GraphDatabase.driver(
+                    self.neo4j_uri,
+                    auth=(self.neo4j_user, self.neo4j_password),
+                    max_connection_lifetime=3600,
+                    max_connection_pool_size=self.neo4j_max_pool_size,
+                    connection_acquisition_timeout=self.neo4j_acquisition_timeout,
+                    max_transaction_retry_time=self.neo4j_max_retry_time,
+                )
+                # Verify connection
+                self.neo4j_driver.verify_connectivity()
+                self._neo4j_checked_at = time.monotonic()
+                logger.info("Connected to Neo4j Aura successfully!")
+                self._ensure_graph_schema()
+            except Exception as e:
+                self.neo4j_driver = None
+                logger.error(f"Failed to connect to Neo4j: {e}")
+                raise
+
+    def _ensure_graph_schema(self) -> None:
+        """Create the constraints/indexes used by writes and graph expansion (idempotent)."""
+        if self._graph_schema_ready or self.neo4j_driver is None:
+            return
         try:
-            # For Neo4j Aura with neo4j+s:// URI, encryption is automatic
-            # No need to specify encrypted or trust parameters
-            self.neo4j_driver = GraphDatabase.driver(
-                self.neo4j_uri, 
-                auth=(self.neo4j_user, self.neo4j_password),
-                max_connection_lifetime=3600
-            )
-            # Verify connection
-            self.neo4j_driver.verify_connectivity()
-            logger.info("Connected to Neo4j Aura successfully!")
+            # Schema changes cannot share a transaction, so each runs on its own
+            for name in SCHEMA_STATEMENT_NAMES:
+                self.cypher.write(self.neo4j_driver, name)
+            self._graph_schema_ready = True
         except Exception as e:
-            logger.error(f"Failed to connect to Neo4j: {e}")
-            raise
+            logger.warning(f"Could not ensure Neo4j schema (continuing without it): {e}")
+
+    def _neo4j_check_due(self) -> bool:
+        if self.health_check_interval <= 0:
+            return False
+        return time.monotonic() - self._neo4j_checked_at >= self.health_check_interval
+
+    def _close_neo4j(self) -> None:
+        if self.neo4j_driver is None:
+            return
+        try:
+            self.neo4j_driver.close()
+        except Exception as e:
+            logger.debug(f"Ignoring error while closing Neo4j driver: {e}")
+        self.neo4j_driver = None
 
-    def connect_pinecone(self) -> None:
-        """Initialize Pinecone, preferring the new SDK and falling back to legacy."""
+    def _with_neo4j(self, fn: Callable[[Any], T]) -> T:
+        """Run ``fn(driver)``, rebuilding the driver and retrying once on connection loss."""
+        if self.neo4j_driver is None:
+            self.connect_neo4j()
+        try:
+            return fn(self.neo4j_driver)
+        except _NEO4J_RECONNECT_ERRORS as e:
+            logger.warning(f"Neo4j connection lost ({type(e).__name__}); reconnecting")
+            self.connect_neo4j(force=True)
+            return fn(self.neo4j_driver)
+
+    def connect_pinecone(self, force: bool = False) -> None:
+        """Initialize Pinecone once, preferring the new SDK and falling back to legacy.
+
+        The index handle is cached; later calls are no-ops unless ``force`` is set.
+        """
         if not self.pinecone_api_key:
             raise ValueError("Missing PINECONE_API_KEY in environment")
+        with self._connect_lock:
+            if self._pinecone_index is not None and not force:
+                return
+            self._pinecone_index = None
+            self._first_stage_index = None
+            self._init_pinecone()
 
+    def _init_pinecone(self) -> None:
         # Infer cloud/region from PINECONE_ENVIRONMENT (e.g., us-east-1-aws)
         cloud = "aws"
         region: Optional[str] = None
@@ -82,33 +362,38 @@ class RAGTools:
 
             pc = _Pinecone(api_key=self.pinecone_api_key)
             existing = [ix.name for ix in pc.list_indexes()]
-            if self.index_name not in existing:
-                if not region:
-                    region = "us-east-1"
-                pc.create_index(
-                    name=self.index_name,
-                    dimension=1536,
-                    metric="cosine",
-                    spec=_ServerlessSpec(cloud=cloud, region=region),
+            for name, dimension in self._index_specs():
+                if name not in existing:
+                    if not region:
+                        region = "us-east-1"
+                    pc.create_index(
+                        name=name,
+                        dimension=dimension,
+                        metric="cosine",
+                        spec=_ServerlessSpec(cloud=cloud, region=region),
+                    )
+            self._pinecone_index = pc.Index(self.index_name, pool_threads=self.pinecone_pool_threads)
+            if self.first_stage_dim:
+                self._first_stage_index = pc.Index(
+                    self.first_stage_index_name, pool_threads=self.pinecone_pool_threads
                 )
-            self._pinecone_index = pc.Index(self.index_name)
             self._pinecone_client = pc
             self._pinecone_new_sdk = True
             logger.info("Initialized Pinecone (new SDK)")
         except Exception as new_err:
             # Fallback to legacy SDK if available
             try:
-                import importlib
-
                 pinecone_legacy = importlib.import_module("pinecone")
                 pinecone_legacy.init(
                     api_key=self.pinecone_api_key, environment=self.pinecone_environment
                 )
-                if self.index_name not in pinecone_legacy.list_indexes():
-                    pinecone_legacy.create_index(
-                        name=self.index_name, dimension=1536, metric="cosine"
-                    )
+                existing = pinecone_legacy.list_indexes()
+                for name, dimension in self._index_specs():
+                    if name not in existing:
+                        pinecone_legacy.create_index(name=name, dimension=dimension, metric="cosine")
                 self._pinecone_index = pinecone_legacy.Index(self.index_name)
+                if self.first_stage_dim:
+                    self._first_stage_index = pinecone_legacy.Index(self.first_stage_index_name)
                 self._pinecone_client = pinecone_legacy
                 self._pinecone_new_sdk = False
                 logger.info("Initialized Pinecone (legacy SDK)")
@@ -120,6 +405,52 @@ class RAGTools:
                     ) from new_err
                 raise legacy_err
 
+    def _index_specs(self) -> List[tuple]:
+        specs = [(self.index_name, self.embedding_dim)]
+        if self.first_stage_dim:
+            specs.append((self.first_stage_index_name, self.first_stage_dim))
+        return specs
+
+    def _with_pinecone(self, fn: Callable[[Any], T], first_stage: bool = False) -> T:
+        """Run ``fn(index)``, re-creating the index handle and retrying once on connection
+        errors, timeouts and 5xx responses; any other error is raised unchanged.
+
+        With `first_stage`, ``fn`` gets the truncated-dimension index instead.
+        """
+        if self._pinecone_index is None:
+            self.connect_pinecone()
+        try:
+            return fn(self._first_stage_index if first_stage else self._pinecone_index)
+        except Exception as e:
+            if not _pinecone_retryable(e):
+                raise
+            logger.warning(f"Pinecone call failed ({type(e).__name__}: {e}); reconnecting")
+            self.connect_pinecone(force=True)
+            return fn(self._first_stage_index if first_stage else self._pinecone_index)
+
+    def close(self) -> None:
+        """Stop the background ingest worker, save unsaved local indexes and release pooled
+        connections.
+
+        Batches the worker has not written yet stay in the durable queue.
+        """
+        if self._ingest_queue is not None:
+            # Joins the worker before the connection is closed
+            self._ingest_queue.close()
+            self._ingest_queue = None
+        self._ingest_worker = None
+        try:
+            self.save_local_indexes()
+        except OSError as e:
+            logger.warning(f"Could not save local indexes: {e}")
+        with self._connect_lock:
+            if self._query_executor is not None:
+                self._query_executor.shutdown(wait=True)
+                self._query_executor = None
+            self._close_neo4j()
+            self._pinecone_index = None
+            self._pinecone_client = None
+
     def load_json_data(self, file_path: str) -> Any:
         """Read a JSON file and return parsed data (dict or list)."""
         # Normalize path for Windows compatibility (handles backslashes)
@@ -128,175 +459,1091 @@ class RAGTools:
             return json.load(f)
 
     def _normalize_place(self, raw: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """Normalize incoming place record to expected schema."""
-        if not isinstance(raw, dict):
-            return None
-
-        if "place_id" in raw and "name" in raw:
-            return raw
-
-        # Try test format mapping
-        pid = raw.get("id")
-        dname = raw.get("displayName") or {}
-        name = (dname.get("text") if isinstance(dname, dict) else None) or raw.get("name")
-        addr = raw.get("formattedAddress") or raw.get("formatted_address")
-        if pid and name:
-            return {
-                "place_id": pid,
-                "name": name,
-                "formatted_address": addr or "",
-                "types": [],
-                "rating": 0.0,
-                "reviews": [],
-            }
-        return None
+        return normalize_place(raw)
 
     def create_knowledge_graph(self, place_data: Dict[str, Any]) -> None:
         """Write place and (optionally) reviews into Neo4j."""
-        if not self.neo4j_driver:
-            raise ValueError("Neo4j is not connected; call connect_neo4j() first")
+        self.create_knowledge_graph_batch([place_data])
 
-        with self.neo4j_driver.session() as session:
-            session.run(
-                """
-                CREATE (p:Place {
-                    place_id: $place_id,
-                    name: $name,
-                    address: $address,
-                    rating: $rating,
-                    types: $types
-                })
-                """,
-                {
-                    "place_id": place_data["place_id"],
-                    "name": place_data["name"],
-                    "address": place_data.get("formatted_address", ""),
-                    "rating": place_data.get("rating", 0.0),
-                    "types": place_data.get("types", []),
-                },
-            )
+    def create_knowledge_graph_batch(self, places: List[Dict[str, Any]]) -> None:
+        """Write a batch of places and their reviews in one round trip per statement.
 
-            if "reviews" in place_data:
-                for r in place_data["reviews"]:
-                    session.run(
-                        """
-                        MATCH (p:Place {place_id: $place_id})
-                        CREATE (rv:Review {
-                            author_name: $author_name,
-                            rating: $rating,
-                            text: $text,
-                            time: $time
-                        })
-                        CREATE (rv)-[:REVIEWS]->(p)
-                        """,
-                        {
-                            "place_id": place_data["place_id"],
-                            "author_name": r.get("author_name"),
-                            "rating": r.get("rating"),
-                            "text": r.get("text"),
-                            "time": r.get("time"),
-                        },
-                    )
+        Places are merged on place_id and their reviews replaced, so re-ingesting a
+        place does not create duplicate nodes.
+        """
+        if not self.neo4j_driver:
+            raise ValueError("Neo4j is not connected; call connect_neo4j() first")
+        if not places:
+            return
+        self._with_neo4j(lambda driver: self._write_places(driver, places))
+        self._graph_cache.clear()
+        logger.info(f"KG upserted for {len(places)} place(s)")
 
-        logger.info(f"KG upserted for place: {place_data.get('name')}")
+    def _write_places(self, driver: Any, places: List[Dict[str, Any]]) -> None:
+        rows = []
+        for p in places:
+            coords = place_lat_lng(p)
+            rows.append({
+                "place_id": p["place_id"],
+                "name": p["name"],
+                "address": p.get("formatted_address", ""),
+                "rating": p.get("rating", 0.0),
+                "types": p.get("types", []),
+                "lat": coords[0] if coords else None,
+                "lng": coords[1] if coords else None,
+            })
+        reviews = [
+            {
+                "place_id": p["place_id"],
+                "author_name": r.get("author_name"),
+                "rating": r.get("rating"),
+                "text": r.get("text"),
+                "time": r.get("time"),
+            }
+            for p in places
+            for r in (p.get("reviews") or [])
+        ]
+        # Place upsert and review replacement commit together or not at all
+        steps = [
+            ("kg.upsert_places", {"rows": rows}),
+            ("kg.delete_reviews", {"place_ids": [row["place_id"] for row in rows]}),
+        ]
+        if reviews:
+            steps.append(("kg.create_reviews", {"reviews": reviews}))
+        self.cypher.write_many(driver, steps)
 
-    def create_embeddings(self, place_data: Dict[str, Any]) -> None:
-        """Encode a textual representation and upsert into Pinecone."""
+    def _text_representation(self, place_data: Dict[str, Any], include_reviews: bool = True) -> str:
+        """Text used for both the place embedding and the lexical index."""
         parts: List[str] = [
             str(place_data.get("name", "")),
             str(place_data.get("formatted_address", "")),
             "Types: " + ", ".join(place_data.get("types", []) or []),
         ]
-        if "reviews" in place_data and place_data["reviews"]:
+        if include_reviews and "reviews" in place_data and place_data["reviews"]:
             reviews_text = " ".join(str(rv.get("text", "")) for rv in place_data["reviews"]).strip()
             if reviews_text:
                 parts.append("Reviews: " + reviews_text)
 
-        text_representation = " ".join(p for p in parts if p).strip()
-        response = self.openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text_representation,
-            encoding_format="float"
-        )
-        embedding = response.data[0].embedding
+        return " ".join(p for p in parts if p).strip()
+
+    def create_embeddings(self, place_data: Dict[str, Any]) -> None:
+        """Encode a textual representation and upsert into Pinecone."""
+        self.create_embeddings_batch([place_data])
+
+    def create_embeddings_batch(self, places: List[Dict[str, Any]]) -> None:
+        """Embed a batch of places with batched OpenAI calls and upsert them in request-sized slices.
+
+        In chunked mode each review chunk becomes a child vector `<place_id>#r<n>` whose
+        metadata repeats the parent's, so filters and per-place pooling keep working. Chunks
+        left over from a longer previous review set are deleted first.
+        """
+        if not places:
+            return
+        chunked = self.embedding_mode == "chunked"
+        texts = [self._text_representation(p) for p in places]
+        vector_texts = [self._text_representation(p, include_reviews=not chunked) for p in places]
+        ids = [p["place_id"] for p in places]
+        metadatas = [_place_metadata(p) for p in places]
+        chunk_counts: Dict[str, int] = {}
+        if chunked:
+            for place, metadata in zip(places, metadatas):
+                chunks = self._review_chunks(place)
+                for n, chunk in enumerate(chunks):
+                    ids.append(f"{place['place_id']}#r{n}")
+                    vector_texts.append(chunk)
+                    metadatas.append({**metadata, "kind": "review", "chunk": n})
+                metadata["review_chunks"] = chunk_counts[place["place_id"]] = len(chunks)
+        embeddings = self._embed_many(vector_texts)
 
         if not self._pinecone_index:
             # Allow implicit init if caller forgot connect_pinecone
             self.connect_pinecone()
 
+        # Embedding is already a list from OpenAI API; one upsert per target namespace
+        records: Dict[str, List[Any]] = {}
+        first_stage_records: Dict[str, List[Any]] = {}
+        for vector_id, embedding, metadata in zip(ids, embeddings, metadatas):
+            namespace = self.namespace_router.namespace_for_metadata(metadata)
+            records.setdefault(namespace, []).append(self._vector_record(vector_id, embedding, metadata))
+            if self.first_stage_dim:
+                short = truncate_embedding(embedding, self.first_stage_dim)
+                first_stage_records.setdefault(namespace, []).append(
+                    self._vector_record(vector_id, short, metadata)
+                )
+        for namespace, namespace_records in records.items():
+            stale = self._stale_chunk_ids(chunk_counts, namespace_records, namespace)
+            for first_stage in ((False, True) if self.first_stage_dim else (False,)):
+                self._delete_vectors(stale, namespace, first_stage)
+        for namespace, namespace_records in records.items():
+            self._upsert_vectors(namespace_records, namespace)
+        for namespace, namespace_records in first_stage_records.items():
+            self._upsert_vectors(namespace_records, namespace, first_stage=True)
+        for place, embedding in zip(places, embeddings):
+            self._place_vector_cache.set(place["place_id"], encode_vector(embedding, self.embedding_cache_format))
+        self._index_locally(places, texts, metadatas)
+
+        logger.info(f"Vectors upserted for {len(places)} place(s) ({len(ids)} vectors)")
+
+    def index_places_locally(self, places: List[Dict[str, Any]]) -> None:
+        """Add places to the in-process BM25 index and rating priors only, without any
+        Neo4j or Pinecone write (e.g. to rebuild local indexes for already written places)."""
+        texts = [self._text_representation(p) for p in places]
+        self._index_locally(places, texts, [_place_metadata(p) for p in places])
+
+    def _index_locally(
+        self, places: List[Dict[str, Any]], texts: List[str], metadatas: List[Dict[str, Any]]
+    ) -> None:
+        for place, text, metadata in zip(places, texts, metadatas):
+            self._lexical_index.add(place["place_id"], text, metadata)
+        self.rating_priors.add_places(places)
+
+    def _review_chunks(self, place_data: Dict[str, Any]) -> List[str]:
+        """Split each review into chunks of at most review_chunk_chars, on word boundaries."""
+        name = str(place_data.get("name", ""))
+        chunks: List[str] = []
+        for review in place_data.get("reviews") or []:
+            words = str(review.get("text") or "").split()
+            current: List[str] = []
+            size = 0
+            for word in words:
+                if current and size + len(word) + 1 > self.review_chunk_chars:
+                    chunks.append(f"{name}: {' '.join(current)}")
+                    current, size = [], 0
+                current.append(word)
+                size += len(word) + 1
+            if current:
+                chunks.append(f"{name}: {' '.join(current)}")
+        return chunks[:MAX_REVIEW_CHUNKS]
+
+    def _vector_record(
+        self, vector_id: str, values: List[float], metadata: Dict[str, Any]
+    ) -> Any:
+        """Build an upsert record in the shape the active SDK expects."""
         if self._pinecone_new_sdk:
-            self._pinecone_index.upsert(
-                vectors=[
-                    {
-                        "id": place_data["place_id"],
-                        "values": embedding,  # Already a list from OpenAI API
-                        "metadata": {
-                            "name": place_data.get("name"),
-                            "address": place_data.get("formatted_address", ""),
-                            "rating": place_data.get("rating", 0.0),
-                        },
-                    }
-                ]
+            return {"id": vector_id, "values": values, "metadata": metadata}
+        # Legacy SDK tuple style
+        return (vector_id, values, metadata)
+
+    def _stale_chunk_ids(
+        self, chunk_counts: Dict[str, int], records: List[Any], namespace: str
+    ) -> List[str]:
+        """Ids of review chunks beyond each place's new chunk count, up to its previous count.
+
+        The previous count is read from the stored parent vectors; a parent written before
+        counts were recorded is assumed to have used the full MAX_REVIEW_CHUNKS range.
+        """
+        place_ids = [
+            _record_id(record) for record in records if _record_id(record) in chunk_counts
+        ]
+        stale: List[str] = []
+        for start in range(0, len(place_ids), PLACE_FETCH_BATCH_SIZE):
+            ids = place_ids[start:start + PLACE_FETCH_BATCH_SIZE]
+            fetched = _fetched_vectors(self._with_pinecone(
+                lambda index, ids=ids: index.fetch(ids=ids, **_namespace_kwargs(namespace))
+            ))
+            for place_id, vector in fetched.items():
+                previous = _vector_metadata(vector).get("review_chunks", MAX_REVIEW_CHUNKS)
+                stale.extend(
+                    f"{place_id}#r{n}" for n in range(chunk_counts[place_id], int(previous))
+                )
+        return stale
+
+    def _delete_vectors(self, ids: List[str], namespace: str = "", first_stage: bool = False) -> None:
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            batch = ids[start:start + DELETE_BATCH_SIZE]
+            self._with_pinecone(
+                lambda index, batch=batch: index.delete(ids=batch, **_namespace_kwargs(namespace)),
+                first_stage,
+            )
+
+    def _upsert_vectors(self, records: List[Any], namespace: str = "", first_stage: bool = False) -> None:
+        for start in range(0, len(records), UPSERT_BATCH_SIZE):
+            batch = records[start:start + UPSERT_BATCH_SIZE]
+            self._with_pinecone(
+                lambda index, batch=batch: index.upsert(vectors=batch, **_namespace_kwargs(namespace)),
+                first_stage,
+            )
+        if self._known_namespaces is not None and namespace not in self._known_namespaces:
+            self._known_namespaces.append(namespace)
+        # New vectors can change any cached ranking
+        self._query_result_cache.clear()
+
+    def list_namespaces(self, refresh: bool = False) -> List[str]:
+        """Namespaces of the index owned by this router's prefix, from index stats."""
+        if self._known_namespaces is None or refresh:
+            stats = self._with_pinecone(lambda index: index.describe_index_stats())
+            namespaces = getattr(stats, "namespaces", None)
+            if namespaces is None and isinstance(stats, dict):
+                namespaces = stats.get("namespaces")
+            self._known_namespaces = sorted(
+                ns for ns in (namespaces or {}) if self.namespace_router.owns(ns)
+            ) or [self.namespace_router.namespace()]
+        return list(self._known_namespaces)
+
+    def _embed(self, text: str) -> List[float]:
+        return self._embed_many([text])[0]
+
+    def _embed_many(self, texts: List[str]) -> List[List[float]]:
+        embeddings: List[List[float]] = []
+        for start in range(0, len(texts), EMBEDDING_REQUEST_SIZE):
+            response = self.openai_client.embeddings.create(
+                model=self.embedding_model,
+                input=texts[start:start + EMBEDDING_REQUEST_SIZE],
+                encoding_format="float"
+            )
+            # The API may return items out of order; restore input order by index
+            data = sorted(response.data, key=lambda d: d.index)
+            embeddings.extend(d.embedding for d in data)
+        return embeddings
+
+    def embed_query(self, query_text: str) -> List[float]:
+        """Embed a search query, reusing the cached vector for repeated text."""
+        # The cache key and the embedded text are the same normalized string
+        text = query_text.strip()
+        key = (self.embedding_model, text)
+        encoded = self._query_embedding_cache.get_or_set(
+            key, lambda: encode_vector(self._embed(text), "float32")
+        )
+        return decode_vector(encoded)
+
+    def query_similar_places(
+        self,
+        query_text: str,
+        top_k: int = 5,
+        filter: Optional[Dict[str, Any]] = None,
+        namespaces: Optional[List[str]] = None,
+    ) -> Any:
+        """Encode the query and perform Pinecone vector search, optionally metadata-filtered."""
+        query_embedding = self.embed_query(query_text)
+        return self.query_by_vector(query_embedding, top_k, filter, namespaces=namespaces)
+
+    def index_dimension(self) -> int:
+        """Dimension of the Pinecone index, looked up once and cached."""
+        if self._index_dim is None:
+            dim: Optional[int] = None
+            try:
+                if self._pinecone_index is None:
+                    self.connect_pinecone()
+                if self._pinecone_new_sdk and self._pinecone_client is not None:
+                    dim = self._pinecone_client.describe_index(self.index_name).dimension
+                else:
+                    dim = self._pinecone_index.describe_index_stats().get("dimension")
+            except Exception as e:
+                logger.warning(f"Could not read index dimension, assuming {self.embedding_dim}: {e}")
+            self._index_dim = int(dim) if dim else self.embedding_dim
+        return self._index_dim
+
+    def query_by_vector(
+        self,
+        vector: List[float],
+        top_k: int = 5,
+        filter: Optional[Dict[str, Any]] = None,
+        pooling: Optional[str] = None,
+        namespaces: Optional[List[str]] = None,
+        two_stage: Optional[bool] = None,
+        shortlist_factor: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Vector search with an in-process result cache keyed on (vector, top_k, filter).
+
+        Use this with a precomputed embedding (e.g. the user profile vector) to skip the
+        OpenAI call. Raises ValueError if the vector does not match the index dimension.
+        Review-chunk hits are pooled into one match per place ("max" or "mean" of the chunk
+        scores, default chunk_pooling) within the same single query call.
+        With namespace routing on, only `namespaces` are searched (see NamespaceRouter.route);
+        None searches every namespace and merges the hits by score.
+        `two_stage` (default: RAG_TWO_STAGE_SEARCH, off) searches the truncated index first
+        and rescores its top_k * shortlist_factor hits at full dimension; that costs an extra
+        fetch per namespace on top of the first-stage query.
+        """
+        expected = self.index_dimension()
+        if len(vector) != expected:
+            raise ValueError(f"Query vector has dimension {len(vector)}, index expects {expected}")
+        pooling = pooling or self.chunk_pooling
+        if pooling not in ("max", "mean"):
+            raise ValueError(f"Unknown pooling: {pooling}")
+        two_stage = self.two_stage_search if two_stage is None else two_stage
+        if two_stage and not self.first_stage_dim:
+            raise ValueError("Two-stage search needs RAG_FIRST_STAGE_DIM to be set")
+        shortlist_factor = shortlist_factor or self.shortlist_factor
+        targets = self._query_namespaces(namespaces)
+        key = (
+            _vector_digest(vector), top_k, json.dumps(filter, sort_keys=True, default=str), pooling,
+            tuple(targets), shortlist_factor if two_stage else 0,
+        )
+        # Callers (e.g. the hybrid merge) mutate results, so the cache hands out copies
+        cached = self._query_result_cache.get(key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+
+        matches = self._search_vectors(vector, top_k, filter, pooling, targets, two_stage, shortlist_factor)
+        result = {"matches": matches}
+        self._query_result_cache.set(key, result)
+        return copy.deepcopy(result)
+
+    def _query_namespaces(self, namespaces: Optional[List[str]]) -> List[str]:
+        if not self.namespace_router.enabled:
+            return [self.namespace_router.namespace()]
+        return sorted(namespaces) if namespaces is not None else self.list_namespaces()
+
+    def _search_vectors(
+        self,
+        vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]],
+        pooling: str,
+        targets: List[str],
+        two_stage: bool,
+        shortlist_factor: int,
+    ) -> List[Dict[str, Any]]:
+        """Uncached search behind query_by_vector."""
+        fetch_k = top_k * self.chunk_fanout if self.embedding_mode == "chunked" else top_k
+        query_vector = vector
+        if two_stage:
+            fetch_k *= shortlist_factor
+            query_vector = truncate_embedding(vector, self.first_stage_dim)
+        kwargs: Dict[str, Any] = {"vector": query_vector, "top_k": fetch_k, "include_metadata": True}
+        if filter:
+            kwargs["filter"] = filter
+
+        def search(namespace: str) -> List[Dict[str, Any]]:
+            raw = self._with_pinecone(
+                lambda index: index.query(**kwargs, **_namespace_kwargs(namespace)), two_stage
             )
+            namespace_hits = [_match_to_dict(m) for m in _response_matches(raw)]
+            if two_stage:
+                namespace_hits = self._rescore_full(vector, namespace_hits, namespace)
+            return namespace_hits
+
+        if len(targets) == 1:
+            per_namespace = [search(targets[0])]
         else:
-            # Legacy SDK tuple style
-            self._pinecone_index.upsert(
-                vectors=[
-                    (
-                        place_data["place_id"],
-                        embedding,  # Already a list from OpenAI API
-                        {
-                            "name": place_data.get("name"),
-                            "address": place_data.get("formatted_address", ""),
-                            "rating": place_data.get("rating", 0.0),
-                        },
+            # Namespaces are queried concurrently: an unscoped search waits for the slowest, not the sum
+            per_namespace = list(self._namespace_executor().map(search, targets))
+        hits = [hit for namespace_hits in per_namespace for hit in namespace_hits]
+        return _pool_chunk_matches(hits, pooling)[:top_k]
+
+    def _namespace_executor(self) -> ThreadPoolExecutor:
+        with self._connect_lock:
+            if self._query_executor is None:
+                self._query_executor = ThreadPoolExecutor(
+                    max_workers=max(1, self.pinecone_pool_threads),
+                    thread_name_prefix="pinecone-query",
+                )
+            return self._query_executor
+
+    def place_embeddings(
+        self, place_ids: List[str], namespaces: Optional[List[str]] = None
+    ) -> Dict[str, List[float]]:
+        """Place vectors by place_id, from the local cache or fetched from Pinecone.
+
+        Misses are fetched in batches from each namespace in turn until all are found;
+        ids unknown to the index are left out of the result.
+        """
+        found: Dict[str, List[float]] = {}
+        missing: List[str] = []
+        for place_id in dict.fromkeys(place_ids):
+            encoded = self._place_vector_cache.get(place_id)
+            if encoded is None:
+                missing.append(place_id)
+            else:
+                found[place_id] = decode_vector(encoded)
+        if not missing:
+            return found
+
+        for namespace in self._query_namespaces(namespaces):
+            for start in range(0, len(missing), PLACE_FETCH_BATCH_SIZE):
+                ids = missing[start:start + PLACE_FETCH_BATCH_SIZE]
+                fetched = _fetched_vectors(self._with_pinecone(
+                    lambda index, ids=ids, namespace=namespace: index.fetch(
+                        ids=ids, **_namespace_kwargs(namespace)
                     )
-                ]
-            )
+                ))
+                for place_id, vector in fetched.items():
+                    values = _vector_values(vector)
+                    if values:
+                        found[place_id] = values
+                        self._place_vector_cache.set(
+                            place_id, encode_vector(values, self.embedding_cache_format)
+                        )
+            missing = [place_id for place_id in missing if place_id not in found]
+            if not missing:
+                break
+        return found
+
+    def _rescore_full(
+        self, vector: List[float], hits: List[Dict[str, Any]], namespace: str
+    ) -> List[Dict[str, Any]]:
+        """Replace first-stage scores with full-dimension cosine; hits missing there are dropped."""
+        if not hits:
+            return hits
+        ids = [h["id"] for h in hits]
+        vectors = _fetched_vectors(
+            self._with_pinecone(lambda index: index.fetch(ids=ids, **_namespace_kwargs(namespace)))
+        )
+        kept = [h for h in hits if h["id"] in vectors]
+        if not kept:
+            return []
+        matrix = np.asarray([_vector_values(vectors[h["id"]]) for h in kept], dtype=np.float32)
+        query = np.asarray(vector, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        norms[norms == 0] = 1.0
+        scores = (matrix @ query) / norms
+        for hit, score in zip(kept, scores):
+            hit["score"] = float(score)
+        return kept
+
+    def evaluate_two_stage(
+        self,
+        vectors: List[List[float]],
+        top_k: int = 10,
+        shortlist_factor: Optional[int] = None,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, float]:
+        """recall@k, latency and Pinecone round trips of two-stage search against the
+        full-dimension baseline.
 
-        logger.info(f"Vector upserted for place: {place_data.get('name')}")
+        Bypasses the result cache so both modes hit Pinecone for every vector. Two-stage
+        search makes two round trips per namespace (first-stage query, then a fetch of the
+        shortlist for rescoring) where the baseline makes one.
+        """
+        if not self.first_stage_dim:
+            raise ValueError("Two-stage search needs RAG_FIRST_STAGE_DIM to be set")
+        shortlist_factor = shortlist_factor or self.shortlist_factor
+        targets = self._query_namespaces(None)
+        recalls: List[float] = []
+        timings = {"full": 0.0, "two_stage": 0.0}
+        for vector in vectors:
+            started = time.perf_counter()
+            full = self._search_vectors(vector, top_k, filter, self.chunk_pooling, targets, False, shortlist_factor)
+            timings["full"] += time.perf_counter() - started
+            started = time.perf_counter()
+            fast = self._search_vectors(vector, top_k, filter, self.chunk_pooling, targets, True, shortlist_factor)
+            timings["two_stage"] += time.perf_counter() - started
+            recalls.append(recall_at_k([m["id"] for m in full], [m["id"] for m in fast], top_k))
+        n = max(1, len(vectors))
+        return {
+            "queries": float(len(vectors)),
+            "top_k": float(top_k),
+            "first_stage_dim": float(self.first_stage_dim),
+            "shortlist_factor": float(shortlist_factor),
+            "recall_at_k": sum(recalls) / n,
+            "full_ms": 1000.0 * timings["full"] / n,
+            "two_stage_ms": 1000.0 * timings["two_stage"] / n,
+            "full_round_trips": float(len(targets)),
+            "two_stage_round_trips": float(2 * len(targets)),
+        }
 
-    def query_similar_places(self, query_text: str, top_k: int = 5) -> Any:
-        """Encode the query and perform Pinecone vector search."""
-        response = self.openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=query_text,
-            encoding_format="float"
+    def expand_from_graph(
+        self,
+        seed_place_ids: List[str],
+        limit: int = 20,
+        radius_km: float = 1.0,
+        per_relation_limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        """Pull places related to the seeds through the knowledge graph in one round trip.
+
+        Related means sharing a non-generic type, sharing a reviewer, or lying within
+        `radius_km`. Each place gets a `graph_score` (relation strengths weighted by
+        GRAPH_RELATION_WEIGHTS) and the per-relation `reasons`. Results are cached until
+        the next KG write.
+        """
+        seeds = sorted({pid for pid in seed_place_ids if pid})
+        if not seeds:
+            return []
+        key = (tuple(seeds), limit, radius_km, per_relation_limit)
+        cached = self._graph_cache.get(key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+
+        self.connect_neo4j()
+        params = {
+            "seed_ids": seeds,
+            "generic_types": list(GENERIC_PLACE_TYPES),
+            "radius_m": radius_km * 1000.0,
+            "per_relation_limit": per_relation_limit,
+        }
+        rows = self._with_neo4j(lambda driver: self.cypher.read(driver, "graph.expand", params))
+
+        related: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            entry = related.setdefault(row["place_id"], {
+                "place_id": row["place_id"],
+                "name": row["name"],
+                "address": row["address"],
+                "rating": row["rating"],
+                "graph_score": 0.0,
+                "reasons": {},
+            })
+            entry["reasons"][row["reason"]] = entry["reasons"].get(row["reason"], 0) + row["strength"]
+            entry["graph_score"] += GRAPH_RELATION_WEIGHTS.get(row["reason"], 1.0) * row["strength"]
+        result = sorted(related.values(), key=lambda e: e["graph_score"], reverse=True)[:limit]
+        for entry in result:
+            entry["graph_score"] = round(entry["graph_score"], 3)
+        self._graph_cache.set(key, result)
+        return copy.deepcopy(result)
+
+    def lexical_search(
+        self,
+        query_text: str,
+        top_k: int = 5,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """BM25 search over locally indexed places; no remote calls."""
+        predicate = (lambda _id, md: metadata_matches(filter, md)) if filter else None
+        hits = self._lexical_index.search(query_text, top_k, predicate)
+        return [
+            {"id": doc_id, "bm25_score": round(score, 4), "metadata": self._lexical_index.metadata(doc_id)}
+            for doc_id, score in hits
+        ]
+
+    def hybrid_query(
+        self,
+        query_text: str,
+        top_k: int = 5,
+        filter: Optional[Dict[str, Any]] = None,
+        candidate_k: Optional[int] = None,
+        rrf_k: int = 60,
+        namespaces: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """Fuse BM25 and vector rankings with reciprocal rank fusion.
+
+        Each side retrieves `candidate_k` results (default 4 x top_k, at least 20). Matches keep
+        the cosine `score` when the vector side found them and add `bm25_score` / `fused_score`.
+        """
+        candidate_k = candidate_k or max(top_k * 4, 20)
+        vector_matches = self.query_similar_places(query_text, candidate_k, filter, namespaces)["matches"]
+        lexical_matches = self.lexical_search(query_text, candidate_k, filter)
+
+        by_id: Dict[str, Dict[str, Any]] = {}
+        for m in lexical_matches:
+            by_id[m["id"]] = dict(m)
+        for m in vector_matches:
+            merged = by_id.setdefault(m["id"], {"id": m["id"]})
+            merged["score"] = m["score"]
+            merged["metadata"] = m["metadata"] or merged.get("metadata", {})
+
+        fused = reciprocal_rank_fusion(
+            [[m["id"] for m in vector_matches], [m["id"] for m in lexical_matches]], k=rrf_k
         )
-        query_embedding = response.data[0].embedding
-        
-        if not self._pinecone_index:
+        matches = []
+        for doc_id, fused_score in fused[:top_k]:
+            match = by_id[doc_id]
+            match["fused_score"] = round(fused_score, 6)
+            matches.append(match)
+        return {"matches": matches}
+
+    def write_batch(self, places: List[Dict[str, Any]]) -> None:
+        """Synchronously write one normalized batch to Neo4j, Pinecone and the lexical index."""
+        self.connect_neo4j()
+        self.connect_pinecone()
+        self.create_knowledge_graph_batch(places)
+        self.create_embeddings_batch(places)
+        self.save_local_indexes(force=False)
+
+    def _open_ingest_queue(self, create: bool) -> Optional[IngestQueue]:
+        """The durable queue, opened once; without `create` only if its file already exists."""
+        with self._connect_lock:
+            if self._ingest_queue is None and (create or os.path.exists(self.ingest_queue_path)):
+                self._ingest_queue = IngestQueue(self.ingest_queue_path)
+            return self._ingest_queue
+
+    def _start_ingest_worker(self) -> IngestWorker:
+        with self._connect_lock:
+            if self._ingest_worker is None:
+                self._ingest_worker = IngestWorker(
+                    self._ingest_queue, self.write_batch, on_idle=self.save_local_indexes
+                )
+            self._ingest_worker.start()
+            return self._ingest_worker
+
+    def resume_ingestion(self) -> int:
+        """Start draining batches a previous process left pending; returns how many there are.
+
+        Call this once at tool or server startup. Workers in several processes may share a
+        queue: each batch is leased to one of them at a time.
+        """
+        try:
+            queue = self._open_ingest_queue(create=False)
+            pending = queue.depth()["pending"] if queue is not None else 0
+        except Exception as e:
+            logger.warning(f"Could not open ingest queue {self.ingest_queue_path}: {e}")
+            return 0
+        if pending:
+            logger.info(f"Resuming background ingestion of {pending} pending batch(es)")
+            self._start_ingest_worker()
+        return pending
+
+    def enqueue_places(self, places: List[Dict[str, Any]]) -> int:
+        """Queue a normalized batch for the background writer and return immediately."""
+        queue = self._open_ingest_queue(create=True)
+        worker = self._start_ingest_worker()
+        batch_id = queue.put(places)
+        worker.notify()
+        return batch_id
+
+    def ingestion_status(self) -> Dict[str, int]:
+        """Counts of queued ('pending'), leased to a writer ('inflight') and abandoned ('dead')
+        background batches, including those left by an earlier process."""
+        queue = self._open_ingest_queue(create=False)
+        if queue is None:
+            return {"pending": 0, "inflight": 0, "dead": 0}
+        return queue.depth()
+
+    def ingest_places(
+        self,
+        items: Iterable[Any],
+        batch_size: int = 100,
+        dry_run: bool = False,
+        on_batch: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+        background: bool = False,
+    ) -> Dict[str, int]:
+        """Normalize raw place records and write them to Neo4j and Pinecone in batches.
+
+        `items` may be any iterable, including a lazy stream from iter_json_items, so
+        memory stays bounded by one batch. `on_batch` is called with each normalized batch
+        after it has been written (or skipped, when dry_run is set). With `background`,
+        batches are handed to the write-behind queue instead of being written inline.
+        """
+        stats = {"seen": 0, "normalized": 0, "batches": 0}
+        sync_writes = not dry_run and not background
+        if sync_writes:
+            self.connect_neo4j()
             self.connect_pinecone()
-        return self._pinecone_index.query(
-            vector=query_embedding, top_k=top_k, include_metadata=True
-        )
 
+        batch: List[Dict[str, Any]] = []
+
+        def flush() -> None:
+            nonlocal batch
+            if not batch:
+                return
+            if sync_writes:
+                self.create_knowledge_graph_batch(batch)
+                self.create_embeddings_batch(batch)
+            elif background and not dry_run:
+                self.enqueue_places(batch)
+            stats["batches"] += 1
+            if on_batch is not None:
+                on_batch(batch)
+            batch = []
+
+        for raw in items:
+            stats["seen"] += 1
+            doc = self._normalize_place(raw)
+            if not doc:
+                continue
+            stats["normalized"] += 1
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+        if sync_writes:
+            self.save_local_indexes()
+        return stats
+
+    def save_local_indexes(self, force: bool = True) -> None:
+        """Persist the BM25 index and rating priors, if changed, when their paths are configured.
+
+        Without `force`, each is only rewritten once its save interval
+        (lexical_index_save_interval, rating_priors_save_interval) has passed since its last save.
+        """
+        if self.lexical_index_path:
+            interval = 0.0 if force else self.lexical_index_save_interval
+            self._lexical_index.save_if_due(self.lexical_index_path, interval)
+        if self.rating_priors_path:
+            interval = 0.0 if force else self.rating_priors_save_interval
+            self.rating_priors.save_if_due(self.rating_priors_path, interval)
+
+    def neo4j_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Latency histogram, error and retry counts per named Cypher statement."""
+        return self.cypher.stats()
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            "query_embeddings": self._query_embedding_cache.stats(),
+            "place_vectors": self._place_vector_cache.stats(),
+            "query_results": self._query_result_cache.stats(),
+        }
+
+
+# One round trip: every seed fans out over types, reviewers and proximity via UNION subqueries
+GRAPH_EXPANSION_CYPHER = """
+UNWIND $seed_ids AS seed_id
+MATCH (s:Place {place_id: seed_id})
+CALL {
+    WITH s
+    MATCH (s)-[:HAS_TYPE]->(t:Type)<-[:HAS_TYPE]-(o:Place)
+    WHERE NOT t.name IN $generic_types AND NOT o.place_id IN $seed_ids
+    WITH o, count(t) AS strength
+    ORDER BY strength DESC LIMIT $per_relation_limit
+    RETURN o, 'shared_type' AS reason, strength
+    UNION
+    WITH s
+    MATCH (s)<-[:REVIEWS]-(r1:Review)
+    WHERE r1.author_name IS NOT NULL
+    MATCH (r2:Review {author_name: r1.author_name})-[:REVIEWS]->(o:Place)
+    WHERE NOT o.place_id IN $seed_ids
+    WITH o, count(DISTINCT r2) AS strength
+    ORDER BY strength DESC LIMIT $per_relation_limit
+    RETURN o, 'shared_reviewer' AS reason, strength
+    UNION
+    WITH s
+    MATCH (o:Place)
+    WHERE s.location IS NOT NULL
+      AND point.distance(o.location, s.location) <= $radius_m
+      AND NOT o.place_id IN $seed_ids
+    WITH o LIMIT $per_relation_limit
+    RETURN o, 'nearby' AS reason, 1 AS strength
+}
+RETURN o.place_id AS place_id, o.name AS name, o.address AS address, o.rating AS rating,
+       reason, strength
+"""
+
+
+UPSERT_PLACES_CYPHER = """
+UNWIND $rows AS row
+MERGE (p:Place {place_id: row.place_id})
+SET p.name = row.name,
+    p.address = row.address,
+    p.rating = row.rating,
+    p.types = row.types,
+    p.location = CASE WHEN row.lat IS NULL THEN null
+                      ELSE point({latitude: row.lat, longitude: row.lng}) END
+WITH p, row
+OPTIONAL MATCH (p)-[old:HAS_TYPE]->(:Type)
+DELETE old
+WITH DISTINCT p, row
+UNWIND row.types AS type_name
+MERGE (t:Type {name: type_name})
+MERGE (p)-[:HAS_TYPE]->(t)
+"""
+
+DELETE_REVIEWS_CYPHER = """
+MATCH (rv:Review)-[:REVIEWS]->(p:Place)
+WHERE p.place_id IN $place_ids
+DETACH DELETE rv
+"""
+
+CREATE_REVIEWS_CYPHER = """
+UNWIND $reviews AS r
+MATCH (p:Place {place_id: r.place_id})
+CREATE (rv:Review {
+    author_name: r.author_name,
+    rating: r.rating,
+    text: r.text,
+    time: r.time
+})
+CREATE (rv)-[:REVIEWS]->(p)
+"""
 
-# Singleton instance for tool functions
+CYPHER_STATEMENTS = CypherRegistry()
+CYPHER_STATEMENTS.register("graph.expand", GRAPH_EXPANSION_CYPHER, READ)
+CYPHER_STATEMENTS.register("kg.upsert_places", UPSERT_PLACES_CYPHER, WRITE)
+CYPHER_STATEMENTS.register("kg.delete_reviews", DELETE_REVIEWS_CYPHER, WRITE)
+CYPHER_STATEMENTS.register("kg.create_reviews", CREATE_REVIEWS_CYPHER, WRITE)
+SCHEMA_STATEMENT_NAMES = tuple(
+    CYPHER_STATEMENTS.register(f"schema.{name}", statement, WRITE).name
+    for name, statement in GRAPH_SCHEMA_STATEMENTS.items()
+)
+
+
+def _place_city(place: Dict[str, Any]) -> Optional[str]:
+    if place.get("city"):
+        return str(place["city"])
+    for comp in place.get("addressComponents") or []:
+        if "locality" in (comp.get("types") or []):
+            return comp.get("longText") or comp.get("long_name")
+    return None
+
+
+def _place_metadata(place: Dict[str, Any]) -> Dict[str, Any]:
+    """Vector metadata for a place, including the fields used by filtered queries.
+
+    Pinecone rejects null metadata values, so missing fields are simply omitted.
+    """
+    metadata: Dict[str, Any] = {
+        "place_id": place["place_id"],
+        "name": place.get("name"),
+        "address": place.get("formatted_address", ""),
+        "rating": place.get("rating", 0.0),
+    }
+    types = place.get("types") or []
+    if types:
+        metadata["types"] = [str(t) for t in types]
+    price = place.get("priceLevel") or place.get("price_level")
+    if price in PRICE_LEVEL_RANK:
+        metadata["price_level"] = PRICE_LEVEL_RANK[price]
+    city = _place_city(place)
+    if city:
+        metadata["city"] = city.lower()
+    region = place_region(place)
+    if region:
+        metadata["region"] = region.lower()
+    coords = place_lat_lng(place)
+    if coords:
+        lat, lng = coords
+        geohash = geohash_encode(lat, lng, precision=9)
+        metadata["lat"] = lat
+        metadata["lng"] = lng
+        metadata["geohash"] = geohash
+        metadata["geohash_prefixes"] = [geohash[:n] for n in GEOHASH_PREFIX_LENGTHS]
+    return {k: v for k, v in metadata.items() if v is not None}
+
+
+def build_place_filter(
+    place_ids: Optional[List[str]] = None,
+    bbox: Optional[BBox] = None,
+    geohash_prefix: Optional[str] = None,
+    city: Optional[str] = None,
+    max_price: Optional[str] = None,
+    types: Optional[List[str]] = None,
+) -> Optional[Dict[str, Any]]:
+    """Compile candidate-scoping options into a Pinecone metadata filter.
+
+    Args:
+        place_ids: Only score these places (e.g. the current candidate set)
+        bbox: (south, west, north, east) in degrees
+        geohash_prefix: Restrict to a geohash cell; lengths in GEOHASH_PREFIX_LENGTHS use the
+            stored prefix list, any other length is converted to the cell's bounding box
+        city: Locality name (case-insensitive)
+        max_price: Highest allowed Places price level, e.g. "PRICE_LEVEL_MODERATE"
+        types: Match places having at least one of these types
+
+    Returns:
+        A filter dict, or None when nothing was requested
+    """
+    clauses: List[Dict[str, Any]] = []
+    if place_ids:
+        clauses.append({"place_id": {"$in": list(place_ids)}})
+    if geohash_prefix:
+        prefix = geohash_prefix.lower()
+        if len(prefix) in GEOHASH_PREFIX_LENGTHS:
+            clauses.append({"geohash_prefixes": {"$in": [prefix]}})
+        else:
+            bbox = _intersect_bbox(bbox, geohash_bbox(prefix))
+    if bbox:
+        south, west, north, east = bbox
+        clauses.append({"lat": {"$gte": south, "$lte": north}})
+        clauses.append({"lng": {"$gte": west, "$lte": east}})
+    if city:
+        clauses.append({"city": {"$eq": city.lower()}})
+    if max_price:
+        if max_price not in PRICE_LEVEL_RANK:
+            raise ValueError(f"Unknown price level: {max_price}")
+        clauses.append({"price_level": {"$lte": PRICE_LEVEL_RANK[max_price]}})
+    if types:
+        clauses.append({"types": {"$in": list(types)}})
+
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+def metadata_matches(filter: Optional[Dict[str, Any]], metadata: Dict[str, Any]) -> bool:
+    """Evaluate a filter produced by build_place_filter against a local metadata dict."""
+    if not filter:
+        return True
+    for field, cond in filter.items():
+        if field == "$and":
+            if not all(metadata_matches(sub, metadata) for sub in cond):
+                return False
+            continue
+        value = metadata.get(field)
+        for op, operand in cond.items():
+            if value is None:
+                return False
+            values = value if isinstance(value, list) else [value]
+            if op == "$in" and not any(v in operand for v in values):
+                return False
+            if op == "$eq" and operand not in values:
+                return False
+            if op == "$gte" and not value >= operand:
+                return False
+            if op == "$lte" and not value <= operand:
+                return False
+    return True
+
+
+def _intersect_bbox(a: Optional[BBox], b: BBox) -> BBox:
+    if a is None:
+        return b
+    return (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+
+
+def _pool_chunk_matches(matches: List[Dict[str, Any]], pooling: str = "max") -> List[Dict[str, Any]]:
+    """Collapse review-chunk hits onto their place, pooling scores; best place first.
+
+    Place-level vectors count as one more hit for their place, so indexes that hold only
+    place vectors come back unchanged.
+    """
+    grouped: Dict[str, Dict[str, Any]] = {}
+    scores: Dict[str, List[float]] = {}
+    from_place_vector = set()
+    for match in matches:
+        metadata = match.get("metadata") or {}
+        place_id = metadata.get("place_id") or match["id"]
+        is_chunk = metadata.get("kind") == "review"
+        if place_id not in grouped or (not is_chunk and place_id not in from_place_vector):
+            # Prefer the place vector's metadata when both were hit
+            place_metadata = {
+                k: v for k, v in metadata.items() if k not in ("kind", "chunk", "review_chunks")
+            }
+            grouped[place_id] = {"id": place_id, "metadata": place_metadata}
+            if not is_chunk:
+                from_place_vector.add(place_id)
+        scores.setdefault(place_id, []).append(float(match.get("score") or 0.0))
+
+    pooled = []
+    for place_id, entry in grouped.items():
+        hits = scores[place_id]
+        entry["score"] = max(hits) if pooling == "max" else sum(hits) / len(hits)
+        if len(hits) > 1:
+            entry["chunk_hits"] = len(hits)
+        pooled.append(entry)
+    pooled.sort(key=lambda m: m["score"], reverse=True)
+    return pooled
+
+
+def _namespace_kwargs(namespace: str) -> Dict[str, Any]:
+    # Omit the argument for the default namespace so un-routed calls stay unchanged
+    return {"namespace": namespace} if namespace else {}
+
+
+def _fetched_vectors(response: Any) -> Dict[str, Any]:
+    vectors = getattr(response, "vectors", None)
+    if vectors is None and isinstance(response, dict):
+        vectors = response.get("vectors")
+    return dict(vectors or {})
+
+
+def _vector_metadata(vector: Any) -> Dict[str, Any]:
+    if isinstance(vector, dict):
+        return dict(vector.get("metadata") or {})
+    return dict(getattr(vector, "metadata", None) or {})
+
+
+def _record_id(record: Any) -> str:
+    # Upsert records are dicts for the current SDK and (id, values, metadata) tuples for legacy
+    return record["id"] if isinstance(record, dict) else record[0]
+
+
+def _vector_values(vector: Any) -> List[float]:
+    if isinstance(vector, dict):
+        return list(vector.get("values") or [])
+    return list(getattr(vector, "values", None) or [])
+
+
+def _vector_digest(vector: List[float]) -> str:
+    """Stable hash of a float vector, used as a cache key."""
+    return hashlib.blake2b(array("d", vector).tobytes(), digest_size=16).hexdigest()
+
+
+def _response_matches(results: Any) -> List[Any]:
+    if hasattr(results, "matches"):
+        return list(results.matches or [])
+    return list(results.get("matches", []) or [])
+
+
+def _match_to_dict(match: Any) -> Dict[str, Any]:
+    """Convert a Pinecone match (object or dict) into a plain, serializable dict."""
+    if isinstance(match, dict):
+        return {
+            "id": match.get("id"),
+            "score": match.get("score"),
+            "metadata": dict(match.get("metadata") or {}),
+        }
+    return {
+        "id": getattr(match, "id", None),
+        "score": getattr(match, "score", None),
+        "metadata": dict(getattr(match, "metadata", None) or {}),
+    }
+
+
+# Singleton instance for tool functions; owns the long-lived Neo4j driver and Pinecone handle
 _rag_tools_instance: Optional[RAGTools] = None
+_rag_tools_lock = threading.Lock()
+
 
+def _get_rag_tools(resume_ingestion: bool = True) -> RAGTools:
+    """Get or create a singleton RAGTools instance.
 
-def _get_rag_tools() -> RAGTools:
-    """Get or create a singleton RAGTools instance."""
+    With RAG_INGEST_RESUME=1 the instance starts draining batches left in the ingest queue
+    when it is created, unless `resume_ingestion` is False (e.g. in backfill workers).
+    """
     global _rag_tools_instance
     if _rag_tools_instance is None:
-        _rag_tools_instance = RAGTools()
+        with _rag_tools_lock:
+            if _rag_tools_instance is None:
+                _rag_tools_instance = RAGTools()
+                atexit.register(_rag_tools_instance.close)
+                if resume_ingestion and os.getenv("RAG_INGEST_RESUME", "0").lower() in ("1", "true"):
+                    _rag_tools_instance.resume_ingestion()
     return _rag_tools_instance
 
 
+def _ingest_batch_size() -> int:
+    return int(os.getenv("RAG_INGEST_BATCH_SIZE", "50"))
+
+
+def _should_stream(json_file_path: str) -> bool:
+    """Large files on disk are streamed instead of being loaded whole."""
+    if len(json_file_path) > 4096 or json_file_path.lstrip()[:1] in ("[", "{"):
+        return False
+    threshold = int(os.getenv("RAG_STREAM_THRESHOLD_BYTES", str(16 * 1024 * 1024)))
+    try:
+        path = os.path.normpath(json_file_path)
+        return os.path.isfile(path) and os.path.getsize(path) >= threshold
+    except (OSError, ValueError):
+        return False
+
+
 @tool("process_places_data")
-def process_places_data(json_file_path: str, dry_run: bool = False) -> str:
+def process_places_data(
+    json_file_path: str,
+    dry_run: bool = False,
+    stream: bool = False,
+    background: bool = False,
+) -> str:
     """
     End-to-end processing: load JSON, normalize, optionally connect, and upsert to Neo4j and Pinecone.
     
     Args:
         json_file_path: Path to the JSON file containing places data OR a JSON string
         dry_run: If True, only parse and normalize without connecting to external services
+        stream: If True, read the file incrementally and write in batches; enabled
+                automatically for files above RAG_STREAM_THRESHOLD_BYTES
+        background: If True, queue the KG/vector writes for a background worker and return
+                    as soon as the data is normalized
     
     Returns:
-        A JSON string containing the processed places data
+        A JSON string containing the processed places data, or a summary with a small
+        sample when the file was streamed
     """
     rag_tools = _get_rag_tools()
+
+    if stream or _should_stream(json_file_path):
+        sample: List[Dict[str, Any]] = []
+
+        def keep_sample(batch: List[Dict[str, Any]]) -> None:
+            if len(sample) < 5:
+                sample.extend(batch[: 5 - len(sample)])
+
+        try:
+            stats = rag_tools.ingest_places(
+                iter_json_items(json_file_path),
+                _ingest_batch_size(),
+                dry_run,
+                on_batch=keep_sample,
+                background=background,
+            )
+        except (OSError, ValueError) as e:
+            return json.dumps({
+                "error": f"Failed to stream data: {type(e).__name__}({str(e)})",
+                "suggestion": "Streaming expects a file with a top-level list or a 'results' array"
+            }, ensure_ascii=False, indent=2)
+        logger.info(f"Streamed {stats['normalized']} places in {stats['batches']} batch(es)")
+        return json.dumps({"streamed": True, **stats, "sample": sample}, ensure_ascii=False, indent=2)
     
     # Try to parse as JSON string first, then as file path
     try:
@@ -319,52 +1566,278 @@ def process_places_data(json_file_path: str, dry_run: bool = False) -> str:
     else:
         items = []
 
-    normalized = []
-    for raw in items:
-        doc = rag_tools._normalize_place(raw)
-        if doc:
-            normalized.append(doc)
-
-    if not dry_run:
-        rag_tools.connect_neo4j()
-        rag_tools.connect_pinecone()
-        for place in normalized:
-            rag_tools.create_knowledge_graph(place)
-            rag_tools.create_embeddings(place)
-        logger.info("Finished processing places JSON: KG + embeddings upserted")
-    else:
+    normalized: List[Dict[str, Any]] = []
+    rag_tools.ingest_places(
+        items, _ingest_batch_size(), dry_run, on_batch=normalized.extend, background=background
+    )
+
+    if dry_run:
         logger.info(f"Dry run: would process {len(normalized)} places (no external connections)")
+    elif background:
+        logger.info(f"Queued {len(normalized)} places for background KG + embedding writes")
+    else:
+        logger.info("Finished processing places JSON: KG + embeddings upserted")
 
     return json.dumps(normalized, ensure_ascii=False, indent=2)
 
 
 @tool("query_similar_places")
-def query_similar_places_tool(query_text: str, top_k: int = 5) -> str:
+def query_similar_places_tool(
+    query_text: str,
+    top_k: int = 5,
+    place_ids: Optional[List[str]] = None,
+    bbox: Optional[List[float]] = None,
+    geohash_prefix: Optional[str] = None,
+    city: Optional[str] = None,
+    max_price: Optional[str] = None,
+    types: Optional[List[str]] = None,
+    region: Optional[str] = None,
+    mode: str = "vector",
+) -> str:
     """
     Search for similar places using vector similarity search in Pinecone.
     
+    Use mode="hybrid" when the query names specific dishes or cuisines (e.g. "laksa",
+    "omakase"): it fuses local BM25 keyword matches with the vector results.
+    
     Args:
         query_text: The search query text to find similar places
         top_k: Number of top similar places to return (default: 5)
+        place_ids: Optional allow-list, e.g. the place_ids of the current candidate set
+        bbox: Optional [south, west, north, east] bounding box in degrees
+        geohash_prefix: Optional geohash cell the places must fall in
+        city: Optional city/locality name
+        max_price: Optional highest price level, e.g. "PRICE_LEVEL_MODERATE"
+        types: Optional place types, at least one must match
+        region: Optional ISO country code (e.g. "SG"); narrows the searched index namespaces
+        mode: "vector" (default) or "hybrid" (BM25 + vector, reciprocal rank fusion)
     
     Returns:
         A JSON string containing the search results with similar places and their metadata
     """
+    if mode not in ("vector", "hybrid"):
+        return json.dumps({"error": f"Unknown mode: {mode}", "matches": []}, ensure_ascii=False, indent=2)
+    try:
+        filter = _filter_from_args(place_ids, bbox, geohash_prefix, city, max_price, types)
+    except ValueError as e:
+        return json.dumps({"error": str(e), "matches": []}, ensure_ascii=False, indent=2)
+
+    # RAGTools connects lazily on first use and reconnects on failure
     rag_tools = _get_rag_tools()
-    rag_tools.connect_pinecone()
+    namespaces = _namespaces_from_args(rag_tools, bbox, geohash_prefix, region)
+    if mode == "hybrid":
+        results = rag_tools.hybrid_query(query_text, top_k, filter, namespaces=namespaces)
+    else:
+        results = rag_tools.query_similar_places(query_text, top_k, filter, namespaces)
     
-    results = rag_tools.query_similar_places(query_text, top_k)
+    # Results are already plain dicts (and may come from the in-process cache)
+    output = {"matches": results["matches"]}
     
-    # Convert Pinecone results to a serializable format
-    output = {
-        "matches": [
-            {
-                "id": match.id if hasattr(match, "id") else match.get("id"),
-                "score": match.score if hasattr(match, "score") else match.get("score"),
-                "metadata": match.metadata if hasattr(match, "metadata") else match.get("metadata", {})
-            }
-            for match in (results.matches if hasattr(results, "matches") else results.get("matches", []))
-        ]
-    }
+    return json.dumps(output, ensure_ascii=False, indent=2)
+
+
+@tool("query_similar_places_by_vector")
+def query_similar_places_by_vector_tool(
+    embedding: Optional[List[float]] = None,
+    profile_embedding: Optional[List[float]] = None,
+    intent_embedding: Optional[List[float]] = None,
+    alpha: float = 0.5,
+    top_k: int = 5,
+    place_ids: Optional[List[str]] = None,
+    bbox: Optional[List[float]] = None,
+    geohash_prefix: Optional[str] = None,
+    region: Optional[str] = None,
+) -> str:
+    """
+    Search for similar places with a precomputed embedding instead of query text.
+    
+    Args:
+        embedding: A ready-made query vector (e.g. the user profile embedding)
+        profile_embedding: Long-term taste vector, fused with intent_embedding when embedding is omitted
+        intent_embedding: Current-request vector, fused with profile_embedding when embedding is omitted
+        alpha: Weight of profile_embedding in the fusion (default: 0.5)
+        top_k: Number of top similar places to return (default: 5)
+        place_ids: Optional allow-list, e.g. the place_ids of the current candidate set
+        bbox: Optional [south, west, north, east] bounding box in degrees
+        geohash_prefix: Optional geohash cell the places must fall in
+        region: Optional ISO country code (e.g. "SG"); narrows the searched index namespaces
+    
+    Returns:
+        A JSON string with the same shape as query_similar_places, or an "error" field
+    """
+    if not embedding:
+        if not (profile_embedding and intent_embedding):
+            return json.dumps({
+                "error": "Provide embedding, or both profile_embedding and intent_embedding",
+                "matches": [],
+            }, ensure_ascii=False, indent=2)
+        from whats_eat.tools.user_profile import fuse_embeddings
+
+        fused = fuse_embeddings.invoke({
+            "profile_embedding": profile_embedding,
+            "intent_embedding": intent_embedding,
+            "alpha": alpha,
+        })
+        if fused.get("error"):
+            return json.dumps({"error": fused["error"], "matches": []}, ensure_ascii=False, indent=2)
+        embedding = fused["embedding"]
+
+    rag_tools = _get_rag_tools()
+    try:
+        filter = _filter_from_args(place_ids, bbox, geohash_prefix)
+        namespaces = _namespaces_from_args(rag_tools, bbox, geohash_prefix, region)
+        results = rag_tools.query_by_vector(embedding, top_k, filter, namespaces=namespaces)
+    except ValueError as e:
+        return json.dumps({"error": str(e), "matches": []}, ensure_ascii=False, indent=2)
+
+    return json.dumps({"matches": results["matches"]}, ensure_ascii=False, indent=2)
+
+
+@tool("expand_related_places")
+def expand_related_places_tool(place_ids: List[str], limit: int = 20, radius_km: float = 1.0) -> str:
+    """
+    Find places related to the given seeds through the Neo4j knowledge graph.
+    
+    Args:
+        place_ids: Seed place_ids, typically the top vector search matches
+        limit: Maximum number of related places to return (default: 20)
+        radius_km: Distance within which places count as nearby (default: 1.0)
     
-    return json.dumps(output, ensure_ascii=False, indent=2)
\ No newline at end of file
+    Returns:
+        A JSON string {"related": [...]} where each place has graph_score and reasons
+        (shared_type / shared_reviewer / nearby counts), or an "error" field
+    """
+    rag_tools = _get_rag_tools()
+    try:
+        related = rag_tools.expand_from_graph(place_ids, limit=limit, radius_km=radius_km)
+    except Exception as e:
+        return json.dumps({
+            "error": f"Graph expansion failed: {type(e).__name__}({str(e)})",
+            "related": [],
+        }, ensure_ascii=False, indent=2)
+    return json.dumps({"related": related}, ensure_ascii=False, indent=2)
+
+
+def _filter_from_args(
+    place_ids: Optional[List[str]] = None,
+    bbox: Optional[List[float]] = None,
+    geohash_prefix: Optional[str] = None,
+    city: Optional[str] = None,
+    max_price: Optional[str] = None,
+    types: Optional[List[str]] = None,
+) -> Optional[Dict[str, Any]]:
+    if bbox is not None and len(bbox) != 4:
+        raise ValueError("bbox must be [south, west, north, east]")
+    return build_place_filter(
+        place_ids=place_ids,
+        bbox=tuple(bbox) if bbox else None,  # type: ignore[arg-type]
+        geohash_prefix=geohash_prefix,
+        city=city,
+        max_price=max_price,
+        types=types,
+    )
+
+
+def _namespaces_from_args(
+    rag_tools: RAGTools,
+    bbox: Optional[List[float]] = None,
+    geohash_prefix: Optional[str] = None,
+    region: Optional[str] = None,
+) -> Optional[List[str]]:
+    return rag_tools.namespace_router.route(
+        bbox=tuple(bbox) if bbox else None,  # type: ignore[arg-type]
+        geohash_prefix=geohash_prefix,
+        region=region,
+    )
+
+
+# --- Small CLI: python -m whats_eat.tools.RAG backfill <dir> ---
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="RAG knowledge base maintenance")
+    subparsers = parser.add_subparsers(dest="command")
+
+    backfill_parser = subparsers.add_parser(
+        "backfill", help="Bulk-load a directory of Places JSON dumps into Neo4j and Pinecone"
+    )
+    backfill_parser.add_argument("directory", help="Directory containing Places JSON dumps")
+    backfill_parser.add_argument("--pattern", default="*.json", help="Glob for dump files (default: *.json)")
+    backfill_parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: min(4, CPUs))")
+    backfill_parser.add_argument("--batch-size", type=int, default=_ingest_batch_size(), help="Places per write batch")
+    backfill_parser.add_argument("--checkpoint-dir", default=None, help="Checkpoint directory (default: <directory>/.backfill)")
+    backfill_parser.add_argument("--dry-run", action="store_true", help="Parse and normalize only (no credentials needed)")
+    backfill_parser.add_argument("--restart", action="store_true", help="Ignore existing checkpoints")
+    backfill_parser.add_argument("--save-every", type=int, default=20, help="Batches between saves of the partial BM25 index / priors")
+
+    migrate_parser = subparsers.add_parser(
+        "migrate-namespaces",
+        help="Move existing vectors into the namespaces selected by RAG_NAMESPACE_MODE",
+    )
+    migrate_parser.add_argument("--source", default="", help="Namespace to migrate from (default: the default namespace)")
+    migrate_parser.add_argument("--batch-size", type=int, default=100, help="Vector ids per list/fetch page")
+    migrate_parser.add_argument("--dry-run", action="store_true", help="Report target namespaces without writing")
+
+    eval_parser = subparsers.add_parser(
+        "eval-two-stage", help="Measure recall@k of two-stage search against full-dimension search"
+    )
+    eval_parser.add_argument("queries_file", help="Text file with one query per line")
+    eval_parser.add_argument("--top-k", type=int, default=10, help="k for recall@k")
+    eval_parser.add_argument("--shortlist-factor", type=int, default=None, help="Shortlist size as a multiple of k")
+
+    subparsers.add_parser(
+        "rating-priors", help="Print the rating priors calibrated from RAG_RATING_PRIORS_PATH"
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        from whats_eat.tools.backfill import run_backfill
+
+        summary = run_backfill(
+            args.directory,
+            pattern=args.pattern,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            checkpoint_dir=args.checkpoint_dir,
+            dry_run=args.dry_run,
+            restart=args.restart,
+            save_every=args.save_every,
+        )
+        raise SystemExit(1 if summary["failures"] else 0)
+    elif args.command == "migrate-namespaces":
+        from whats_eat.tools.namespaces import migrate_to_namespaces
+
+        def report(stats: Dict[str, Any]) -> None:
+            print(f"  scanned {stats['scanned']}, moved {stats['moved']}, kept {stats['kept']}")
+
+        summary = migrate_to_namespaces(
+            _get_rag_tools(),
+            source_namespace=args.source,
+            batch_size=args.batch_size,
+            dry_run=args.dry_run,
+            on_batch=report,
+        )
+        for namespace, count in sorted(summary["namespaces"].items()):
+            print(f"  {namespace or '(default)'}: {count}")
+    elif args.command == "eval-two-stage":
+        rag_tools = _get_rag_tools()
+        with open(args.queries_file, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+        report = rag_tools.evaluate_two_stage(
+            rag_tools._embed_many(queries), top_k=args.top_k, shortlist_factor=args.shortlist_factor
+        )
+        for name, value in report.items():
+            print(f"  {name}: {value:.3f}" if isinstance(value, float) else f"  {name}: {value}")
+        print(
+            f"  two-stage makes {report['two_stage_round_trips']:.0f} Pinecone round trip(s) per query "
+            f"(first-stage query + shortlist fetch per namespace) vs {report['full_round_trips']:.0f}; "
+            "any speedup above already pays for the extra fetch"
+        )
+    elif args.command == "rating-priors":
+        store = get_prior_store()
+        print(f"  {len(store)} rated place(s), min {store.min_places} per prior")
+        for key, prior in store.priors().items():
+            print(f"  {key}: C={prior['mean']:.3f} m={prior['count']:.1f} ({prior['places']} places)")
+    else:
+        parser.print_help()
@@ -1,8 +1,13 @@
 from .google_places import places_text_search, places_fetch_photos, places_coordinate_search, place_geocode
 from .user_profile import embed_user_preferences, yt_list_liked_videos, yt_list_subscriptions
 # from .route_map import route_build_map_html
-from .ranking import rank_restaurants_by_profile, filter_by_attributes
-from .RAG import process_places_data,query_similar_places_tool
+from .ranking import rank_restaurants_by_profile, filter_by_attributes, lookup_place_cards
+from .RAG import (
+    process_places_data,
+    query_similar_places_tool,
+    query_similar_places_by_vector_tool,
+    expand_related_places_tool,
+)
 __all__ = [
     "place_geocode",
     "places_coordinate_search",
@@ -14,6 +19,9 @@ __all__ = [
     "embed_user_preferences",
     "rank_restaurants_by_profile",
     "filter_by_attributes",
+    "lookup_place_cards",
     "process_places_data",
-    "query_similar_places_tool"
+    "query_similar_places_tool",
+    "query_similar_places_by_vector_tool",
+    "expand_related_places_tool",
 ]
@@ -0,0 +1,250 @@
+"""
+Offline bulk backfill of the knowledge graph and vector index.
+
+Run through the RAG module entry point:
+
+    python -m whats_eat.tools.RAG backfill path/to/places_dumps --workers 4
+
+Each JSON dump is streamed through `RAGTools.ingest_places` in its own worker process.
+Progress is checkpointed per file after every batch, so an interrupted run resumes at
+the last written batch. Workers also write a partial BM25 index and rating prior store
+that are merged into RAG_LEXICAL_INDEX_PATH and RAG_RATING_PRIORS_PATH at the end,
+keeping hybrid search and rating calibration in sync with the backfill. The partials
+are rewritten only every `save_every` batches and at the end of the file; the
+checkpoint records how far they reach (`indexed_items`), and a resumed run rebuilds
+the missing tail from the dump into the local indexes without writing Neo4j or
+Pinecone again. A dry run only parses and normalizes: it needs no credentials and
+leaves the checkpoints untouched.
+"""
+from __future__ import annotations
+
+import hashlib
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIRNAME = ".backfill"
+
+# Batches between rewrites of a worker's partial BM25 index and rating priors
+SAVE_EVERY_BATCHES = 20
+
+
+def _checkpoint_path(checkpoint_dir: Path, file_path: Path) -> Path:
+    digest = hashlib.sha1(str(file_path.resolve()).encode("utf-8")).hexdigest()[:16]
+    return checkpoint_dir / f"{file_path.stem}-{digest}.json"
+
+
+def _file_signature(file_path: Path) -> Dict[str, Any]:
+    st = file_path.stat()
+    return {"path": str(file_path.resolve()), "size": st.st_size, "mtime": st.st_mtime}
+
+
+def load_checkpoint(checkpoint_dir: Path, file_path: Path) -> Dict[str, Any]:
+    """Checkpoint for `file_path`, reset if the file changed since it was written."""
+    signature = _file_signature(file_path)
+    path = _checkpoint_path(checkpoint_dir, file_path)
+    if path.exists():
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            if all(data.get(k) == v for k, v in signature.items()):
+                return data
+        except (OSError, ValueError):
+            pass
+    return {**signature, "items_done": 0, "places": 0, "complete": False}
+
+
+def _save_checkpoint(checkpoint_dir: Path, file_path: Path, data: Dict[str, Any]) -> None:
+    path = _checkpoint_path(checkpoint_dir, file_path)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def backfill_file(
+    file_path: str,
+    checkpoint_dir: str,
+    batch_size: int = 50,
+    dry_run: bool = False,
+    save_every: int = SAVE_EVERY_BATCHES,
+) -> Dict[str, Any]:
+    """Stream one dump into Neo4j/Pinecone, resuming from its checkpoint. Runs in a worker."""
+    from whats_eat.tools.json_stream import iter_json_items
+    from whats_eat.tools.lexical import BM25Index
+    from whats_eat.tools.rating_priors import RatingPriorStore
+    from whats_eat.tools.RAG import _get_rag_tools, normalize_place
+
+    path = Path(file_path)
+    ckpt_dir = Path(checkpoint_dir)
+    checkpoint = load_checkpoint(ckpt_dir, path)
+    if checkpoint["complete"]:
+        return {"file": file_path, "places": 0, "skipped": True, "seconds": 0.0}
+
+    started = time.perf_counter()
+    if dry_run:
+        items = itertools.islice(iter_json_items(file_path), checkpoint["items_done"], None)
+        places = sum(1 for item in items if normalize_place(item))
+        return {"file": file_path, "places": places, "skipped": False, "seconds": time.perf_counter() - started}
+
+    # Workers only write their own file; draining the shared ingest queue is left to the server
+    rag_tools = _get_rag_tools(resume_ingestion=False)
+    # Workers must not race on the shared lexical index file; each file gets a partial
+    # index that run_backfill merges once all workers are done
+    partial = _checkpoint_path(ckpt_dir, path).with_suffix(".bm25.json")
+    rag_tools.lexical_index_path = str(partial)
+    rag_tools._lexical_index = BM25Index.load(str(partial)) if partial.exists() else BM25Index()
+    partial_priors = _checkpoint_path(ckpt_dir, path).with_suffix(".priors.json")
+    rag_tools.rating_priors_path = str(partial_priors)
+    rag_tools.rating_priors = (
+        RatingPriorStore.load(str(partial_priors)) if partial_priors.exists() else RatingPriorStore()
+    )
+
+    # Places written after the partials were last saved: add them to the local indexes only
+    indexed = checkpoint.get("indexed_items", checkpoint["items_done"])
+    if indexed < checkpoint["items_done"]:
+        gap = itertools.islice(iter_json_items(file_path), indexed, checkpoint["items_done"])
+        while True:
+            raw = list(itertools.islice(gap, batch_size))
+            if not raw:
+                break
+            docs = [doc for doc in map(normalize_place, raw) if doc]
+            if docs:
+                rag_tools.index_places_locally(docs)
+        rag_tools.save_local_indexes()
+        logger.info(f"Rebuilt local indexes for items {indexed}-{checkpoint['items_done']} of {path.name}")
+    checkpoint["indexed_items"] = checkpoint["items_done"]
+
+    consumed = checkpoint["items_done"]
+    batches = 0
+
+    def counted(items: Iterator[Any]) -> Iterator[Any]:
+        nonlocal consumed
+        for item in items:
+            consumed += 1
+            yield item
+
+    def record(batch: List[Dict[str, Any]]) -> None:
+        nonlocal batches
+        batches += 1
+        checkpoint["items_done"] = consumed
+        checkpoint["places"] += len(batch)
+        if batches % max(1, save_every) == 0:
+            rag_tools.save_local_indexes()
+            checkpoint["indexed_items"] = consumed
+        _save_checkpoint(ckpt_dir, path, checkpoint)
+
+    items = itertools.islice(iter_json_items(file_path), checkpoint["items_done"], None)
+    # ingest_places saves the local indexes once more after the last batch
+    stats = rag_tools.ingest_places(counted(items), batch_size, on_batch=record)
+    checkpoint["items_done"] = consumed
+    checkpoint["indexed_items"] = consumed
+    checkpoint["complete"] = True
+    _save_checkpoint(ckpt_dir, path, checkpoint)
+    return {
+        "file": file_path,
+        "places": stats["normalized"],
+        "skipped": False,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def _merge_lexical_partials(checkpoint_dir: Path) -> int:
+    from whats_eat.tools.lexical import BM25Index
+
+    target = os.getenv("RAG_LEXICAL_INDEX_PATH")
+    partials = sorted(checkpoint_dir.glob("*.bm25.json"))
+    if not target or not partials:
+        return 0
+    index = BM25Index.load(target) if os.path.exists(target) else BM25Index()
+    for partial in partials:
+        index.update(BM25Index.load(str(partial)))
+        partial.unlink()
+    index.save(target)
+    return len(index)
+
+
+def _merge_prior_partials(checkpoint_dir: Path) -> int:
+    from whats_eat.tools.rating_priors import RatingPriorStore
+
+    target = os.getenv("RAG_RATING_PRIORS_PATH")
+    partials = sorted(checkpoint_dir.glob("*.priors.json"))
+    if not target or not partials:
+        return 0
+    store = RatingPriorStore.load(target) if os.path.exists(target) else RatingPriorStore()
+    for partial in partials:
+        store.update(RatingPriorStore.load(str(partial)))
+        partial.unlink()
+    store.save(target)
+    return len(store)
+
+
+def run_backfill(
+    directory: str,
+    pattern: str = "*.json",
+    workers: Optional[int] = None,
+    batch_size: int = 50,
+    checkpoint_dir: Optional[str] = None,
+    dry_run: bool = False,
+    restart: bool = False,
+    save_every: int = SAVE_EVERY_BATCHES,
+) -> Dict[str, Any]:
+    """Backfill every dump in `directory` with a process pool and print throughput."""
+    root = Path(directory)
+    files = sorted(p for p in root.glob(pattern) if p.is_file())
+    ckpt_dir = Path(checkpoint_dir) if checkpoint_dir else root / CHECKPOINT_DIRNAME
+    ckpt_dir.mkdir(parents=True, exist_ok=True)
+    if restart:
+        for stale in ckpt_dir.glob("*.json"):
+            stale.unlink()
+
+    workers = max(1, workers or min(4, os.cpu_count() or 1))
+    print(f"Backfilling {len(files)} file(s) from {root} with {workers} worker(s)")
+
+    started = time.perf_counter()
+    total_places = 0
+    failures: List[Dict[str, str]] = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(backfill_file, str(f), str(ckpt_dir), batch_size, dry_run, save_every): f
+            for f in files
+        }
+        for future in as_completed(futures):
+            file_path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failures.append({"file": str(file_path), "error": f"{type(e).__name__}: {e}"})
+                print(f"  FAILED {file_path.name}: {type(e).__name__}: {e} (rerun to resume)")
+                continue
+            total_places += result["places"]
+            if result["skipped"]:
+                print(f"  skip   {file_path.name} (already complete)")
+            else:
+                rate = result["places"] / result["seconds"] if result["seconds"] else 0.0
+                print(f"  done   {file_path.name}: {result['places']} places, {rate:.1f} places/s")
+
+    lexical_docs = 0 if dry_run else _merge_lexical_partials(ckpt_dir)
+    prior_places = 0 if dry_run else _merge_prior_partials(ckpt_dir)
+    elapsed = time.perf_counter() - started
+    throughput = total_places / elapsed if elapsed else 0.0
+    print(f"Backfilled {total_places} places in {elapsed:.1f}s ({throughput:.1f} places/s)")
+    if failures:
+        print(f"{len(failures)} file(s) failed; checkpoints kept in {ckpt_dir}")
+    return {
+        "files": len(files),
+        "places": total_places,
+        "seconds": elapsed,
+        "places_per_second": throughput,
+        "lexical_docs": lexical_docs,
+        "prior_places": prior_places,
+        "failures": failures,
+    }
+
+
+__all__ = ["run_backfill", "backfill_file", "load_checkpoint"]
@@ -0,0 +1,219 @@
+"""
+Named, parameterized Cypher statements for the RAG knowledge graph.
+
+Statements are registered once under a name with their access mode. Their text never
+changes between calls (values only travel as parameters), so Neo4j keeps reusing the
+cached query plan. `CypherRunner` executes them as managed transactions: reads through
+`execute_read` on READ-mode sessions, which a routing driver (neo4j:// / neo4j+s://)
+sends to followers and read replicas, and writes through `execute_write`. Managed
+transactions are retried by the driver on transient errors and lost leaders, up to
+`max_transaction_retry_time` of the driver. The runner records a latency histogram,
+error count and retry count per statement.
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    from neo4j import READ_ACCESS, WRITE_ACCESS
+except ImportError:  # pragma: no cover - neo4j is a hard dependency of the RAG tools
+    READ_ACCESS, WRITE_ACCESS = "READ", "WRITE"
+
+READ = "read"
+WRITE = "write"
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class CypherStatement(NamedTuple):
+    name: str
+    text: str
+    mode: str
+
+
+class CypherRegistry:
+    def __init__(self) -> None:
+        self._statements: Dict[str, CypherStatement] = {}
+
+    def register(self, name: str, text: str, mode: str = READ) -> CypherStatement:
+        if mode not in (READ, WRITE):
+            raise ValueError(f"Unknown access mode for {name}: {mode}")
+        existing = self._statements.get(name)
+        if existing is not None and existing.text != text:
+            raise ValueError(f"Cypher statement {name!r} is already registered with different text")
+        statement = CypherStatement(name, text, mode)
+        self._statements[name] = statement
+        return statement
+
+    def get(self, name: str) -> CypherStatement:
+        try:
+            return self._statements[name]
+        except KeyError:
+            raise KeyError(f"Unknown Cypher statement: {name}") from None
+
+    def names(self) -> List[str]:
+        return sorted(self._statements)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._statements
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; percentiles are bucket upper bounds."""
+
+    def __init__(self, buckets_ms: Sequence[float] = LATENCY_BUCKETS_MS) -> None:
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets_ms, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return float(self.buckets_ms[i]) if i < len(self.buckets_ms) else self.max_ms
+        return self.max_ms
+
+    def _labels(self) -> List[str]:
+        return [f"<={b}" for b in self.buckets_ms] + [f">{self.buckets_ms[-1]}"]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max_ms, 3),
+            "buckets": {label: n for label, n in zip(self._labels(), self.counts) if n},
+        }
+
+
+class CypherRunner:
+    """Executes registered statements and keeps per-statement latency statistics."""
+
+    def __init__(self, registry: CypherRegistry, database: Optional[str] = None) -> None:
+        self.registry = registry
+        self.database = database
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._errors: Dict[str, int] = {}
+        self._retries: Dict[str, int] = {}
+
+    def _session(self, driver: Any, access_mode: str) -> Any:
+        kwargs: Dict[str, Any] = {"default_access_mode": access_mode}
+        if self.database:
+            kwargs["database"] = self.database
+        return driver.session(**kwargs)
+
+    def read(self, driver: Any, name: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Run a read statement and return its records as dicts."""
+        statement = self.registry.get(name)
+        if statement.mode != READ:
+            raise ValueError(f"Cypher statement {name!r} is a write; use write()")
+        return self._execute(driver, READ, [(statement, params or {})])[0]
+
+    def write(self, driver: Any, name: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return self.write_many(driver, [(name, params or {})])[0]
+
+    def write_many(
+        self, driver: Any, steps: Sequence[Tuple[str, Optional[Dict[str, Any]]]]
+    ) -> List[List[Dict[str, Any]]]:
+        """Run several write statements in one transaction; all or nothing."""
+        statements = [(self.registry.get(name), params or {}) for name, params in steps]
+        for statement, _ in statements:
+            if statement.mode != WRITE:
+                raise ValueError(f"Cypher statement {statement.name!r} is a read; use read()")
+        return self._execute(driver, WRITE, statements)
+
+    def _execute(
+        self, driver: Any, mode: str, statements: List[Tuple[CypherStatement, Dict[str, Any]]]
+    ) -> List[List[Dict[str, Any]]]:
+        attempts = 0
+        timings: List[float] = []
+
+        def work(tx: Any) -> List[List[Dict[str, Any]]]:
+            # Called again by the driver for every retry of the managed transaction
+            nonlocal attempts
+            attempts += 1
+            timings.clear()
+            results = []
+            for statement, params in statements:
+                started = time.perf_counter()
+                results.append([record.data() for record in tx.run(statement.text, params)])
+                timings.append(1000.0 * (time.perf_counter() - started))
+            return results
+
+        names = [statement.name for statement, _ in statements]
+        access_mode = READ_ACCESS if mode == READ else WRITE_ACCESS
+        started = time.perf_counter()
+        failed = True
+        try:
+            with self._session(driver, access_mode) as session:
+                if mode == READ:
+                    results = session.execute_read(work)
+                else:
+                    results = session.execute_write(work)
+            failed = False
+            return results
+        finally:
+            if failed:
+                # A failed transaction is charged in full to each of its statements
+                timings = [1000.0 * (time.perf_counter() - started)] * len(names)
+            with self._lock:
+                for name, ms in zip(names, timings):
+                    self._histogram(name).observe(ms)
+                    if failed:
+                        self._errors[name] = self._errors.get(name, 0) + 1
+                    if attempts > 1:
+                        self._retries[name] = self._retries.get(name, 0) + attempts - 1
+
+    def _histogram(self, name: str) -> LatencyHistogram:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = LatencyHistogram()
+        return histogram
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-statement latency histogram snapshot plus error and retry counts."""
+        with self._lock:
+            return {
+                name: {
+                    **histogram.snapshot(),
+                    "errors": self._errors.get(name, 0),
+                    "retries": self._retries.get(name, 0),
+                }
+                for name, histogram in sorted(self._histograms.items())
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._errors.clear()
+            self._retries.clear()
+
+
+__all__ = [
+    "READ",
+    "WRITE",
+    "LATENCY_BUCKETS_MS",
+    "CypherStatement",
+    "CypherRegistry",
+    "LatencyHistogram",
+    "CypherRunner",
+]
@@ -0,0 +1,144 @@
+"""
+Geographic helpers for the RAG and ranking tools: geohash encoding, bounding boxes
+and great-circle distance. Pure Python, no external dependencies.
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_BASE32_INDEX = {c: i for i, c in enumerate(_BASE32)}
+
+# (south, west, north, east) in degrees
+BBox = Tuple[float, float, float, float]
+
+
+def geohash_encode(lat: float, lng: float, precision: int = 9) -> str:
+    """Encode a coordinate as a geohash string of `precision` characters."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars: List[str] = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                bits = (bits << 1) | 1
+                lng_lo = mid
+            else:
+                bits <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_lo = mid
+            else:
+                bits <<= 1
+                lat_hi = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def geohash_bbox(geohash: str) -> BBox:
+    """Return the (south, west, north, east) cell covered by a geohash prefix."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+    for ch in geohash.lower():
+        idx = _BASE32_INDEX.get(ch)
+        if idx is None:
+            raise ValueError(f"Invalid geohash character {ch!r} in {geohash!r}")
+        for shift in range(4, -1, -1):
+            bit = (idx >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                if bit:
+                    lng_lo = mid
+                else:
+                    lng_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return (lat_lo, lng_lo, lat_hi, lng_hi)
+
+
+def geohash_cover(bbox: BBox, precision: int, max_cells: Optional[int] = None) -> Optional[List[str]]:
+    """Geohash cells of `precision` characters intersecting `bbox`, sorted.
+
+    Returns None when more than `max_cells` cells would be needed.
+    """
+    south, west, north, east = bbox
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    cell_h = 180.0 / (1 << lat_bits)
+    cell_w = 360.0 / (1 << lng_bits)
+    n_rows = int((north - south) // cell_h) + 2
+    n_cols = int((east - west) // cell_w) + 2
+    if max_cells is not None and n_rows * n_cols > 4 * max_cells:
+        return None
+    # Sample at cell spacing plus the far edges; every intersected cell contains a sample
+    lats = [min(south + i * cell_h, north) for i in range(n_rows)]
+    lngs = [min(west + j * cell_w, east) for j in range(n_cols)]
+    cells = {geohash_encode(lat, lng, precision) for lat in lats for lng in lngs}
+    if max_cells is not None and len(cells) > max_cells:
+        return None
+    return sorted(cells)
+
+
+def bbox_around(lat: float, lng: float, radius_km: float) -> BBox:
+    """Approximate bounding box enclosing a circle of `radius_km` around a point."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    dlng = min(180.0, math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)))
+    return (max(-90.0, lat - dlat), lng - dlng, min(90.0, lat + dlat), lng + dlng)
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two coordinates in kilometres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def place_lat_lng(place: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    """Extract (lat, lng) from either the Places API (latitude/longitude) or normalized (lat/lng) shape."""
+    loc = place.get("location")
+    if not isinstance(loc, dict):
+        return None
+    lat = loc.get("lat", loc.get("latitude"))
+    lng = loc.get("lng", loc.get("longitude"))
+    if lat is None or lng is None:
+        return None
+    try:
+        return float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+
+
+__all__ = [
+    "EARTH_RADIUS_KM",
+    "BBox",
+    "geohash_encode",
+    "geohash_bbox",
+    "geohash_cover",
+    "bbox_around",
+    "haversine_km",
+    "place_lat_lng",
+]
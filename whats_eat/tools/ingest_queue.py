@@ -0,0 +1,277 @@
+"""
+Write-behind ingestion for the RAG tools.
+
+`IngestQueue` is a durable FIFO of normalized place batches stored in SQLite, and
+`IngestWorker` is a background thread that drains it into Neo4j and Pinecone. Batches
+survive restarts: anything not acknowledged is retried by the next worker. A worker
+claims a batch atomically with a lease, so several processes can share one queue file
+without writing the same batch twice; a batch whose lease expires (its writer died) is
+handed out again. Failed batches are retried with exponential backoff and parked as
+"dead" after `max_attempts`. Closing the queue stops its workers first, so no batch is
+acknowledged on a closed connection.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_PATH = os.path.join(os.path.expanduser("~"), ".whats_eat", "ingest_queue.sqlite3")
+
+
+class IngestQueue:
+    def __init__(
+        self, path: str = DEFAULT_QUEUE_PATH, max_attempts: int = 5, lease_seconds: float = 300.0
+    ) -> None:
+        self.path = path
+        self.max_attempts = max_attempts
+        # How long a claimed batch stays reserved for its worker before others may retry it
+        self.lease_seconds = lease_seconds
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Other processes may hold the write lock briefly while claiming a batch
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30.0)
+        self._lock = threading.Lock()
+        # Running workers; the connection is closed only once none of them is left
+        self._workers: List["IngestWorker"] = []
+        self._closing = False
+        self._closed = False
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS ingest_batches (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    payload TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    last_error TEXT,
+                    lease_until REAL
+                )
+                """
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(ingest_batches)")}
+            if "lease_until" not in columns:
+                # Queue files written before batches were leased
+                self._conn.execute("ALTER TABLE ingest_batches ADD COLUMN lease_until REAL")
+
+    def put(self, places: List[Dict[str, Any]]) -> int:
+        payload = json.dumps(places, ensure_ascii=False)
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO ingest_batches (payload, available_at) VALUES (?, ?)",
+                (payload, time.time()),
+            )
+            return int(cur.lastrowid)
+
+    def next_ready(self) -> Optional[Tuple[int, List[Dict[str, Any]], int]]:
+        """Oldest batch a worker could claim now, as (id, places, attempts), without claiming it.
+
+        That is a pending batch whose backoff has elapsed or an in-flight one whose lease expired.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT id, payload, attempts FROM ingest_batches WHERE {_READY} ORDER BY id LIMIT 1",
+                {"now": time.time()},
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    def claim(self) -> Optional[Tuple[int, List[Dict[str, Any]], int]]:
+        """Atomically lease the oldest ready batch to the caller, as (id, places, attempts).
+
+        The single UPDATE takes SQLite's write lock, so no other connection, in this
+        process or another, can claim the same batch until the lease runs out.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"""
+                UPDATE ingest_batches SET status = 'inflight', lease_until = :lease_until
+                WHERE id = (SELECT id FROM ingest_batches WHERE {_READY} ORDER BY id LIMIT 1)
+                RETURNING id, payload, attempts
+                """,
+                {"now": now, "lease_until": now + self.lease_seconds},
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    def ack(self, batch_id: int) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM ingest_batches WHERE id = ?", (batch_id,))
+
+    def nack(self, batch_id: int, error: str, backoff_base: float = 2.0) -> None:
+        """Record a failure; retry later with exponential backoff or mark the batch dead."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts FROM ingest_batches WHERE id = ?", (batch_id,)
+            ).fetchone()
+            if row is None:
+                return
+            attempts = row[0] + 1
+            status = "dead" if attempts >= self.max_attempts else "pending"
+            self._conn.execute(
+                """
+                UPDATE ingest_batches
+                SET attempts = ?, status = ?, last_error = ?, available_at = ?, lease_until = NULL
+                WHERE id = ?
+                """,
+                (attempts, status, error[:500], time.time() + backoff_base ** attempts, batch_id),
+            )
+
+    def depth(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM ingest_batches GROUP BY status"
+            ).fetchall()
+        counts = {"pending": 0, "inflight": 0, "dead": 0}
+        counts.update({status: n for status, n in rows})
+        return counts
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """Stop and join the workers draining this queue, then close the connection.
+
+        A worker still inside a batch write after `timeout` keeps the connection: it
+        acknowledges that batch and closes the queue when it exits.
+        """
+        for worker in list(self._workers):
+            worker.stop(timeout)
+        with self._lock:
+            self._closing = True
+            if self._workers:
+                logger.warning("Ingest worker still writing a batch; the queue closes when it exits")
+                return
+            self._close_locked()
+
+    def _attach(self, worker: "IngestWorker") -> None:
+        with self._lock:
+            if self._closing:
+                raise RuntimeError("Ingest queue is closed")
+            self._workers.append(worker)
+
+    def _detach(self, worker: "IngestWorker") -> None:
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            if self._closing and not self._workers:
+                self._close_locked()
+
+    def _close_locked(self) -> None:
+        if not self._closed:
+            self._conn.close()
+            self._closed = True
+
+
+# Claimable batches: pending with their backoff elapsed, or leased to a worker that did not
+# finish before the lease ran out
+_READY = (
+    "(status = 'pending' AND available_at <= :now)"
+    " OR (status = 'inflight' AND lease_until <= :now)"
+)
+
+
+class IngestWorker:
+    """Daemon thread that applies `write_batch` to every batch in an IngestQueue.
+
+    `on_idle` runs once each time the queue drains after at least one batch was written.
+    """
+
+    def __init__(
+        self,
+        queue: IngestQueue,
+        write_batch: Callable[[List[Dict[str, Any]]], None],
+        poll_interval: float = 1.0,
+        on_idle: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.queue = queue
+        self.write_batch = write_batch
+        self.poll_interval = poll_interval
+        self.on_idle = on_idle
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._busy = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self.queue._attach(self)
+        self._thread = threading.Thread(target=self._run, name="rag-ingest-worker", daemon=True)
+        self._thread.start()
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def stop(self, timeout: Optional[float] = 5.0) -> bool:
+        """Ask the thread to stop and join it; False if it is still running after `timeout`."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return True
+
+    def wait_idle(self, timeout: Optional[float] = None, poll: float = 0.05) -> bool:
+        """Block until no ready batch is left; True if that happened within `timeout`."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if not self._busy and self.queue.next_ready() is None:
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(poll)
+
+    def _run(self) -> None:
+        try:
+            self._drain()
+        finally:
+            self.queue._detach(self)
+
+    def _drain(self) -> None:
+        wrote = False
+        while not self._stop.is_set():
+            self._busy = True
+            item = self.queue.claim()
+            if item is None:
+                if wrote:
+                    wrote = False
+                    self._idle()
+                self._busy = False
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            batch_id, places, attempts = item
+            try:
+                self.write_batch(places)
+            except Exception as e:
+                logger.warning(
+                    f"Background ingest of batch {batch_id} failed (attempt {attempts + 1}): {e}"
+                )
+                self.queue.nack(batch_id, f"{type(e).__name__}: {e}")
+            else:
+                self.queue.ack(batch_id)
+                wrote = True
+                logger.info(f"Background ingest wrote {len(places)} place(s) from batch {batch_id}")
+            finally:
+                self._busy = False
+
+    def _idle(self) -> None:
+        if self.on_idle is None:
+            return
+        try:
+            self.on_idle()
+        except Exception as e:
+            logger.warning(f"Ingest worker idle callback failed: {e}")
+
+
+__all__ = ["IngestQueue", "IngestWorker", "DEFAULT_QUEUE_PATH"]
@@ -0,0 +1,143 @@
+"""
+Incremental JSON reader for large Places dumps.
+
+`iter_json_items` yields the elements of a top-level JSON array, or of the array under a
+top-level key (default "results"), while holding only one element plus one read chunk in
+memory. It relies on `json.JSONDecoder.raw_decode`, so no third-party parser is required.
+A value that does not decode within `max_item_size` characters is reported as malformed
+instead of reading the rest of the file in search of its end.
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import IO, Any, Iterator, Optional
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+# Largest single value (in characters) read ahead before a decode error is raised
+DEFAULT_MAX_ITEM_SIZE = 1 << 24
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = frozenset("0123456789+-.eE")
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    def __init__(self, fh: IO[str], chunk_size: int, max_item_size: int = DEFAULT_MAX_ITEM_SIZE) -> None:
+        self.fh = fh
+        self.chunk_size = chunk_size
+        self.max_item_size = max_item_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Append one chunk to the buffer, compacting consumed text first."""
+        if self.eof:
+            return False
+        if self.pos:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        chunk = self.fh.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf += chunk
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at end of input)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, found {found or 'end of input'!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value, reading more input as needed."""
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                # The value may only be cut off by the end of the buffer; read on, but not
+                # past the size no single item should reach
+                if len(self.buf) - self.pos > self.max_item_size:
+                    raise ValueError(
+                        f"Malformed JSON or value over {self.max_item_size} characters: {e.msg}"
+                    ) from e
+                if self.fill():
+                    continue
+                raise
+            # A number may continue in the next chunk ("12" + "3", "1." + "5", "1e" + "3"):
+            # raw_decode accepts its prefix, so read on while it runs to the end of the buffer
+            if not self.eof and self._number_at_buffer_end(obj, end) and self.fill():
+                continue
+            self.pos = end
+            return obj
+
+    def _number_at_buffer_end(self, obj: Any, end: int) -> bool:
+        if isinstance(obj, bool) or not isinstance(obj, (int, float)):
+            return False
+        while end < len(self.buf) and self.buf[end] in _NUMBER_CHARS:
+            end += 1
+        return end == len(self.buf)
+
+
+def _iter_array(reader: _Reader) -> Iterator[Any]:
+    reader.expect("[")
+    if reader.peek() == "]":
+        reader.pos += 1
+        return
+    while True:
+        yield reader.value()
+        sep = reader.peek()
+        reader.pos += 1
+        if sep == "]":
+            return
+        if sep != ",":
+            raise ValueError(f"Expected ',' or ']' in JSON array, found {sep or 'end of input'!r}")
+
+
+def iter_json_items(
+    path: str,
+    key: Optional[str] = "results",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_item_size: int = DEFAULT_MAX_ITEM_SIZE,
+) -> Iterator[Any]:
+    """Yield items of a top-level list, or of `data[key]` when the top level is an object."""
+    with open(os.path.normpath(path), "r", encoding="utf-8") as fh:
+        reader = _Reader(fh, chunk_size, max_item_size)
+        first = reader.peek()
+        if first == "[":
+            yield from _iter_array(reader)
+            return
+        if first != "{":
+            raise ValueError("JSON stream must start with an array or an object")
+        reader.pos += 1
+        if reader.peek() == "}":
+            return
+        while True:
+            name = reader.value()
+            reader.expect(":")
+            if name == key and reader.peek() == "[":
+                yield from _iter_array(reader)
+                return
+            reader.value()  # skip other top-level members
+            sep = reader.peek()
+            reader.pos += 1
+            if sep == "}":
+                return
+            if sep != ",":
+                raise ValueError(f"Expected ',' or '}}' in JSON object, found {sep or 'end of input'!r}")
+
+
+__all__ = ["iter_json_items", "DEFAULT_CHUNK_SIZE", "DEFAULT_MAX_ITEM_SIZE"]
@@ -0,0 +1,185 @@
+"""
+Local lexical retrieval for the RAG tools: an in-memory BM25 inverted index over the
+same place text that is embedded into Pinecone, plus reciprocal rank fusion (RRF) to
+merge lexical and vector rankings.
+"""
+from __future__ import annotations
+
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; keeps non-Latin scripts and dish names like 'laksa' intact."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 over short place documents.
+
+    Documents are keyed by place_id; re-adding an id replaces the previous text.
+    Each document may carry a metadata dict that search predicates can inspect.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        # term -> {doc_id: term frequency}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._metadata: Dict[str, Dict[str, Any]] = {}
+        self._total_len = 0
+        self._lock = threading.RLock()
+        # Documents changed since the last save, and when that was
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def __contains__(self, doc_id: object) -> bool:
+        return doc_id in self._doc_len
+
+    def add(self, doc_id: str, text: str, metadata: Optional[Dict[str, Any]] = None) -> None:
+        tokens = tokenize(text)
+        counts = Counter(tokens)
+        with self._lock:
+            self._remove_locked(doc_id)
+            self._add_counts_locked(doc_id, counts, len(tokens), metadata)
+            self._unsaved += 1
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            self._remove_locked(doc_id)
+            self._unsaved += 1
+
+    def _remove_locked(self, doc_id: str) -> None:
+        if doc_id not in self._doc_len:
+            return
+        for term in self._doc_terms.pop(doc_id, []):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_len -= self._doc_len.pop(doc_id)
+        self._metadata.pop(doc_id, None)
+
+    def update(self, other: "BM25Index") -> None:
+        """Merge another index into this one; documents in `other` win on id clashes."""
+        data = other.to_dict()["docs"]
+        with self._lock:
+            for doc_id, doc in data.items():
+                self._remove_locked(doc_id)
+                self._add_counts_locked(doc_id, doc["tf"], doc["len"], doc.get("metadata"))
+            self._unsaved += len(data)
+
+    def _add_counts_locked(
+        self, doc_id: str, counts: Dict[str, int], length: int, metadata: Optional[Dict[str, Any]]
+    ) -> None:
+        for term, tf in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        self._doc_len[doc_id] = length
+        self._doc_terms[doc_id] = list(counts)
+        self._metadata[doc_id] = dict(metadata or {})
+        self._total_len += length
+
+    def metadata(self, doc_id: str) -> Dict[str, Any]:
+        return self._metadata.get(doc_id, {})
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 10,
+        predicate: Optional[Callable[[str, Dict[str, Any]], bool]] = None,
+    ) -> List[Tuple[str, float]]:
+        """Return up to `top_k` (doc_id, score) pairs, best first.
+
+        `predicate(doc_id, metadata)` can exclude documents (e.g. outside the candidate set).
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self._doc_len)
+            if not n_docs or not terms:
+                return []
+            avgdl = self._total_len / n_docs or 1.0
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avgdl)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            if predicate is not None:
+                scores = {d: s for d, s in scores.items() if predicate(d, self._metadata.get(d, {}))}
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            docs = {}
+            for doc_id, terms in self._doc_terms.items():
+                docs[doc_id] = {
+                    "tf": {t: self._postings[t][doc_id] for t in terms},
+                    "len": self._doc_len[doc_id],
+                    "metadata": self._metadata.get(doc_id, {}),
+                }
+            return {"k1": self.k1, "b": self.b, "docs": docs}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BM25Index":
+        index = cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+        for doc_id, doc in (data.get("docs") or {}).items():
+            index._add_counts_locked(doc_id, doc["tf"], doc["len"], doc.get("metadata"))
+        return index
+
+    def save(self, path: str) -> None:
+        tmp = f"{path}.tmp"
+        with self._lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False)
+            os.replace(tmp, path)
+            self._unsaved = 0
+            self._saved_at = time.monotonic()
+
+    def save_if_due(self, path: str, interval: float = 0.0) -> bool:
+        """Save when documents changed since the last save and `interval` seconds have passed."""
+        with self._lock:
+            if not self._unsaved or time.monotonic() - self._saved_at < interval:
+                return False
+            self.save(path)
+            return True
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Iterable[str]],
+    k: int = 60,
+    weights: Optional[Sequence[float]] = None,
+) -> List[Tuple[str, float]]:
+    """Fuse several best-first id rankings with RRF: score(d) = sum_i w_i / (k + rank_i(d))."""
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+__all__ = ["BM25Index", "reciprocal_rank_fusion", "tokenize"]
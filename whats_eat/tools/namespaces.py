@@ -0,0 +1,194 @@
+"""
+Pinecone namespace routing for the RAG tools.
+
+With RAG_NAMESPACE_MODE set, place vectors are written to one namespace per geohash
+cell ("gh-w21") or per country ("cc-sg") instead of the default namespace, and queries
+are sent only to the namespaces that can contain matches. `NamespaceRouter` picks the
+namespace for a place when writing and for a location when querying;
+`migrate_to_namespaces` moves vectors written before routing was enabled.
+PINECONE_NAMESPACE_PREFIX keeps test runs or tenants apart inside the shared index.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+from whats_eat.tools.geo import BBox, bbox_around, geohash_bbox, geohash_cover
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE_MODES = ("none", "geohash", "region")
+
+# Queries touching more cells than this fan out to every namespace instead
+MAX_ROUTED_NAMESPACES = 16
+
+
+class NamespaceRouter:
+    def __init__(
+        self,
+        mode: str = "none",
+        geohash_precision: int = 3,
+        prefix: str = "",
+    ) -> None:
+        if mode not in NAMESPACE_MODES:
+            raise ValueError(f"Unknown namespace mode: {mode}")
+        self.mode = mode
+        self.geohash_precision = geohash_precision
+        self.prefix = prefix
+
+    @classmethod
+    def from_env(cls) -> "NamespaceRouter":
+        return cls(
+            mode=os.getenv("RAG_NAMESPACE_MODE", "none"),
+            geohash_precision=int(os.getenv("RAG_NAMESPACE_GEOHASH_PRECISION", "3")),
+            prefix=os.getenv("PINECONE_NAMESPACE_PREFIX", ""),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "none"
+
+    def namespace(self, key: str = "") -> str:
+        """Full namespace name for a routing key; "" is Pinecone's default namespace."""
+        return "-".join(part for part in (self.prefix, key) if part)
+
+    def owns(self, namespace: str) -> bool:
+        """Whether a namespace belongs to this router's prefix."""
+        if not self.prefix:
+            return True
+        return namespace == self.prefix or namespace.startswith(f"{self.prefix}-")
+
+    def namespace_for_metadata(self, metadata: Dict[str, Any]) -> str:
+        """Namespace of a vector, from the metadata written by _place_metadata.
+
+        Places without the routing field (no coordinates / no country) stay in the
+        un-keyed namespace so they are still found by fan-out queries.
+        """
+        if self.mode == "geohash" and metadata.get("geohash"):
+            return self.namespace(f"gh-{str(metadata['geohash'])[:self.geohash_precision]}")
+        if self.mode == "region" and metadata.get("region"):
+            return self.namespace(f"cc-{str(metadata['region']).lower()}")
+        return self.namespace()
+
+    def route(
+        self,
+        lat: Optional[float] = None,
+        lng: Optional[float] = None,
+        radius_km: float = 5.0,
+        bbox: Optional[BBox] = None,
+        geohash_prefix: Optional[str] = None,
+        region: Optional[str] = None,
+    ) -> Optional[List[str]]:
+        """Namespaces a query at this location has to search.
+
+        Returns None when routing is off or the location does not narrow the search
+        (the caller then searches every namespace), otherwise a sorted list that always
+        includes the un-keyed namespace for places stored without a location.
+        """
+        if not self.enabled:
+            return None
+        keys: List[str] = []
+        if self.mode == "region":
+            if not region:
+                return None
+            keys = [f"cc-{region.lower()}"]
+        else:
+            precision = self.geohash_precision
+            if geohash_prefix and len(geohash_prefix) >= precision:
+                keys = [f"gh-{geohash_prefix.lower()[:precision]}"]
+            else:
+                if bbox is None and geohash_prefix:
+                    bbox = geohash_bbox(geohash_prefix)
+                if bbox is None and lat is not None and lng is not None:
+                    bbox = bbox_around(lat, lng, radius_km)
+                if bbox is None:
+                    return None
+                cells = geohash_cover(bbox, precision, MAX_ROUTED_NAMESPACES)
+                if cells is None:
+                    return None
+                keys = [f"gh-{cell}" for cell in cells]
+        return sorted({self.namespace(key) for key in keys} | {self.namespace()})
+
+
+def migrate_to_namespaces(
+    rag_tools: Any,
+    source_namespace: str = "",
+    batch_size: int = 100,
+    dry_run: bool = False,
+    on_batch: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """Move vectors from `source_namespace` into the namespaces the router assigns.
+
+    Ids are listed page by page, fetched with their metadata, upserted into the target
+    namespace and only then deleted from the source, so an interrupted run can simply be
+    repeated. Requires an index that supports id listing (serverless Pinecone).
+    """
+    router: NamespaceRouter = rag_tools.namespace_router
+    if not router.enabled:
+        raise ValueError("Set RAG_NAMESPACE_MODE to 'geohash' or 'region' before migrating")
+    if rag_tools._pinecone_index is None:
+        rag_tools.connect_pinecone()
+    stats: Dict[str, Any] = {"scanned": 0, "moved": 0, "kept": 0, "namespaces": {}}
+    # The truncated first-stage index (RAG_FIRST_STAGE_DIM) is sharded the same way
+    stages = (False, True) if getattr(rag_tools, "first_stage_dim", 0) else (False,)
+    for first_stage in stages:
+        _migrate_index(rag_tools, router, first_stage, source_namespace, batch_size, dry_run, on_batch, stats)
+
+    logger.info(
+        f"Namespace migration from {source_namespace!r}: scanned {stats['scanned']}, "
+        f"moved {stats['moved']} into {len(stats['namespaces'])} namespace(s)"
+    )
+    return stats
+
+
+def _migrate_index(
+    rag_tools: Any,
+    router: NamespaceRouter,
+    first_stage: bool,
+    source_namespace: str,
+    batch_size: int,
+    dry_run: bool,
+    on_batch: Optional[Callable[[Dict[str, Any]], None]],
+    stats: Dict[str, Any],
+) -> None:
+    # RAG imports NamespaceRouter from this module, so its response helpers load lazily
+    from whats_eat.tools.RAG import _fetched_vectors, _vector_metadata, _vector_values
+
+    index = rag_tools._first_stage_index if first_stage else rag_tools._pinecone_index
+    if not hasattr(index, "list"):
+        raise RuntimeError("Listing vector ids requires the serverless Pinecone SDK")
+
+    for page in index.list(namespace=source_namespace, limit=batch_size):
+        ids = list(page)
+        if not ids:
+            continue
+        fetched = _fetched_vectors(rag_tools._with_pinecone(
+            lambda index, ids=ids: index.fetch(ids=ids, namespace=source_namespace), first_stage
+        ))
+        stats["scanned"] += len(fetched)
+        moves: Dict[str, List[Any]] = {}
+        moved_ids: List[str] = []
+        for vector_id, vector in fetched.items():
+            metadata = _vector_metadata(vector)
+            target = router.namespace_for_metadata(metadata)
+            if target == source_namespace:
+                stats["kept"] += 1
+                continue
+            values = _vector_values(vector)
+            moved_ids.append(vector_id)
+            moves.setdefault(target, []).append(rag_tools._vector_record(vector_id, values, metadata))
+
+        for target, records in moves.items():
+            stats["moved"] += len(records)
+            stats["namespaces"][target] = stats["namespaces"].get(target, 0) + len(records)
+            if dry_run:
+                continue
+            rag_tools._upsert_vectors(records, namespace=target, first_stage=first_stage)
+        if moved_ids and not dry_run:
+            rag_tools._delete_vectors(moved_ids, namespace=source_namespace, first_stage=first_stage)
+        if on_batch is not None:
+            on_batch(stats)
+
+
+__all__ = ["NamespaceRouter", "NAMESPACE_MODES", "MAX_ROUTED_NAMESPACES", "migrate_to_namespaces"]
@@ -1,7 +1,85 @@
 # tools/ranking.py
 from langchain_core.tools import tool
-from typing import List, Dict, Any, Optional
+from typing import Callable, Iterator, List, Dict, Any, NamedTuple, Optional, Sequence, Tuple, Union
+import json
+import logging
 import math
+import os
+import re
+
+import numpy as np
+
+from whats_eat.tools.cache import LRUTTLCache
+from whats_eat.tools.geo import EARTH_RADIUS_KM, place_lat_lng
+from whats_eat.tools.rating_priors import (
+    DEFAULT_PRIOR_COUNT,
+    DEFAULT_PRIOR_MEAN,
+    RatingPriorStore,
+    get_prior_store,
+    place_category,
+    place_region,
+)
+
+logger = logging.getLogger(__name__)
+
+# Candidate embeddings: rows aligned with the candidates, or a mapping place_id -> vector
+CandidateEmbeddings = Union[Sequence[Optional[Sequence[float]]], Dict[str, Sequence[float]], np.ndarray]
+
+# Google Places price levels from cheapest to most expensive
+PRICE_LEVEL_ORDER = [
+    'PRICE_LEVEL_FREE',
+    'PRICE_LEVEL_INEXPENSIVE',
+    'PRICE_LEVEL_MODERATE',
+    'PRICE_LEVEL_EXPENSIVE',
+    'PRICE_LEVEL_VERY_EXPENSIVE',
+]
+PRICE_LEVEL_RANK = {level: rank for rank, level in enumerate(PRICE_LEVEL_ORDER)}
+
+# Price levels that earn the full price credit for each price band
+PRICE_BAND_LEVELS = {
+    'budget': ['PRICE_LEVEL_FREE', 'PRICE_LEVEL_INEXPENSIVE'],
+    'mid': ['PRICE_LEVEL_MODERATE'],
+    'upscale': ['PRICE_LEVEL_EXPENSIVE', 'PRICE_LEVEL_VERY_EXPENSIVE']
+}
+
+DEFAULT_WEIGHTS = {
+    "similarity": 0.35,
+    "rating": 0.25,
+    "attributes": 0.25,
+    "distance": 0.15,
+}
+
+# Named weight sets written by the offline tuning harness (weight_tuning.py) are read
+# from RANKING_WEIGHTS_DIR/<name>.json; RANKING_WEIGHT_SET picks the default set
+DEFAULT_WEIGHTS_DIR = os.path.join(os.path.expanduser("~"), ".whats_eat", "ranking_weights")
+_WEIGHT_SET_NAME = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+# Bayesian rating prior: assumed mean rating and review-count confidence threshold.
+# Used until the ingested corpus calibrates per region/category priors (rating_priors).
+RATING_PRIOR_MEAN = DEFAULT_PRIOR_MEAN
+RATING_PRIOR_COUNT = DEFAULT_PRIOR_COUNT
+
+# Distance decay constant in km (restaurants within 2km get >50% score)
+DISTANCE_DECAY_KM = 2.0
+
+# Travel-time approximation: average door-to-door speed per mode (km/h), applied to the
+# great-circle distance stretched by a detour factor for the street network
+TRAVEL_SPEEDS_KMH = {"walk": 4.8, "transit": 18.0, "drive": 25.0}
+ROUTE_DETOUR_FACTOR = 1.3
+# Travel-time decay constant in minutes (trips under ~10 minutes get >50% score)
+TRAVEL_TIME_DECAY_MIN = 15.0
+
+# Diversity re-ranking: MMR picks from the best top_n * MMR_POOL_FACTOR candidates, and two
+# places this far apart (km) are exp(-1) ~ 0.37 similar by location
+MMR_POOL_FACTOR = 10
+MMR_DISTANCE_KM = 0.5
+
+# Fields of a recommendation card. Compact rankings return only place ids and scores;
+# the card fields of their results are served by lookup_place_cards.
+CARD_FIELDS = (
+    "name", "formatted_address", "formattedAddress", "location", "rating", "userRatingCount",
+    "priceLevel", "types", "photos", "generativeSummary", "googleMapsUri",
+)
 
 
 def _normalize_score(value: float, min_val: float, max_val: float) -> float:
@@ -19,7 +97,9 @@ def _calculate_similarity_score(similarity: float) -> float:
     return (similarity + 1) / 2
 
 
-def _calculate_rating_score(rating: float, rating_count: int) -> float:
+def _calculate_rating_score(
+    rating: float, rating_count: int, prior: Optional[Tuple[float, float]] = None
+) -> float:
     """
     Calculate weighted rating score using Bayesian average.
     Accounts for both rating value and number of reviews.
@@ -30,9 +110,10 @@ def _calculate_rating_score(rating: float, rating_count: int) -> float:
     - v = number of reviews for the restaurant
     - m = minimum reviews required (confidence threshold)
     - C = mean rating across all restaurants
+    
+    `prior` is an optional (C, m) pair, e.g. from RatingPriorStore.prior_for().
     """
-    C = 4.0  # Assumed average rating
-    m = 10   # Minimum reviews threshold
+    C, m = prior or (RATING_PRIOR_MEAN, RATING_PRIOR_COUNT)
     
     if rating == 0:
         return 0.0
@@ -64,11 +145,7 @@ def _match_attributes(restaurant: Dict[str, Any], user_attributes: Dict[str, Any
         user_price = user_attributes['price_band']
         
         # Map price levels
-        price_map = {
-            'budget': ['PRICE_LEVEL_FREE', 'PRICE_LEVEL_INEXPENSIVE'],
-            'mid': ['PRICE_LEVEL_MODERATE'],
-            'upscale': ['PRICE_LEVEL_EXPENSIVE', 'PRICE_LEVEL_VERY_EXPENSIVE']
-        }
+        price_map = PRICE_BAND_LEVELS
         
         if user_price in price_map and restaurant_price in price_map.get(user_price, []):
             score += 0.15
@@ -151,7 +228,7 @@ def _calculate_distance_score(distance_km: Optional[float]) -> float:
         return 1.0  # Unknown distance or same location
     
     # Decay constant (restaurants within 2km get >50% score)
-    k = 2.0
+    k = DISTANCE_DECAY_KM
     
     # Exponential decay
     score = math.exp(-distance_km / k)
@@ -159,12 +236,740 @@ def _calculate_distance_score(distance_km: Optional[float]) -> float:
     return score
 
 
+_VEG_TYPES = frozenset(['vegetarian_restaurant', 'vegan_restaurant'])
+_FINE_DINING_TYPES = frozenset(['fine_dining', 'upscale'])
+_STREET_FOOD_TYPES = frozenset(['food_truck', 'street_food', 'food_cart'])
+
+
+class AttributeMatcher:
+    """_match_attributes compiled for one set of user attributes.
+
+    Everything that depends only on the user (price band levels, lowercased diet/region/
+    style lists, the maximum score) is computed once. What depends only on a candidate's
+    `types` (veg type hit, region substring hits, style matches) is memoized per distinct
+    types list, so candidates sharing types are matched once. Scores are identical to
+    `_match_attributes`, including the order in which partial credits are summed.
+    """
+
+    # Memoized types lists kept per matcher before the memo is reset
+    MAX_TYPE_ENTRIES = 4096
+
+    def __init__(self, user_attributes: Dict[str, Any]) -> None:
+        user_attributes = user_attributes or {}
+        max_score = 0.0
+
+        self.price_active = bool(user_attributes.get('price_band'))
+        self.price_levels: frozenset = frozenset()
+        if self.price_active:
+            max_score += 0.15
+            self.price_levels = frozenset(PRICE_BAND_LEVELS.get(user_attributes['price_band'], []))
+
+        self.diet_active = bool(user_attributes.get('diet'))
+        self.diet_veg = False
+        if self.diet_active:
+            max_score += 0.25
+            diet = [d.lower() for d in user_attributes['diet']]
+            self.diet_veg = any('vegetarian' in d or 'vegan' in d for d in diet)
+
+        # Regions keep duplicates: each listed region counts towards the match total
+        self.regions: Tuple[str, ...] = ()
+        if user_attributes.get('region'):
+            max_score += 0.35
+            self.regions = tuple(r.lower() for r in user_attributes['region'])
+
+        self.style_active = bool(user_attributes.get('style'))
+        self.styles: Tuple[str, ...] = ()
+        if self.style_active:
+            max_score += 0.25
+            self.styles = tuple(st.lower() for st in user_attributes['style'])
+
+        self.max_score = max_score
+        self._types_memo: Dict[Tuple[Any, ...], Tuple[bool, Tuple[bool, ...], int]] = {}
+
+    def _types_features(self, types: Tuple[Any, ...]) -> Tuple[bool, Tuple[bool, ...], int]:
+        """(has veg type, region hit per user region, style match count) for a types list."""
+        features = self._types_memo.get(types)
+        if features is not None:
+            return features
+        lowered = [str(t).lower() for t in types]
+        lowered_set = set(lowered)
+        veg_type = any(t in _VEG_TYPES for t in types)
+        region_hits = tuple(any(region in t for t in lowered) for region in self.regions)
+        style_matches = 0
+        if self.styles:
+            joined = ' '.join(lowered)
+            for style in self.styles:
+                if style == 'casual' and 'casual' in joined:
+                    style_matches += 1
+                elif style == 'fine dining' and not lowered_set.isdisjoint(_FINE_DINING_TYPES):
+                    style_matches += 1
+                elif style == 'street food' and not lowered_set.isdisjoint(_STREET_FOOD_TYPES):
+                    style_matches += 1
+        features = (veg_type, region_hits, style_matches)
+        if len(self._types_memo) >= self.MAX_TYPE_ENTRIES:
+            self._types_memo.clear()
+        self._types_memo[types] = features
+        return features
+
+    def score(self, restaurant: Dict[str, Any]) -> float:
+        if self.max_score == 0:
+            return 0.5  # Neutral if no attributes to match
+        score = 0.0
+        veg_type, region_hits, style_matches = self._types_features(tuple(restaurant.get('types') or ()))
+        name = None
+
+        if self.price_active:
+            restaurant_price = restaurant.get('priceLevel', 'PRICE_LEVEL_UNSPECIFIED')
+            if restaurant_price in self.price_levels:
+                score += 0.15
+            elif restaurant_price == 'PRICE_LEVEL_UNSPECIFIED':
+                score += 0.05
+
+        if self.diet_active:
+            if self.diet_veg:
+                name = (restaurant.get('name') or '').lower()
+                if veg_type:
+                    score += 0.25
+                elif 'vegetarian' in name or 'vegan' in name:
+                    score += 0.15
+                else:
+                    score += 0.05
+            else:
+                score += 0.15
+
+        if self.regions:
+            if name is None:
+                name = (restaurant.get('name') or '').lower()
+            matches = 0
+            for region, hit in zip(self.regions, region_hits):
+                if hit:
+                    matches += 1
+                elif region in name:
+                    matches += 0.5
+            if matches > 0:
+                score += min(0.35, matches * 0.15)
+            else:
+                score += 0.05
+
+        if style_matches > 0:
+            score += min(0.25, style_matches * 0.12)
+
+        return score / self.max_score
+
+    def scores(self, candidates: Sequence[Dict[str, Any]]) -> np.ndarray:
+        return np.fromiter((self.score(c) for c in candidates), dtype=np.float64, count=len(candidates))
+
+
+# Compiled matchers by canonical user attributes, so later turns of a session reuse them
+_matcher_cache: LRUTTLCache[AttributeMatcher] = LRUTTLCache(maxsize=256, ttl=3600)
+
+
+def compile_attribute_matcher(user_attributes: Optional[Dict[str, Any]]) -> AttributeMatcher:
+    """Cached AttributeMatcher for these user attributes."""
+    key = json.dumps(user_attributes or {}, sort_keys=True, default=str)
+    return _matcher_cache.get_or_set(key, lambda: AttributeMatcher(user_attributes or {}))
+
+
+# --- Columnar scoring engine ---
+# The helpers above score one restaurant at a time and remain the reference definition.
+# The functions below compute the same scores for all candidates at once on NumPy columns.
+
+def _as_float(value: Any, default: float) -> float:
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _column(candidates: Sequence[Dict[str, Any]], key: str, default: float = 0.0) -> np.ndarray:
+    """One numeric field of every candidate as a float array; missing values become `default`."""
+    return np.fromiter(
+        (_as_float(c.get(key), default) for c in candidates), dtype=np.float64, count=len(candidates)
+    )
+
+
+def _similarity_scores(similarity: np.ndarray) -> np.ndarray:
+    return (similarity + 1) / 2
+
+
+def _rating_scores(
+    rating: np.ndarray,
+    rating_count: np.ndarray,
+    prior_mean: Union[float, np.ndarray] = RATING_PRIOR_MEAN,
+    prior_count: Union[float, np.ndarray] = RATING_PRIOR_COUNT,
+) -> np.ndarray:
+    C = prior_mean
+    m = prior_count
+    weighted = (rating * rating_count + C * m) / (rating_count + m)
+    return np.where(rating == 0, 0.0, weighted / 5.0)
+
+
+def _distance_scores(distance_km: np.ndarray) -> np.ndarray:
+    """exp(-d/k); unknown (NaN) or zero distances score 1.0 like _calculate_distance_score."""
+    unknown = np.isnan(distance_km) | (distance_km == 0)
+    return np.where(unknown, 1.0, np.exp(-np.nan_to_num(distance_km) / DISTANCE_DECAY_KM))
+
+
+def cosine_similarities(query: Sequence[float], matrix: np.ndarray) -> np.ndarray:
+    """Cosine similarity of every row of `matrix` with `query` in one matrix-vector product.
+
+    Rows with zero norm (candidates without an embedding) come back as NaN.
+    """
+    q = np.asarray(query, dtype=np.float32)
+    q_norm = float(np.linalg.norm(q))
+    if q_norm == 0 or len(matrix) == 0:
+        return np.full(len(matrix), math.nan)
+    row_norms = np.linalg.norm(matrix, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sims = (matrix @ (q / q_norm)) / row_norms
+    return np.where(row_norms > 0, sims, math.nan).astype(np.float64)
+
+
+def _embedding_matrix(
+    candidates: Sequence[Dict[str, Any]],
+    candidate_embeddings: Optional[CandidateEmbeddings],
+    dim: int,
+) -> np.ndarray:
+    """(n, dim) float32 matrix of candidate embeddings; missing or mis-sized rows are zero."""
+    if isinstance(candidate_embeddings, np.ndarray):
+        if candidate_embeddings.shape != (len(candidates), dim):
+            raise ValueError(
+                f"candidate_embeddings has shape {candidate_embeddings.shape}, "
+                f"expected {(len(candidates), dim)}"
+            )
+        return candidate_embeddings.astype(np.float32, copy=False)
+    if isinstance(candidate_embeddings, dict):
+        # Candidates missing from the mapping fall back to their own embedding field
+        rows = [candidate_embeddings.get(c.get('place_id'), c.get('embedding')) for c in candidates]
+    elif candidate_embeddings is not None:
+        if len(candidate_embeddings) != len(candidates):
+            raise ValueError(
+                f"Got {len(candidate_embeddings)} candidate embeddings for {len(candidates)} candidates"
+            )
+        rows = list(candidate_embeddings)
+    else:
+        rows = [c.get('embedding') for c in candidates]
+    matrix = np.zeros((len(candidates), dim), dtype=np.float32)
+    for i, row in enumerate(rows):
+        if row is not None and len(row) == dim:
+            matrix[i] = row
+    return matrix
+
+
+def candidate_similarities(
+    candidates: Sequence[Dict[str, Any]],
+    user_embedding: Optional[Sequence[float]] = None,
+    candidate_embeddings: Optional[CandidateEmbeddings] = None,
+) -> np.ndarray:
+    """Raw similarity (-1..1) of every candidate to the user.
+
+    With a user embedding, candidates that have an embedding (in `candidate_embeddings`
+    or their own `embedding` field) get the cosine similarity; the others keep the
+    `score` field from vector search (0.0 if absent).
+    """
+    searched = _column(candidates, "score")
+    if user_embedding is None or len(user_embedding) == 0:
+        return searched
+    matrix = _embedding_matrix(candidates, candidate_embeddings, len(user_embedding))
+    cosine = cosine_similarities(user_embedding, matrix)
+    return np.where(np.isnan(cosine), searched, cosine)
+
+
+def _fetch_place_embeddings(candidates: Sequence[Dict[str, Any]]) -> Dict[str, List[float]]:
+    """Place vectors from the RAG tools' local cache, falling back to the Pinecone index."""
+    from whats_eat.tools.RAG import _get_rag_tools  # RAG imports this module
+
+    place_ids = [c['place_id'] for c in candidates if c.get('place_id') and c.get('embedding') is None]
+    if not place_ids:
+        return {}
+    try:
+        return _get_rag_tools().place_embeddings(place_ids)
+    except Exception as e:
+        logger.warning(f"Could not fetch place embeddings, using search scores: {e}")
+        return {}
+
+
+def candidate_rating_priors(
+    candidates: Sequence[Dict[str, Any]], store: RatingPriorStore
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Prior mean and count columns for the candidates, looked up once per region/category."""
+    means = np.empty(len(candidates))
+    counts = np.empty(len(candidates))
+    seen: Dict[Tuple[Optional[str], Optional[str]], Tuple[float, float]] = {}
+    for i, c in enumerate(candidates):
+        key = (place_region(c), place_category(c))
+        prior = seen.get(key)
+        if prior is None:
+            prior = seen[key] = store.prior(*key)
+        means[i], counts[i] = prior
+    return means, counts
+
+
+def _location_columns(candidates: Sequence[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Latitude and longitude columns of the candidates; NaN where a location is missing."""
+    coords = np.full((len(candidates), 2), math.nan)
+    for i, c in enumerate(candidates):
+        lat_lng = place_lat_lng(c)
+        if lat_lng is not None:
+            coords[i] = lat_lng
+    return coords[:, 0], coords[:, 1]
+
+
+def haversine_distances(
+    lat: Union[float, np.ndarray], lng: Union[float, np.ndarray], lats: np.ndarray, lngs: np.ndarray
+) -> np.ndarray:
+    """Great-circle distances (km) from an origin to arrays of coordinates; NaN stays NaN.
+
+    Origins broadcast against the coordinates, so (U, 1) origin columns give a (U, N) matrix.
+    """
+    phi1 = np.radians(lat)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlmb = np.radians(lngs - lng)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def candidate_distances(
+    candidates: Sequence[Dict[str, Any]],
+    origin: Optional[Tuple[float, float]] = None,
+) -> np.ndarray:
+    """Distance (km) of every candidate from the user.
+
+    With an origin, candidates that have a location get their great-circle distance;
+    the others keep their `distance_km` field. NaN marks an unknown distance.
+    """
+    given = _column(candidates, "distance_km", math.nan)
+    if origin is None:
+        return given
+    lats, lngs = _location_columns(candidates)
+    computed = haversine_distances(origin[0], origin[1], lats, lngs)
+    return np.where(np.isnan(computed), given, computed)
+
+
+def _travel_mode_error(mode: Optional[str]) -> Optional[str]:
+    if mode and mode not in TRAVEL_SPEEDS_KMH:
+        return f"Unknown travel mode: {mode} (expected one of {sorted(TRAVEL_SPEEDS_KMH)})"
+    return None
+
+
+def travel_minutes(distance_km: np.ndarray, mode: str) -> np.ndarray:
+    """Approximate travel time (minutes) for great-circle distances by walk, transit or drive."""
+    error = _travel_mode_error(mode)
+    if error:
+        raise ValueError(error)
+    return distance_km * ROUTE_DETOUR_FACTOR / TRAVEL_SPEEDS_KMH[mode] * 60.0
+
+
+def _travel_time_scores(minutes: np.ndarray) -> np.ndarray:
+    """exp(-t/k); unknown (NaN) or zero travel times score 1.0 like distances."""
+    unknown = np.isnan(minutes) | (minutes == 0)
+    return np.where(unknown, 1.0, np.exp(-np.nan_to_num(minutes) / TRAVEL_TIME_DECAY_MIN))
+
+
+def _user_origin(user_location: Optional[Dict[str, Any]]) -> Optional[Tuple[float, float]]:
+    """(lat, lng) from a {"lat", "lng"} or {"latitude", "longitude"} dict."""
+    if not user_location:
+        return None
+    return place_lat_lng({"location": user_location})
+
+
+def profile_components(
+    candidates: Sequence[Dict[str, Any]],
+    user_profile: Dict[str, Any],
+    weights: Dict[str, float],
+    user_embedding: Optional[Sequence[float]] = None,
+    candidate_embeddings: Optional[CandidateEmbeddings] = None,
+    user_location: Optional[Dict[str, Any]] = None,
+    travel_mode: Optional[str] = None,
+) -> Dict[str, np.ndarray]:
+    """score_candidates with every input derived from the user profile as the ranking tool does.
+
+    The user embedding and origin default to the profile's; rating priors come from the
+    shared prior store once it is calibrated.
+    """
+    if user_embedding is None:
+        user_embedding = user_profile.get('embedding_profile') or user_profile.get('embedding')
+    similarity = candidate_similarities(candidates, user_embedding, candidate_embeddings)
+    origin = _user_origin(user_location or user_profile.get('location'))
+    distance_km = candidate_distances(candidates, origin)
+    prior_store = get_prior_store()
+    rating_priors = candidate_rating_priors(candidates, prior_store) if prior_store.calibrated else None
+    return score_candidates(
+        candidates, user_profile.get('attributes', {}), weights, similarity, distance_km, travel_mode,
+        rating_priors
+    )
+
+
+def score_candidates(
+    candidates: Sequence[Dict[str, Any]],
+    user_attributes: Dict[str, Any],
+    weights: Dict[str, float],
+    similarity: Optional[np.ndarray] = None,
+    distance_km: Optional[np.ndarray] = None,
+    travel_mode: Optional[str] = None,
+    rating_priors: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> Dict[str, np.ndarray]:
+    """Component and final scores of all candidates as arrays aligned with `candidates`.
+
+    `similarity` and `distance_km` override the raw values otherwise read from the
+    `score` and `distance_km` fields. With a `travel_mode` the distance component decays
+    with the approximate travel time instead of the distance, and the result also
+    carries a "travel_minutes" array. `rating_priors` are per-candidate (C, m) columns
+    replacing the fixed rating prior.
+    """
+    if similarity is None:
+        similarity = _column(candidates, "score")
+    if distance_km is None:
+        distance_km = _column(candidates, "distance_km", math.nan)
+    components = {
+        "similarity": _similarity_scores(similarity),
+        "rating": _rating_scores(
+            _column(candidates, "rating"), _column(candidates, "userRatingCount"), *(rating_priors or ())
+        ),
+        "attributes": compile_attribute_matcher(user_attributes).scores(candidates),
+    }
+    if travel_mode:
+        components["travel_minutes"] = travel_minutes(distance_km, travel_mode)
+        components["distance"] = _travel_time_scores(components["travel_minutes"])
+    else:
+        components["distance"] = _distance_scores(distance_km)
+    components["distance_km"] = distance_km
+    # Rounded once, here: candidates are ranked on exactly the final_score that is emitted
+    components["final"] = np.round(
+        weights["similarity"] * components["similarity"] +
+        weights["rating"] * components["rating"] +
+        weights["attributes"] * components["attributes"] +
+        weights["distance"] * components["distance"],
+        4,
+    )
+    return components
+
+
+def top_n_indices(scores: np.ndarray, n: int) -> np.ndarray:
+    """Indices of the n highest scores, best first; ties keep input order (like a stable sort).
+
+    Uses a partial selection, so only the n winners are sorted.
+    """
+    total = len(scores)
+    if n <= 0 or total == 0:
+        return np.empty(0, dtype=np.intp)
+    if n >= total:
+        return np.argsort(-scores, kind="stable")
+    kth = np.partition(scores, total - n)[total - n]
+    above = np.flatnonzero(scores > kth)
+    ties = np.flatnonzero(scores == kth)[: n - len(above)]
+    selected = np.sort(np.concatenate([above, ties]))
+    return selected[np.argsort(-scores[selected], kind="stable")]
+
+
+def mmr_order(
+    relevance: np.ndarray,
+    n: int,
+    diversity: float,
+    embeddings: Optional[np.ndarray] = None,
+    lats: Optional[np.ndarray] = None,
+    lngs: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Positions of n items picked greedily by maximal marginal relevance.
+
+    Each step picks the item maximizing (1 - diversity) * relevance - diversity * max_sim,
+    where max_sim is its highest similarity to the items already picked: the larger of
+    the embedding cosine and a location similarity exp(-d / MMR_DISTANCE_KM). max_sim is
+    updated with one similarity vector against the latest pick, so the whole selection
+    is O(N·k) (times the embedding dimension) and no pairwise matrix is built. Items with
+    equal MMR scores keep input order.
+    """
+    total = len(relevance)
+    n = min(n, total)
+    if n <= 0:
+        return np.empty(0, dtype=np.intp)
+    unit = None
+    if embeddings is not None:
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        unit = np.divide(embeddings, norms, out=np.zeros_like(embeddings), where=norms > 0)
+    located = None
+    if lats is not None and lngs is not None:
+        located = ~(np.isnan(lats) | np.isnan(lngs))
+
+    max_sim = np.zeros(total)
+    available = np.ones(total, dtype=bool)
+    picks: List[int] = []
+    while True:
+        mmr = np.where(available, (1 - diversity) * relevance - diversity * max_sim, -np.inf)
+        i = int(np.argmax(mmr))
+        picks.append(i)
+        available[i] = False
+        if len(picks) == n:
+            break
+        sim = np.zeros(total)
+        if unit is not None:
+            np.maximum(sim, unit @ unit[i], out=sim)
+        if located is not None and located[i]:
+            geo = np.exp(-haversine_distances(lats[i], lngs[i], lats, lngs) / MMR_DISTANCE_KM)
+            np.maximum(sim, np.nan_to_num(geo), out=sim)
+        np.maximum(max_sim, sim, out=max_sim)
+    return np.asarray(picks, dtype=np.intp)
+
+
+def _pool_embeddings(
+    candidates: Sequence[Dict[str, Any]],
+    candidate_embeddings: Optional[CandidateEmbeddings],
+    pool: np.ndarray,
+) -> Optional[np.ndarray]:
+    """Embedding rows of the pooled candidates, or None when none of them has one."""
+    view = _CandidateView(candidates, pool)
+    selected = _select_embeddings(candidate_embeddings, pool)
+    if isinstance(selected, np.ndarray):
+        return selected.astype(np.float32, copy=False)
+    for j, c in enumerate(view):
+        if isinstance(selected, dict):
+            row = selected.get(c.get('place_id'), c.get('embedding'))
+        elif selected is not None:
+            row = selected[j]
+        else:
+            row = c.get('embedding')
+        if row is not None and len(row):
+            return _embedding_matrix(view, selected, len(row))
+    return None
+
+
+# Candidates of compact results by place_id (references, not copies), for lookup_place_cards
+_card_cache: LRUTTLCache[Dict[str, Any]] = LRUTTLCache(
+    maxsize=int(os.getenv("RANKING_CARD_CACHE_SIZE", "2048")), ttl=3600
+)
+
+
+def _scored_result(
+    candidate: Dict[str, Any], components: Dict[str, np.ndarray], i: int, compact: bool = False
+) -> Dict[str, Any]:
+    """The candidate with its scores, or only its place_id and scores when compact."""
+    if compact:
+        place_id = candidate.get('place_id')
+        if place_id:
+            _card_cache.set(place_id, candidate)
+        scored_result = {'place_id': place_id}
+    else:
+        scored_result = candidate.copy()
+    scored_result['final_score'] = float(components["final"][i])
+    scored_result['score_breakdown'] = {
+        'similarity': round(float(components["similarity"][i]), 3),
+        'rating': round(float(components["rating"][i]), 3),
+        'attributes': round(float(components["attributes"][i]), 3),
+        'distance': round(float(components["distance"][i]), 3)
+    }
+    distance_km = float(components["distance_km"][i])
+    if not math.isnan(distance_km):
+        # A distance the caller supplied is passed through as given; only computed ones are rounded
+        given = candidate.get('distance_km')
+        scored_result['distance_km'] = given if given == distance_km else round(distance_km, 3)
+        if "travel_minutes" in components:
+            scored_result['travel_minutes'] = round(float(components["travel_minutes"][i]), 1)
+    return scored_result
+
+
+# --- Filter compiler ---
+# filter_by_attributes' hard requirements are compiled once into a chain of predicates
+# (price levels as integer ranks, type lists as sets) instead of re-reading the
+# requirements for every candidate.
+
+class _Predicate(NamedTuple):
+    name: str
+    cost: float  # relative evaluation cost, used to order the chain
+    test: Callable[[Dict[str, Any]], bool]  # True keeps the candidate
+
+
+def _open_now_test(open_now: Any) -> Callable[[Dict[str, Any]], bool]:
+    return lambda c: c.get('isOpen', True) == open_now
+
+
+def _min_rating_test(min_rating: float) -> Callable[[Dict[str, Any]], bool]:
+    return lambda c: not c.get('rating', 0.0) < min_rating
+
+
+def _max_price_test(max_rank: int) -> Callable[[Dict[str, Any]], bool]:
+    price_rank = PRICE_LEVEL_RANK.get
+    return lambda c: price_rank(c.get('priceLevel', 'PRICE_LEVEL_UNSPECIFIED'), -1) <= max_rank
+
+
+def _required_types_test(required_types: frozenset) -> Callable[[Dict[str, Any]], bool]:
+    return lambda c: not required_types.isdisjoint(c.get('types') or ())
+
+
+def _exclude_types_test(exclude_types: frozenset) -> Callable[[Dict[str, Any]], bool]:
+    return lambda c: exclude_types.isdisjoint(c.get('types') or ())
+
+
+def _compile_predicates(required_attributes: Dict[str, Any]) -> List[_Predicate]:
+    predicates: List[_Predicate] = []
+    if 'open_now' in required_attributes:
+        predicates.append(_Predicate(
+            'open_now', 1.0, _open_now_test(required_attributes['open_now'])
+        ))
+    if 'min_rating' in required_attributes:
+        predicates.append(_Predicate(
+            'min_rating', 1.0, _min_rating_test(required_attributes['min_rating'])
+        ))
+    max_rank = PRICE_LEVEL_RANK.get(required_attributes.get('max_price'))
+    if max_rank is not None:
+        # Unknown price levels pass, as they cannot be compared
+        predicates.append(_Predicate('max_price', 1.5, _max_price_test(max_rank)))
+    if 'required_types' in required_attributes:
+        predicates.append(_Predicate(
+            'required_types', 2.0,
+            _required_types_test(frozenset(required_attributes['required_types'])),
+        ))
+    if 'exclude_types' in required_attributes:
+        predicates.append(_Predicate(
+            'exclude_types', 2.0,
+            _exclude_types_test(frozenset(required_attributes['exclude_types'])),
+        ))
+    return predicates
+
+
+def _compile_chain(predicates: Sequence[_Predicate]) -> Callable[[Dict[str, Any]], bool]:
+    """One function evaluating the predicate tests in order, stopping at the first failure."""
+    tests = tuple(p.test for p in predicates)
+    if not tests:
+        return lambda c: True
+    if len(tests) == 1:
+        return tests[0]
+    return lambda c: all(test(c) for test in tests)
+
+
+class CandidateFilter:
+    """Hard requirements compiled into a single predicate chain that stops at the first failure.
+
+    For larger candidate lists the chain is reordered by selectivity measured on a sample:
+    predicates that reject the most candidates per unit of cost run first.
+    """
+
+    SAMPLE_SIZE = 64
+
+    def __init__(self, required_attributes: Optional[Dict[str, Any]]) -> None:
+        self.required_attributes = required_attributes or {}
+        self.predicates = _compile_predicates(self.required_attributes)
+        self._keep = _compile_chain(self.predicates)
+
+    def order_by_selectivity(self, candidates: Sequence[Dict[str, Any]]) -> None:
+        sample = [candidates[i] for i in range(min(len(candidates), self.SAMPLE_SIZE))]
+        if not sample or len(self.predicates) < 2:
+            return
+        floor = 1.0 / (2 * len(sample))  # predicates that rejected nothing in the sample
+
+        def rank(predicate: _Predicate) -> float:
+            rejected = sum(1 for c in sample if not predicate.test(c)) / len(sample)
+            return predicate.cost / max(rejected, floor)
+
+        self.predicates.sort(key=rank)
+        self._keep = _compile_chain(self.predicates)
+
+    def accepts(self, candidate: Dict[str, Any]) -> bool:
+        return self._keep(candidate)
+
+    def apply(self, candidates: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """The candidates passing every predicate, in input order."""
+        if len(candidates) > 2 * self.SAMPLE_SIZE:
+            self.order_by_selectivity(candidates)
+        keep = self._keep
+        return [c for c in candidates if keep(c)]
+
+    def indices(self, candidates: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """Indices of the candidates passing every predicate, in input order."""
+        if not self.predicates:
+            return np.arange(len(candidates))
+        if len(candidates) > 2 * self.SAMPLE_SIZE:
+            self.order_by_selectivity(candidates)
+        keep = self._keep
+        return np.asarray([i for i, c in enumerate(candidates) if keep(c)], dtype=np.intp)
+
+
+class _CandidateView(Sequence):
+    """Read-only view of the candidates at `indices`, so filtered candidates are scored in place."""
+
+    def __init__(self, candidates: Sequence[Dict[str, Any]], indices: np.ndarray) -> None:
+        self._candidates = candidates
+        self._indices = indices
+
+    def __len__(self) -> int:
+        return len(self._indices)
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:  # type: ignore[override]
+        return self._candidates[self._indices[i]]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        candidates = self._candidates
+        return (candidates[i] for i in self._indices)
+
+
+def _select_embeddings(
+    candidate_embeddings: Optional[CandidateEmbeddings], indices: np.ndarray
+) -> Optional[CandidateEmbeddings]:
+    """Rows of candidate-aligned embeddings for the filtered candidates."""
+    if candidate_embeddings is None or isinstance(candidate_embeddings, dict):
+        return candidate_embeddings
+    if isinstance(candidate_embeddings, np.ndarray):
+        return candidate_embeddings[indices]
+    return [candidate_embeddings[i] for i in indices]
+
+
+# --- Named weight sets ---
+
+_weight_set_cache: LRUTTLCache[Dict[str, float]] = LRUTTLCache(maxsize=32, ttl=60)
+
+
+def weight_set_path(name: str) -> str:
+    if not _WEIGHT_SET_NAME.match(name):
+        raise ValueError(f"Invalid weight set name: {name!r}")
+    return os.path.join(os.getenv("RANKING_WEIGHTS_DIR", DEFAULT_WEIGHTS_DIR), f"{name}.json")
+
+
+def load_weight_set(name: str) -> Dict[str, float]:
+    """Weights of a named weight file, cached for a minute so re-tuned files are picked up."""
+    path = weight_set_path(name)
+
+    def read() -> Dict[str, float]:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        weights = {k: float(v) for k, v in (data.get("weights") or {}).items() if k in DEFAULT_WEIGHTS}
+        if not weights:
+            raise ValueError(f"Weight set {name!r} has no ranking weights")
+        return weights
+
+    return dict(_weight_set_cache.get_or_set(path, read))
+
+
+def _named_weights(weight_set: Optional[str]) -> Dict[str, float]:
+    """An explicit weight_set must load; the RANKING_WEIGHT_SET default falls back to the defaults."""
+    name = weight_set or os.getenv("RANKING_WEIGHT_SET")
+    if not name:
+        return {}
+    try:
+        return load_weight_set(name)
+    except (OSError, ValueError) as e:
+        if weight_set:
+            raise
+        logger.warning(f"Ignoring RANKING_WEIGHT_SET={name}: {e}")
+        return {}
+
+
 @tool("rank_restaurants_by_profile")
 def rank_restaurants_by_profile(
     candidates: List[Dict[str, Any]],
     user_profile: Dict[str, Any],
     top_n: int = 5,
-    weights: Optional[Dict[str, float]] = None
+    weights: Optional[Dict[str, float]] = None,
+    user_embedding: Optional[List[float]] = None,
+    candidate_embeddings: Optional[Union[List[Optional[List[float]]], Dict[str, List[float]]]] = None,
+    fetch_embeddings: bool = False,
+    user_location: Optional[Dict[str, float]] = None,
+    travel_mode: Optional[str] = None,
+    required_attributes: Optional[Dict[str, Any]] = None,
+    diversity: float = 0.0,
+    weight_set: Optional[str] = None,
+    compact: bool = False
 ) -> Dict[str, Any]:
     """
     Rank restaurants using multi-factor scoring algorithm.
@@ -172,18 +977,41 @@ def rank_restaurants_by_profile(
     Args:
         candidates: List of restaurant dicts with similarity scores from vector search
         user_profile: User profile with keywords, attributes (price_band, diet, style, region)
+                      and optionally its embedding (embedding_profile or embedding)
         top_n: Number of top results to return (default: 5)
         weights: Optional custom weights for scoring factors
                  Default: similarity=0.35, rating=0.25, attributes=0.25, distance=0.15
+        weight_set: Optional name of a tuned weight set (see weight_tuning.py); defaults to
+                    RANKING_WEIGHT_SET. Explicit `weights` override its entries.
+        user_embedding: Optional user embedding; defaults to the profile's embedding
+        candidate_embeddings: Optional candidate embeddings, aligned with candidates or keyed
+                              by place_id; defaults to each candidate's `embedding` field
+        fetch_embeddings: Look up missing candidate embeddings by place_id in the local
+                          place-vector cache / Pinecone index (e.g. for graph-expanded places)
+        user_location: Optional origin {"lat": ..., "lng": ...}; defaults to the profile's
+                       location. Distances are computed from each candidate's location.
+        travel_mode: Optional "walk", "transit" or "drive" to score proximity by the
+                     approximate travel time instead of the distance
+        required_attributes: Optional hard filters, as in filter_by_attributes, applied
+                             before scoring in the same call
+        diversity: 0 (default) ranks purely by score. Between 0 and 1, the top N are picked
+                   by maximal marginal relevance, trading score for dissimilarity (embedding
+                   and location) to the places already picked, e.g. 0.3
+        compact: Return only place_id, final_score, score_breakdown (and distance_km /
+                 travel_minutes) per result instead of a copy of the whole candidate;
+                 fetch name, address, photos etc. with lookup_place_cards
     
     Returns:
         Dictionary with ranked results and scoring details
     
     Scoring Algorithm:
-        1. Similarity Score (35%): From vector embedding match (Pinecone)
-        2. Rating Score (25%): Bayesian average of rating + review count
+        1. Similarity Score (35%): Cosine similarity of user and candidate embeddings when
+           both are available, else the vector search score (Pinecone)
+        2. Rating Score (25%): Bayesian average of rating + review count, with the prior
+           calibrated per region/category from the ingested places once enough are known
         3. Attribute Match (25%): Match against user preferences (cuisine, price, diet, style)
-        4. Distance Score (15%): Proximity to user location (exponential decay)
+        4. Distance Score (15%): Proximity to user location (exponential decay of the
+           great-circle distance, or of the approximate travel time with travel_mode)
         
     Each restaurant gets a final score (0-1) and is ranked accordingly.
     """
@@ -194,70 +1022,55 @@ def rank_restaurants_by_profile(
             "top_n": top_n,
             "error": None
         }
-    
-    # Default weights
-    default_weights = {
-        "similarity": 0.35,
-        "rating": 0.25,
-        "attributes": 0.25,
-        "distance": 0.15
-    }
-    
-    if weights:
-        default_weights.update(weights)
-    
-    w = default_weights
-    user_attributes = user_profile.get('attributes', {})
-    
-    # Score each candidate
-    scored_results = []
-    
-    for candidate in candidates:
-        # Extract fields
-        similarity = candidate.get('score', 0.0)  # From Pinecone
-        rating = candidate.get('rating', 0.0)
-        rating_count = candidate.get('userRatingCount', 0)
-        distance_km = candidate.get('distance_km')  # Optional
-        
-        # Calculate component scores
-        similarity_score = _calculate_similarity_score(similarity)
-        rating_score = _calculate_rating_score(rating, rating_count)
-        attribute_score = _match_attributes(candidate, user_attributes)
-        distance_score = _calculate_distance_score(distance_km)
-        
-        # Weighted final score
-        final_score = (
-            w['similarity'] * similarity_score +
-            w['rating'] * rating_score +
-            w['attributes'] * attribute_score +
-            w['distance'] * distance_score
-        )
-        
-        # Add scoring details to result
-        scored_result = candidate.copy()
-        scored_result['final_score'] = round(final_score, 4)
-        scored_result['score_breakdown'] = {
-            'similarity': round(similarity_score, 3),
-            'rating': round(rating_score, 3),
-            'attributes': round(attribute_score, 3),
-            'distance': round(distance_score, 3)
+    error = _travel_mode_error(travel_mode)
+    if error:
+        return {
+            "ranked_results": [],
+            "total_candidates": len(candidates),
+            "top_n": top_n,
+            "error": error
         }
-        
-        scored_results.append(scored_result)
     
-    # Sort by final score (descending)
-    ranked = sorted(scored_results, key=lambda x: x['final_score'], reverse=True)
+    w = {**DEFAULT_WEIGHTS, **_named_weights(weight_set), **(weights or {})}
+    total_candidates = len(candidates)
+    kept: Optional[np.ndarray] = None
+    if required_attributes:
+        # Score the passing candidates in place instead of building a filtered list
+        kept = CandidateFilter(required_attributes).indices(candidates)
+        candidates = _CandidateView(candidates, kept)
+        candidate_embeddings = _select_embeddings(candidate_embeddings, kept)
+    if user_embedding is None:
+        user_embedding = user_profile.get('embedding_profile') or user_profile.get('embedding')
+    if user_embedding and fetch_embeddings and candidate_embeddings is None:
+        candidate_embeddings = _fetch_place_embeddings(candidates)
     
-    # Return top N
-    top_results = ranked[:top_n]
+    # Score all candidates at once; only the top N are copied into the result
+    components = profile_components(
+        candidates, user_profile, w, user_embedding, candidate_embeddings, user_location, travel_mode
+    )
+    final = components["final"]
+    if diversity > 0:
+        pool = top_n_indices(final, top_n * MMR_POOL_FACTOR)
+        lats, lngs = _location_columns(_CandidateView(candidates, pool))
+        embeddings = _pool_embeddings(candidates, candidate_embeddings, pool)
+        order = pool[mmr_order(final[pool], top_n, min(diversity, 1.0), embeddings, lats, lngs)]
+    else:
+        order = top_n_indices(final, top_n)
+    top_results = [_scored_result(candidates[i], components, int(i), compact) for i in order]
     
-    return {
+    result = {
         "ranked_results": top_results,
-        "total_candidates": len(candidates),
+        "total_candidates": total_candidates,
         "top_n": top_n,
         "weights_used": w,
         "error": None
     }
+    if diversity > 0:
+        result["diversity"] = min(diversity, 1.0)
+    if kept is not None:
+        result["filtered_count"] = len(kept)
+        result["filters_applied"] = required_attributes
+    return result
 
 
 @tool("filter_by_attributes")
@@ -300,48 +1113,8 @@ def filter_by_attributes(
             "filters_applied": required_attributes
         }
     
-    filtered = []
-    
-    for candidate in candidates:
-        # Check min_rating
-        if 'min_rating' in required_attributes:
-            min_rating = required_attributes['min_rating']
-            if candidate.get('rating', 0.0) < min_rating:
-                continue
-        
-        # Check max_price
-        if 'max_price' in required_attributes:
-            max_price = required_attributes['max_price']
-            price_order = ['PRICE_LEVEL_FREE', 'PRICE_LEVEL_INEXPENSIVE', 
-                          'PRICE_LEVEL_MODERATE', 'PRICE_LEVEL_EXPENSIVE', 
-                          'PRICE_LEVEL_VERY_EXPENSIVE']
-            
-            restaurant_price = candidate.get('priceLevel', 'PRICE_LEVEL_UNSPECIFIED')
-            if restaurant_price in price_order and max_price in price_order:
-                if price_order.index(restaurant_price) > price_order.index(max_price):
-                    continue
-        
-        # Check required_types
-        if 'required_types' in required_attributes:
-            required = required_attributes['required_types']
-            restaurant_types = candidate.get('types', [])
-            if not any(req in restaurant_types for req in required):
-                continue
-        
-        # Check exclude_types
-        if 'exclude_types' in required_attributes:
-            excluded = required_attributes['exclude_types']
-            restaurant_types = candidate.get('types', [])
-            if any(exc in restaurant_types for exc in excluded):
-                continue
-        
-        # Check open_now
-        if 'open_now' in required_attributes:
-            if required_attributes['open_now'] != candidate.get('isOpen', True):
-                continue
-        
-        # Passed all filters
-        filtered.append(candidate)
+    # Compile the requirements once; each candidate then runs the predicate chain
+    filtered = CandidateFilter(required_attributes).apply(candidates)
     
     return {
         "filtered_results": filtered,
@@ -350,3 +1123,205 @@ def filter_by_attributes(
         "filters_applied": required_attributes
     }
 
+
+@tool("lookup_place_cards")
+def lookup_place_cards(
+    place_ids: List[str],
+    fields: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Look up the card fields of places returned by a compact ranking.
+    
+    Args:
+        place_ids: Place ids from rank_restaurants_by_profile(compact=True) results
+        fields: Optional fields to return; defaults to name, address, location, rating,
+                review count, price level, types, photos, summary and Google Maps link
+    
+    Returns:
+        Dictionary with one card per known place_id (in request order) and the ids
+        that are unknown or expired
+    """
+    fields = fields or list(CARD_FIELDS)
+    cards = []
+    missing = []
+    for place_id in place_ids:
+        candidate = _card_cache.get(place_id)
+        if candidate is None:
+            missing.append(place_id)
+            continue
+        card = {'place_id': place_id}
+        card.update((f, candidate[f]) for f in fields if candidate.get(f) is not None)
+        cards.append(card)
+    return {"cards": cards, "missing": missing}
+
+
+# --- Batch ranking ---
+# Several users ranked against the same candidates (e.g. simultaneous requests from one
+# area) share everything that depends only on the candidates: the hard filter, rating
+# scores and priors, locations and the normalized embedding matrix. Only similarity,
+# attributes and distance are per user, and similarity is one matrix product.
+
+class CandidatePool:
+    """Per-candidate features computed once for ranking many users."""
+
+    def __init__(
+        self,
+        candidates: Sequence[Dict[str, Any]],
+        candidate_embeddings: Optional[CandidateEmbeddings] = None,
+    ) -> None:
+        self.candidates = candidates
+        self.candidate_embeddings = candidate_embeddings
+        self.searched = _column(candidates, "score")
+        self.given_distance_km = _column(candidates, "distance_km", math.nan)
+        prior_store = get_prior_store()
+        rating_priors = candidate_rating_priors(candidates, prior_store) if prior_store.calibrated else None
+        self.rating = _rating_scores(
+            _column(candidates, "rating"), _column(candidates, "userRatingCount"), *(rating_priors or ())
+        )
+        self.lats, self.lngs = _location_columns(candidates)
+        # Unit embedding rows (zero where missing) and the has-embedding mask, per dimension
+        self._unit: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self._attributes: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.candidates)
+
+    def _unit_embeddings(self, dim: int) -> Tuple[np.ndarray, np.ndarray]:
+        unit = self._unit.get(dim)
+        if unit is None:
+            matrix = _embedding_matrix(self.candidates, self.candidate_embeddings, dim)
+            norms = np.linalg.norm(matrix, axis=1)
+            rows = np.divide(matrix, norms[:, None], out=np.zeros_like(matrix), where=norms[:, None] > 0)
+            unit = self._unit[dim] = (rows, norms > 0)
+        return unit
+
+    def similarities(self, user_embeddings: Sequence[Optional[Sequence[float]]]) -> np.ndarray:
+        """(users, candidates) raw similarities, as candidate_similarities gives for each user.
+
+        Users sharing an embedding dimension are scored in one matrix product.
+        """
+        sims = np.tile(self.searched, (len(user_embeddings), 1))
+        by_dim: Dict[int, List[int]] = {}
+        for u, embedding in enumerate(user_embeddings):
+            if embedding is not None and len(embedding) and np.any(embedding):
+                by_dim.setdefault(len(embedding), []).append(u)
+        for dim, users in by_dim.items():
+            unit, has_embedding = self._unit_embeddings(dim)
+            queries = np.asarray([user_embeddings[u] for u in users], dtype=np.float32)
+            queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+            sims[users] = np.where(has_embedding, queries @ unit.T, self.searched)
+        return sims
+
+    def distances(self, origins: Sequence[Optional[Tuple[float, float]]]) -> np.ndarray:
+        """(users, candidates) distances (km) from each user's origin, as candidate_distances."""
+        distance_km = np.tile(self.given_distance_km, (len(origins), 1))
+        located = [u for u, origin in enumerate(origins) if origin is not None]
+        if located:
+            coords = np.asarray([origins[u] for u in located], dtype=np.float64)
+            computed = haversine_distances(coords[:, :1], coords[:, 1:], self.lats, self.lngs)
+            distance_km[located] = np.where(np.isnan(computed), distance_km[located], computed)
+        return distance_km
+
+    def attribute_scores(self, user_attributes: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Attribute match column for one set of user attributes; shared by users with equal ones."""
+        key = json.dumps(user_attributes or {}, sort_keys=True, default=str)
+        scores = self._attributes.get(key)
+        if scores is None:
+            scores = self._attributes[key] = compile_attribute_matcher(user_attributes).scores(self.candidates)
+        return scores
+
+
+def rank_profiles_batch(
+    candidates: List[Dict[str, Any]],
+    user_profiles: Sequence[Dict[str, Any]],
+    top_n: int = 5,
+    weights: Optional[Dict[str, float]] = None,
+    weight_set: Optional[str] = None,
+    candidate_embeddings: Optional[CandidateEmbeddings] = None,
+    fetch_embeddings: bool = False,
+    travel_mode: Optional[str] = None,
+    required_attributes: Optional[Dict[str, Any]] = None,
+    diversity: float = 0.0,
+    compact: bool = False,
+) -> List[Dict[str, Any]]:
+    """rank_restaurants_by_profile for many users over one candidate pool.
+
+    Returns one result per profile, in order, each as the tool would return it for that
+    profile (with the user embedding and origin taken from the profile). The filter,
+    embedding fetch and candidate-only features run once for the whole batch.
+    """
+    w = {**DEFAULT_WEIGHTS, **_named_weights(weight_set), **(weights or {})}
+    total_candidates = len(candidates)
+    if not candidates:
+        return [
+            {"ranked_results": [], "total_candidates": 0, "top_n": top_n, "error": None}
+            for _ in user_profiles
+        ]
+    error = _travel_mode_error(travel_mode)
+    if error:
+        return [
+            {"ranked_results": [], "total_candidates": total_candidates, "top_n": top_n, "error": error}
+            for _ in user_profiles
+        ]
+    kept: Optional[np.ndarray] = None
+    if required_attributes:
+        kept = CandidateFilter(required_attributes).indices(candidates)
+        candidates = _CandidateView(candidates, kept)
+        candidate_embeddings = _select_embeddings(candidate_embeddings, kept)
+    user_embeddings = [p.get('embedding_profile') or p.get('embedding') for p in user_profiles]
+    if fetch_embeddings and candidate_embeddings is None and any(user_embeddings):
+        candidate_embeddings = _fetch_place_embeddings(candidates)
+
+    pool = CandidatePool(candidates, candidate_embeddings)
+    similarity = _similarity_scores(pool.similarities(user_embeddings))
+    distance_km = pool.distances([_user_origin(p.get('location')) for p in user_profiles])
+    minutes = travel_minutes(distance_km, travel_mode) if travel_mode else None
+    distance = _travel_time_scores(minutes) if minutes is not None else _distance_scores(distance_km)
+    attributes = np.array(
+        [pool.attribute_scores(p.get('attributes', {})) for p in user_profiles]
+    ).reshape(len(user_profiles), len(pool))
+    # Rounded once, as in score_candidates, so the ranking and the emitted final_score agree
+    final = np.round(
+        w["similarity"] * similarity +
+        w["rating"] * pool.rating +
+        w["attributes"] * attributes +
+        w["distance"] * distance,
+        4,
+    )
+
+    results = []
+    for u in range(len(user_profiles)):
+        components = {
+            "similarity": similarity[u],
+            "rating": pool.rating,
+            "attributes": attributes[u],
+            "distance": distance[u],
+            "distance_km": distance_km[u],
+            "final": final[u],
+        }
+        if minutes is not None:
+            components["travel_minutes"] = minutes[u]
+        if diversity > 0:
+            shortlist = top_n_indices(final[u], top_n * MMR_POOL_FACTOR)
+            embeddings = _pool_embeddings(candidates, candidate_embeddings, shortlist)
+            picks = mmr_order(
+                final[u][shortlist], top_n, min(diversity, 1.0), embeddings,
+                pool.lats[shortlist], pool.lngs[shortlist]
+            )
+            order = shortlist[picks]
+        else:
+            order = top_n_indices(final[u], top_n)
+        result = {
+            "ranked_results": [_scored_result(candidates[i], components, int(i), compact) for i in order],
+            "total_candidates": total_candidates,
+            "top_n": top_n,
+            "weights_used": dict(w),
+            "error": None
+        }
+        if diversity > 0:
+            result["diversity"] = min(diversity, 1.0)
+        if kept is not None:
+            result["filtered_count"] = len(kept)
+            result["filters_applied"] = required_attributes
+        results.append(result)
+    return results
@@ -0,0 +1,300 @@
+"""
+Micro-benchmarks for the ranking tools on synthetic candidate pools.
+
+`synthetic_candidates` builds a pool of N restaurants shaped like normalized Places
+data (cuisine and generic types, price levels, ratings with review counts, locations
+around a city centre, vector-search scores) plus an (N, dim) embedding matrix whose
+rows cluster by cuisine; `synthetic_profiles` builds matching user profiles. Each case
+below is timed best-of-`repeat` per pool size and run once more under tracemalloc for
+its peak allocation. Results are compared with a stored baseline: a case regresses
+when it is slower (or allocates more) than the baseline by more than the tolerance
+and by more than a small absolute margin, so noise on sub-millisecond cases does not
+fail a run. The tool functions are called directly (`.func`), without LangChain's
+argument validation, so the numbers are the ranker's own cost.
+
+    python -m whats_eat.tools.ranking_bench --sizes 100 1000 10000 100000 --save-baseline
+    python -m whats_eat.tools.ranking_bench --sizes 100 1000 10000 100000   # exit 1 on regression
+"""
+from __future__ import annotations
+
+import json
+import os
+import platform
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from whats_eat.tools.ranking import (
+    PRICE_LEVEL_ORDER,
+    filter_by_attributes,
+    rank_profiles_batch,
+    rank_restaurants_by_profile,
+)
+
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+DEFAULT_BASELINE_PATH = os.path.join(os.path.expanduser("~"), ".whats_eat", "ranking_bench.json")
+
+# Singapore; candidates are spread over about +-15 km
+CITY_CENTER = (1.3521, 103.8198)
+CITY_SPREAD_DEG = 0.13
+
+CUISINES = (
+    "thai_restaurant", "japanese_restaurant", "malaysian_restaurant", "chinese_restaurant",
+    "indian_restaurant", "italian_restaurant", "korean_restaurant", "vegetarian_restaurant",
+    "vegan_restaurant", "seafood_restaurant", "ramen_restaurant", "cafe",
+)
+STYLE_TYPES = ("casual_dining", "fine_dining", "street_food", "food_truck", "upscale", "bar")
+NAME_WORDS = ("Garden", "House", "Kitchen", "Corner", "Bar", "Bowl", "Table", "Noodle", "Grill")
+
+# Hard filters for the filter cases: three predicates, about half the pool passes
+BENCH_FILTERS = {"min_rating": 4.0, "max_price": "PRICE_LEVEL_EXPENSIVE", "exclude_types": ["bar"]}
+
+BATCH_USERS = 16
+TOP_N = 10
+
+# A case regresses only if it is also slower / larger than the baseline by these margins
+MIN_REGRESSION_SECONDS = 0.002
+MIN_REGRESSION_BYTES = 64 * 1024
+
+
+def synthetic_candidates(n: int, seed: int = 0, dim: int = 64) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+    """N Places-like candidates and their (n, dim) float32 unit embeddings, clustered by cuisine."""
+    rng = np.random.default_rng(seed)
+    cuisine = rng.integers(len(CUISINES), size=n)
+    style = rng.integers(len(STYLE_TYPES), size=n)
+    has_style = rng.random(n) < 0.6
+    rating = np.round(np.clip(rng.normal(4.2, 0.35, n), 1.0, 5.0), 1)
+    rating[rng.random(n) < 0.05] = 0.0  # unrated places
+    counts = np.rint(rng.lognormal(4.0, 1.5, n)).astype(int)
+    prices = PRICE_LEVEL_ORDER + ["PRICE_LEVEL_UNSPECIFIED"]
+    price = rng.choice(len(prices), size=n, p=[0.05, 0.3, 0.35, 0.15, 0.05, 0.1])
+    lats = CITY_CENTER[0] + rng.uniform(-CITY_SPREAD_DEG, CITY_SPREAD_DEG, n)
+    lngs = CITY_CENTER[1] + rng.uniform(-CITY_SPREAD_DEG, CITY_SPREAD_DEG, n)
+    scored = rng.random(n) < 0.8
+    scores = rng.uniform(0.1, 0.9, n)
+    open_now = rng.random(n) < 0.7
+
+    candidates = []
+    for i in range(n):
+        types = [CUISINES[cuisine[i]], "restaurant", "food", "point_of_interest", "establishment"]
+        if has_style[i]:
+            types.insert(1, STYLE_TYPES[style[i]])
+        c: Dict[str, Any] = {
+            "place_id": f"bench{i}",
+            "name": f"{CUISINES[cuisine[i]].split('_')[0].title()} {NAME_WORDS[i % len(NAME_WORDS)]} {i}",
+            "formatted_address": f"{i} Bench Road, Singapore",
+            "types": types,
+            "rating": float(rating[i]),
+            "userRatingCount": int(counts[i]),
+            "priceLevel": prices[price[i]],
+            "location": {"latitude": float(lats[i]), "longitude": float(lngs[i])},
+            "isOpen": bool(open_now[i]),
+            "addressComponents": [{"types": ["country"], "shortText": "SG"}],
+        }
+        if scored[i]:
+            c["score"] = float(scores[i])
+        candidates.append(c)
+
+    centers = rng.standard_normal((len(CUISINES), dim)).astype(np.float32)
+    embeddings = centers[cuisine] + 0.8 * rng.standard_normal((n, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return candidates, embeddings
+
+
+def synthetic_profiles(n: int, seed: int = 0, dim: int = 64) -> List[Dict[str, Any]]:
+    """N user profiles with attributes, an embedding and a location in the same city."""
+    rng = np.random.default_rng(seed + 1)
+    regions = ["Thai", "Japanese", "Malaysian", "Chinese", "Indian", "Italian", "Korean"]
+    profiles = []
+    for _ in range(n):
+        embedding = rng.standard_normal(dim)
+        profiles.append({
+            "attributes": {
+                "price_band": str(rng.choice(["budget", "mid", "upscale"])),
+                "diet": ["vegetarian"] if rng.random() < 0.2 else [],
+                "region": [str(r) for r in rng.choice(regions, size=2, replace=False)],
+                "style": [str(rng.choice(["casual", "street food", "fine dining"]))],
+            },
+            "embedding": (embedding / np.linalg.norm(embedding)).tolist(),
+            "location": {
+                "lat": CITY_CENTER[0] + float(rng.uniform(-0.05, 0.05)),
+                "lng": CITY_CENTER[1] + float(rng.uniform(-0.05, 0.05)),
+            },
+        })
+    return profiles
+
+
+def _cases(
+    candidates: List[Dict[str, Any]], embeddings: np.ndarray, profiles: List[Dict[str, Any]]
+) -> Dict[str, Callable[[], Any]]:
+    plain = {"attributes": profiles[0]["attributes"]}
+    rank = rank_restaurants_by_profile.func
+    return {
+        "filter": lambda: filter_by_attributes.func(candidates, BENCH_FILTERS),
+        "rank": lambda: rank(candidates, plain, top_n=TOP_N),
+        "rank_full": lambda: rank(
+            candidates, profiles[0], top_n=TOP_N, candidate_embeddings=embeddings,
+            required_attributes=BENCH_FILTERS, travel_mode="walk", compact=True,
+        ),
+        "rank_diverse": lambda: rank(
+            candidates, profiles[0], top_n=TOP_N, candidate_embeddings=embeddings, diversity=0.3
+        ),
+        "rank_batch": lambda: rank_profiles_batch(
+            candidates, profiles, top_n=TOP_N, candidate_embeddings=embeddings, compact=True
+        ),
+    }
+
+
+CASES = ("filter", "rank", "rank_full", "rank_diverse", "rank_batch")
+
+
+def _measure(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    fn()  # warm caches (compiled matchers, weight sets) like a long-running process
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "seconds": round(min(timings), 6),
+        "median_seconds": round(float(np.median(timings)), 6),
+        "peak_bytes": int(peak),
+    }
+
+
+def run_benchmarks(
+    sizes: Sequence[int] = DEFAULT_SIZES,
+    repeat: int = 5,
+    dim: int = 64,
+    cases: Optional[Sequence[str]] = None,
+    seed: int = 0,
+    on_result: Optional[Callable[[str, Dict[str, float]], None]] = None,
+) -> Dict[str, Any]:
+    """Time every case on a synthetic pool of each size; results are keyed "<case>@<size>"."""
+    unknown = set(cases or ()) - set(CASES)
+    if unknown:
+        raise ValueError(f"Unknown benchmark case(s): {sorted(unknown)} (expected {CASES})")
+    profiles = synthetic_profiles(BATCH_USERS, seed, dim)
+    results: Dict[str, Dict[str, float]] = {}
+    for size in sizes:
+        candidates, embeddings = synthetic_candidates(size, seed, dim)
+        available = _cases(candidates, embeddings, profiles)
+        for case in cases or CASES:
+            key = f"{case}@{size}"
+            results[key] = _measure(available[case], repeat)
+            if on_result is not None:
+                on_result(key, results[key])
+    return {
+        "dim": dim,
+        "repeat": repeat,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(
+    report: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float = 0.3,
+    memory_tolerance: float = 0.1,
+) -> List[str]:
+    """Regressions of `report` against `baseline`, one message per slower or larger case."""
+    regressions = []
+    previous = baseline.get("results") or {}
+    for key, result in report.get("results", {}).items():
+        before = previous.get(key)
+        if before is None:
+            continue
+        seconds, base_seconds = result["seconds"], before["seconds"]
+        if seconds > base_seconds * (1 + tolerance) and seconds - base_seconds > MIN_REGRESSION_SECONDS:
+            regressions.append(
+                f"{key}: {seconds * 1000:.2f} ms vs baseline {base_seconds * 1000:.2f} ms "
+                f"(+{(seconds / base_seconds - 1) * 100:.0f}%)"
+            )
+        peak, base_peak = result["peak_bytes"], before["peak_bytes"]
+        if peak > base_peak * (1 + memory_tolerance) and peak - base_peak > MIN_REGRESSION_BYTES:
+            regressions.append(
+                f"{key}: peak {peak / 1024:.0f} KiB vs baseline {base_peak / 1024:.0f} KiB "
+                f"(+{(peak / base_peak - 1) * 100:.0f}%)"
+            )
+    return regressions
+
+
+def save_baseline(report: Dict[str, Any], path: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def load_baseline(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+__all__ = [
+    "CASES",
+    "DEFAULT_SIZES",
+    "synthetic_candidates",
+    "synthetic_profiles",
+    "run_benchmarks",
+    "compare",
+    "save_baseline",
+    "load_baseline",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Benchmark the ranking tools on synthetic candidates")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Pool sizes")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=None, help="Cases to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case (best is kept)")
+    parser.add_argument("--dim", type=int, default=64, help="Embedding dimension")
+    parser.add_argument(
+        "--baseline", default=os.getenv("RANKING_BENCH_BASELINE", DEFAULT_BASELINE_PATH),
+        help="Baseline JSON to compare against (RANKING_BENCH_BASELINE)",
+    )
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Allowed slowdown (0.3 = 30%%)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.1, help="Allowed peak memory growth")
+    args = parser.parse_args()
+
+    def show(key: str, result: Dict[str, float]) -> None:
+        print(
+            f"  {key:<22}{result['seconds'] * 1000:>10.2f} ms"
+            f"{result['median_seconds'] * 1000:>10.2f} ms median{result['peak_bytes'] / 1024:>12.0f} KiB peak"
+        )
+
+    report = run_benchmarks(args.sizes, args.repeat, args.dim, args.cases, on_result=show)
+    if args.save_baseline:
+        save_baseline(report, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
+        sys.exit(0)
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        sys.exit(0)
+    if baseline.get("dim") != report["dim"]:
+        print(f"Baseline was recorded with dim={baseline.get('dim')}; pass --dim to match")
+        sys.exit(2)
+    regressions = compare(report, baseline, args.tolerance, args.memory_tolerance)
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    print(f"{len(regressions)} regression(s) against {args.baseline}")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,325 @@
+"""
+Data-driven Bayesian rating priors for the ranking tools.
+
+The rating factor shrinks a place's rating towards a prior mean C with weight m (the
+review count at which the place's own rating counts as much as the prior). Instead of
+one fixed C and m for every market, `RatingPriorStore` derives them from the ingested
+places per (region, category): C is the mean rating of the rated places, m the median
+review count, estimated from a log-scale histogram. Ingestion updates running sums
+incrementally, and re-ingesting a place replaces its earlier contribution. Priors are
+re-resolved only for the keys that changed, so a lookup at ranking time is a few dict
+probes: (region, category), then the region, then the category, then the whole corpus,
+then the fixed defaults.
+
+The persisted file is rewritten in full, so writers save it at most every
+RAG_RATING_PRIORS_SAVE_INTERVAL seconds and on close, and `get_prior_store()` merges in
+a file changed by another process (e.g. a backfill) every RAG_RATING_PRIORS_RELOAD_INTERVAL
+seconds, without a restart.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# Place types shared by nearly every restaurant; they carry no signal for graph expansion
+# or for the category of a rating prior
+GENERIC_PLACE_TYPES = ("restaurant", "food", "point_of_interest", "establishment", "store")
+
+# Fixed prior used until a key has enough rated places
+DEFAULT_PRIOR_MEAN = 4.0
+DEFAULT_PRIOR_COUNT = 10
+
+# Review-count histogram: bucket 0 holds 0 reviews, bucket b holds [2^(b-1), 2^b)
+_COUNT_BUCKETS = 24
+
+ANY = "*"
+
+logger = logging.getLogger(__name__)
+
+
+def place_region(place: Dict[str, Any]) -> Optional[str]:
+    """ISO country code of a place, from a `region` field or its address components."""
+    if place.get("region"):
+        return str(place["region"])
+    for comp in place.get("addressComponents") or []:
+        if "country" in (comp.get("types") or []):
+            return comp.get("shortText") or comp.get("short_name")
+    return None
+
+
+def place_category(place: Dict[str, Any]) -> Optional[str]:
+    """First specific place type (e.g. "thai_restaurant"), skipping the generic ones."""
+    for place_type in place.get("types") or []:
+        place_type = str(place_type).lower()
+        if place_type not in GENERIC_PLACE_TYPES:
+            return place_type
+    return None
+
+
+def _key(region: Optional[str], category: Optional[str]) -> str:
+    return f"{(region or ANY).lower()}|{category or ANY}"
+
+
+def _bucket(count: float) -> int:
+    if count < 1:
+        return 0
+    return min(_COUNT_BUCKETS - 1, int(math.log2(count)) + 1)
+
+
+class _KeyStats:
+    __slots__ = ("places", "rating_sum", "histogram")
+
+    def __init__(self) -> None:
+        self.places = 0
+        self.rating_sum = 0.0
+        self.histogram = [0] * _COUNT_BUCKETS
+
+    def add(self, rating: float, count: float, sign: int) -> None:
+        self.places += sign
+        self.rating_sum += sign * rating
+        self.histogram[_bucket(count)] += sign
+
+    def median_count(self) -> float:
+        """Median review count, interpolated inside its histogram bucket."""
+        target = self.places / 2
+        seen = 0
+        for b, n in enumerate(self.histogram):
+            if n and seen + n >= target:
+                if b == 0:
+                    return 0.0
+                lo, hi = 2 ** (b - 1), 2 ** b
+                return lo + (hi - lo) * (target - seen) / n
+            seen += n
+        return 0.0
+
+
+class RatingPriorStore:
+    """Per-(region, category) rating priors maintained from the ingested places."""
+
+    def __init__(self, min_places: int = 20) -> None:
+        # Keys with fewer rated places fall back to the next broader key
+        self.min_places = min_places
+        # place_id -> (rating, review count, region, category) as last ingested
+        self._places: Dict[str, Tuple[float, float, Optional[str], Optional[str]]] = {}
+        self._stats: Dict[str, _KeyStats] = {}
+        self._priors: Dict[str, Tuple[float, float]] = {}
+        self._dirty: set = set()
+        self._lock = threading.RLock()
+        # Places changed since the last save, when that was, and the (mtime, size) of the
+        # file as last saved or loaded, to spot writes by other processes
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+        self._file_state: Optional[Tuple[int, int]] = None
+
+    def __len__(self) -> int:
+        return len(self._places)
+
+    def add_places(self, places: Iterable[Dict[str, Any]]) -> int:
+        """Fold places into the running statistics; unrated places are ignored."""
+        added = 0
+        with self._lock:
+            for place in places:
+                place_id = place.get("place_id")
+                try:
+                    rating = float(place.get("rating") or 0.0)
+                    count = float(place.get("userRatingCount") or 0)
+                except (TypeError, ValueError):
+                    continue
+                if not place_id or rating <= 0:
+                    continue
+                self._add_locked(str(place_id), rating, count, place_region(place), place_category(place))
+                added += 1
+        return added
+
+    def _add_locked(
+        self, place_id: str, rating: float, count: float, region: Optional[str], category: Optional[str]
+    ) -> None:
+        previous = self._places.get(place_id)
+        if previous is not None:
+            self._apply_locked(*previous, sign=-1)
+        self._places[place_id] = (rating, count, region, category)
+        self._apply_locked(rating, count, region, category, sign=1)
+        self._unsaved += 1
+
+    def _apply_locked(
+        self, rating: float, count: float, region: Optional[str], category: Optional[str], sign: int
+    ) -> None:
+        keys = {_key(region, category), _key(region, None), _key(None, category), _key(None, None)}
+        for key in keys:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _KeyStats()
+            stats.add(rating, count, sign)
+            self._dirty.add(key)
+
+    def update(self, other: "RatingPriorStore") -> None:
+        """Merge another store into this one; places in `other` win on id clashes."""
+        entries = other.to_dict()["places"]
+        with self._lock:
+            for place_id, (rating, count, region, category) in entries.items():
+                self._add_locked(place_id, float(rating), float(count), region, category)
+
+    def _resolve_locked(self) -> None:
+        for key in self._dirty:
+            stats = self._stats.get(key)
+            if stats is None or stats.places < self.min_places:
+                self._priors.pop(key, None)
+                continue
+            self._priors[key] = (stats.rating_sum / stats.places, max(1.0, stats.median_count()))
+        self._dirty.clear()
+
+    def prior(self, region: Optional[str] = None, category: Optional[str] = None) -> Tuple[float, float]:
+        """(C, m) for a region/category, from the most specific key with enough places."""
+        with self._lock:
+            if self._dirty:
+                self._resolve_locked()
+            priors = self._priors
+            for key in (_key(region, category), _key(region, None), _key(None, category), _key(None, None)):
+                prior = priors.get(key)
+                if prior is not None:
+                    return prior
+        return (DEFAULT_PRIOR_MEAN, DEFAULT_PRIOR_COUNT)
+
+    def prior_for(self, place: Dict[str, Any]) -> Tuple[float, float]:
+        return self.prior(place_region(place), place_category(place))
+
+    @property
+    def calibrated(self) -> bool:
+        """Whether any key has enough places to replace the fixed default prior."""
+        with self._lock:
+            if self._dirty:
+                self._resolve_locked()
+            return bool(self._priors)
+
+    def priors(self) -> Dict[str, Dict[str, float]]:
+        """Resolved priors by "region|category" key ("*" for any), for inspection."""
+        with self._lock:
+            if self._dirty:
+                self._resolve_locked()
+            return {
+                key: {"mean": round(c, 4), "count": round(m, 2), "places": self._stats[key].places}
+                for key, (c, m) in sorted(self._priors.items())
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._places.clear()
+            self._stats.clear()
+            self._priors.clear()
+            self._dirty.clear()
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "min_places": self.min_places,
+                "places": {pid: list(entry) for pid, entry in self._places.items()},
+            }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RatingPriorStore":
+        store = cls(min_places=int(data.get("min_places", 20)))
+        for place_id, (rating, count, region, category) in (data.get("places") or {}).items():
+            store._add_locked(place_id, float(rating), float(count), region, category)
+        store._unsaved = 0
+        return store
+
+    def save(self, path: str) -> None:
+        tmp = f"{path}.tmp"
+        with self._lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False)
+            os.replace(tmp, path)
+            self._unsaved = 0
+            self._saved_at = time.monotonic()
+            self._file_state = _file_state(path)
+
+    def save_if_due(self, path: str, interval: float = 0.0) -> bool:
+        """Save when places changed since the last save and `interval` seconds have passed."""
+        with self._lock:
+            if not self._unsaved or time.monotonic() - self._saved_at < interval:
+                return False
+            self.save(path)
+            return True
+
+    @classmethod
+    def load(cls, path: str) -> "RatingPriorStore":
+        with open(path, "r", encoding="utf-8") as f:
+            store = cls.from_dict(json.load(f))
+        store._file_state = _file_state(path)
+        return store
+
+    def reload(self, path: str) -> bool:
+        """Merge the file at `path` into this store if it changed since it was last saved or
+        loaded here; its places win, places only known in memory are kept."""
+        state = _file_state(path)
+        with self._lock:
+            if state is None or state == self._file_state:
+                return False
+            unsaved = self._unsaved
+            self.update(RatingPriorStore.load(path))
+            self._unsaved = unsaved
+            self._file_state = state
+        return True
+
+
+def _file_state(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+_store: Optional[RatingPriorStore] = None
+_store_lock = threading.Lock()
+_store_checked_at = 0.0
+
+
+def get_prior_store() -> RatingPriorStore:
+    """Process-wide store shared by ingestion and ranking.
+
+    Loaded from RAG_RATING_PRIORS_PATH when that file exists, and re-checked at most every
+    RAG_RATING_PRIORS_RELOAD_INTERVAL seconds (default 30) for priors merged into it by
+    another process. RAG_RATING_PRIOR_MIN_PLACES sets how many rated places a key needs
+    before its prior is used.
+    """
+    global _store, _store_checked_at
+    path = os.getenv("RAG_RATING_PRIORS_PATH")
+    with _store_lock:
+        if _store is None:
+            min_places = int(os.getenv("RAG_RATING_PRIOR_MIN_PLACES", "20"))
+            store = RatingPriorStore(min_places)
+            if path and os.path.exists(path):
+                try:
+                    store = RatingPriorStore.load(path)
+                    store.min_places = min_places
+                except Exception as e:
+                    logger.warning(f"Ignoring unreadable rating priors {path}: {e}")
+            _store = store
+            _store_checked_at = time.monotonic()
+        elif path:
+            now = time.monotonic()
+            if now - _store_checked_at >= float(os.getenv("RAG_RATING_PRIORS_RELOAD_INTERVAL", "30")):
+                _store_checked_at = now
+                try:
+                    if _store.reload(path):
+                        logger.info(f"Reloaded rating priors from {path}")
+                except Exception as e:
+                    logger.warning(f"Ignoring unreadable rating priors {path}: {e}")
+        return _store
+
+
+__all__ = [
+    "GENERIC_PLACE_TYPES",
+    "DEFAULT_PRIOR_MEAN",
+    "DEFAULT_PRIOR_COUNT",
+    "RatingPriorStore",
+    "get_prior_store",
+    "place_category",
+    "place_region",
+]
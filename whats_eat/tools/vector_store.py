@@ -0,0 +1,87 @@
+"""
+Compact in-process storage for embedding vectors.
+
+OpenAI returns embeddings as Python lists of floats (~50KB of boxed floats for a
+1536-d vector). `encode_vector` / `decode_vector` pack single vectors as float32,
+float16 or scalar-quantized int8 (one float32 scale per vector) for the query and
+place-vector caches.
+"""
+from __future__ import annotations
+
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+VECTOR_FORMATS = ("float32", "float16", "int8")
+
+
+class EncodedVector:
+    """One packed vector; `scale` is only used by int8 codes."""
+
+    __slots__ = ("codes", "scale")
+
+    def __init__(self, codes: np.ndarray, scale: float = 1.0) -> None:
+        self.codes = codes
+        self.scale = scale
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes) + (4 if self.codes.dtype == np.int8 else 0)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+def _quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization: row ~= codes * scale."""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def encode_vector(vector: Sequence[float], fmt: str = "float16") -> EncodedVector:
+    if fmt not in VECTOR_FORMATS:
+        raise ValueError(f"Unknown vector format: {fmt}")
+    arr = np.asarray(vector, dtype=np.float32)
+    if fmt == "int8":
+        codes, scales = _quantize_int8(arr[None, :])
+        return EncodedVector(codes[0], float(scales[0]))
+    return EncodedVector(arr.astype(fmt))
+
+
+def decode_vector(encoded: EncodedVector) -> List[float]:
+    """Back to the plain list-of-floats shape used by the OpenAI and Pinecone clients."""
+    if encoded.codes.dtype == np.int8:
+        return (encoded.codes.astype(np.float32) * encoded.scale).tolist()
+    return encoded.codes.astype(np.float32).tolist()
+
+
+def truncate_embedding(vector: Sequence[float], dim: int) -> List[float]:
+    """First `dim` components, renormalized to unit length.
+
+    text-embedding-3 models are trained so that this prefix is itself a usable embedding
+    (the same vector the API returns when asked for `dimensions=dim`).
+    """
+    head = np.asarray(vector[:dim], dtype=np.float32)
+    norm = float(np.linalg.norm(head))
+    return (head / norm if norm else head).tolist()
+
+
+def recall_at_k(expected: Sequence[str], found: Sequence[str], k: int) -> float:
+    """Share of the baseline's top-k ids that also appear in `found`'s top k."""
+    truth = set(expected[:k])
+    if not truth:
+        return 1.0
+    return len(truth & set(found[:k])) / len(truth)
+
+
+__all__ = [
+    "VECTOR_FORMATS",
+    "EncodedVector",
+    "encode_vector",
+    "decode_vector",
+    "truncate_embedding",
+    "recall_at_k",
+]
+
@@ -0,0 +1,286 @@
+"""
+Offline tuning of the rank_restaurants_by_profile weights against logged sessions.
+
+A session log is JSON Lines, one ranking request per line:
+
+    {"user_profile": {...}, "candidates": [...], "chosen": ["place_id"], "clicked": ["place_id", ...]}
+
+optionally with "user_location" and "travel_mode" as passed to the tool (a .json file
+holding an array, or {"sessions": [...]}, works too). Chosen places
+count as relevance 2, clicked ones as 1. Each session is scored once into its four
+factor columns (similarity, rating, attributes, distance); a weight vector's final
+scores are then a dot product, so many weight vectors are evaluated in one batched
+tensor product over every session. `grid_search` scans the weight simplex,
+`coordinate_search` refines from a start point, and `save_weight_set` writes the winner
+to RANKING_WEIGHTS_DIR where the tool loads it by name (`weight_set="<name>"`).
+
+    python -m whats_eat.tools.weight_tuning sessions.jsonl --name tuned --metric ndcg --k 5
+"""
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from whats_eat.tools.json_stream import iter_json_items
+from whats_eat.tools.ranking import DEFAULT_WEIGHTS, profile_components, weight_set_path
+
+FACTORS = ("similarity", "rating", "attributes", "distance")
+METRICS = ("ndcg", "recall")
+
+CHOSEN_RELEVANCE = 2.0
+CLICKED_RELEVANCE = 1.0
+
+# Weight vectors evaluated per tensor product; bounds memory at sessions x candidates x block
+WEIGHT_BLOCK = 64
+
+
+def iter_sessions(path: str) -> Iterator[Dict[str, Any]]:
+    """Sessions from a .jsonl file (one per line) or a JSON array / {"sessions": [...]} file."""
+    if not path.endswith(".jsonl"):
+        yield from iter_json_items(path, key="sessions")
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class SessionBatch:
+    """Factor scores and relevance labels of many sessions, padded to one array."""
+
+    def __init__(self, components: np.ndarray, mask: np.ndarray, relevance: np.ndarray) -> None:
+        # components: (sessions, candidates, factors); mask: real candidates; relevance: labels
+        self.components = components
+        self.mask = mask
+        self.relevance = relevance
+
+    def __len__(self) -> int:
+        return len(self.components)
+
+    @classmethod
+    def from_sessions(cls, sessions: Iterable[Dict[str, Any]]) -> "SessionBatch":
+        rows: List[np.ndarray] = []
+        labels: List[np.ndarray] = []
+        for session in sessions:
+            candidates = session.get("candidates") or []
+            if not candidates:
+                continue
+            chosen = set(session.get("chosen") or [])
+            clicked = set(session.get("clicked") or [])
+            relevance = np.array([
+                CHOSEN_RELEVANCE if c.get("place_id") in chosen
+                else CLICKED_RELEVANCE if c.get("place_id") in clicked else 0.0
+                for c in candidates
+            ])
+            if not relevance.any():
+                continue  # nothing to learn from a session without a choice
+            components = profile_components(
+                candidates,
+                session.get("user_profile") or {},
+                DEFAULT_WEIGHTS,
+                user_location=session.get("user_location"),
+                travel_mode=session.get("travel_mode"),
+            )
+            rows.append(np.stack([components[f] for f in FACTORS], axis=1))
+            labels.append(relevance)
+
+        width = max((len(r) for r in rows), default=0)
+        components = np.zeros((len(rows), width, len(FACTORS)), dtype=np.float32)
+        mask = np.zeros((len(rows), width), dtype=bool)
+        relevance = np.zeros((len(rows), width), dtype=np.float32)
+        for i, (row, label) in enumerate(zip(rows, labels)):
+            components[i, :len(row)] = row
+            mask[i, :len(row)] = True
+            relevance[i, :len(row)] = label
+        return cls(components, mask, relevance)
+
+    @classmethod
+    def load(cls, path: str) -> "SessionBatch":
+        return cls.from_sessions(iter_sessions(path))
+
+
+def _weight_matrix(weights: Sequence[Dict[str, float]]) -> np.ndarray:
+    return np.array([[w.get(f, 0.0) for f in FACTORS] for w in weights], dtype=np.float32)
+
+
+def evaluate(batch: SessionBatch, weight_matrix: np.ndarray, k: int = 5) -> Dict[str, np.ndarray]:
+    """Mean NDCG@k and recall@k over the sessions for each row of `weight_matrix`."""
+    n_weights = len(weight_matrix)
+    if not len(batch):
+        return {m: np.zeros(n_weights) for m in METRICS}
+    k = min(k, batch.components.shape[1])
+    gains = 2.0 ** batch.relevance - 1.0
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    ideal = np.sort(gains, axis=1)[:, ::-1][:, :k] @ discounts
+    relevant = (batch.relevance > 0).sum(axis=1)
+
+    ndcg = np.empty(n_weights)
+    recall = np.empty(n_weights)
+    sessions = np.arange(len(batch))[None, :, None]
+    # Like the tool, rank on scores rounded to 4 places with ties going to the earlier
+    # candidate; the position penalty is far below the rounding step
+    tie_break = np.arange(batch.components.shape[1]) * 1e-9
+    for start in range(0, n_weights, WEIGHT_BLOCK):
+        block = weight_matrix[start:start + WEIGHT_BLOCK]
+        # (weights, sessions, candidates) final scores in one tensor product
+        scores = np.einsum("snf,wf->wsn", batch.components, block, dtype=np.float64)
+        scores = np.where(batch.mask[None], np.round(scores, 4) - tie_break, -np.inf)
+        top = np.argpartition(-scores, k - 1, axis=2)[:, :, :k]
+        top_scores = np.take_along_axis(scores, top, axis=2)
+        top = np.take_along_axis(top, np.argsort(-top_scores, axis=2, kind="stable"), axis=2)
+        top_gains = gains[sessions, top]
+        ndcg[start:start + len(block)] = ((top_gains @ discounts) / ideal).mean(axis=1)
+        hits = (batch.relevance[sessions, top] > 0).sum(axis=2)
+        recall[start:start + len(block)] = (hits / relevant).mean(axis=1)
+    return {"ndcg": ndcg, "recall": recall}
+
+
+def simplex_grid(step: float = 0.05) -> np.ndarray:
+    """Every weight vector on the simplex (non-negative, summing to 1) with the given step."""
+    units = int(round(1 / step))
+    points = [
+        (a, b, c, units - a - b - c)
+        for a, b, c in itertools.product(range(units + 1), repeat=3)
+        if a + b + c <= units
+    ]
+    return np.array(points, dtype=np.float32) / units
+
+
+def grid_search(
+    batch: SessionBatch, metric: str = "ndcg", k: int = 5, step: float = 0.05
+) -> Dict[str, Any]:
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric: {metric} (expected one of {METRICS})")
+    grid = simplex_grid(step)
+    scores = evaluate(batch, grid, k)[metric]
+    best = int(np.argmax(scores))
+    return {"weights": _as_weights(grid[best]), "score": float(scores[best]), "evaluated": len(grid)}
+
+
+def coordinate_search(
+    batch: SessionBatch,
+    metric: str = "ndcg",
+    k: int = 5,
+    start: Optional[Dict[str, float]] = None,
+    step: float = 0.1,
+    min_step: float = 0.0125,
+) -> Dict[str, Any]:
+    """Move weight between factors while the metric improves, halving the step when stuck.
+
+    All moves of one round (each ordered factor pair) are evaluated in a single batch.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric: {metric} (expected one of {METRICS})")
+    current = _weight_matrix([start or DEFAULT_WEIGHTS])[0]
+    current = current / current.sum()
+    best = float(evaluate(batch, current[None], k)[metric][0])
+    evaluated = 1
+    pairs = [(i, j) for i in range(len(FACTORS)) for j in range(len(FACTORS)) if i != j]
+    while step >= min_step:
+        moves = []
+        for i, j in pairs:
+            delta = min(step, float(current[j]))
+            if delta <= 0:
+                continue
+            move = current.copy()
+            move[i] += delta
+            move[j] -= delta
+            moves.append(move)
+        if not moves:
+            break
+        moves_matrix = np.array(moves)
+        scores = evaluate(batch, moves_matrix, k)[metric]
+        evaluated += len(moves)
+        winner = int(np.argmax(scores))
+        if scores[winner] > best + 1e-9:
+            best = float(scores[winner])
+            current = moves_matrix[winner]
+        else:
+            step /= 2
+    return {"weights": _as_weights(current), "score": best, "evaluated": evaluated}
+
+
+def _as_weights(row: np.ndarray) -> Dict[str, float]:
+    return {f: round(float(v), 4) for f, v in zip(FACTORS, row)}
+
+
+def save_weight_set(name: str, weights: Dict[str, float], **info: Any) -> str:
+    """Write a weight file the ranking tool can load with weight_set=<name>."""
+    path = weight_set_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = {"name": name, "weights": weights, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), **info}
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def tune(
+    batch: SessionBatch,
+    metric: str = "ndcg",
+    k: int = 5,
+    search: str = "grid",
+    step: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Tune the weights on `batch` and report both metrics for the baseline and the result."""
+    started = time.perf_counter()
+    if search == "grid":
+        result = grid_search(batch, metric, k, step or 0.05)
+    elif search == "coordinate":
+        result = coordinate_search(batch, metric, k, step=step or 0.1)
+    else:
+        raise ValueError(f"Unknown search: {search} (expected 'grid' or 'coordinate')")
+    both = evaluate(batch, _weight_matrix([DEFAULT_WEIGHTS, result["weights"]]), k)
+    return {
+        **result,
+        "metric": metric,
+        "k": k,
+        "search": search,
+        "sessions": len(batch),
+        "baseline": {m: float(both[m][0]) for m in METRICS},
+        "tuned": {m: float(both[m][1]) for m in METRICS},
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+__all__ = [
+    "FACTORS",
+    "METRICS",
+    "SessionBatch",
+    "iter_sessions",
+    "evaluate",
+    "simplex_grid",
+    "grid_search",
+    "coordinate_search",
+    "save_weight_set",
+    "tune",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tune ranking weights on logged sessions")
+    parser.add_argument("sessions", help="Logged ranking sessions (.jsonl, or a .json array)")
+    parser.add_argument("--name", default=None, help="Save the tuned weights as this weight set")
+    parser.add_argument("--metric", choices=METRICS, default="ndcg", help="Metric to maximize")
+    parser.add_argument("--k", type=int, default=5, help="Cut-off for NDCG@k / recall@k")
+    parser.add_argument("--search", choices=("grid", "coordinate"), default="grid", help="Search strategy")
+    parser.add_argument("--step", type=float, default=None, help="Grid step / initial coordinate step")
+    args = parser.parse_args()
+
+    report = tune(SessionBatch.load(args.sessions), args.metric, args.k, args.search, args.step)
+    print(f"{report['sessions']} session(s), {report['evaluated']} weight vector(s) in {report['seconds']}s")
+    for label in ("baseline", "tuned"):
+        scores = ", ".join(f"{m}@{args.k}={v:.4f}" for m, v in report[label].items())
+        print(f"  {label:<9}{scores}")
+    print(f"  weights  {report['weights']}")
+    if args.name:
+        info = {key: report[key] for key in ("metric", "k", "search", "sessions", "baseline", "tuned")}
+        print(f"  saved    {save_weight_set(args.name, report['weights'], **info)}")